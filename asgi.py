@@ -0,0 +1,154 @@
+"""
+ASGI entry point: the analysis endpoints as native async handlers.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+Under WSGI (flask run, gunicorn sync workers) every in-flight rating holds a worker
+thread for the 10-60 s it mostly spends waiting on OpenAI, so concurrency is capped by
+the thread count. Here /api/rate-image and /api/compare-beauty are awaited on the
+server's event loop instead, and one worker holds as many in-flight ratings as
+ASGI_MAX_IN_FLIGHT allows; beyond that it answers 503 with Retry-After.
+
+They run the same handlers as the Flask views (main.rate_image_async and
+main.compare_beauty_async) inside a Flask request context built from the ASGI
+request, so JWT auth, the SQLAlchemy session, the before/after request hooks and CORS
+headers behave as under WSGI. Every other route is passed to the Flask WSGI app in a
+worker thread.
+
+Request and response bodies are buffered; none of the routes stream.
+"""
+import asyncio
+import io
+import sys
+
+from flask_jwt_extended import verify_jwt_in_request
+
+from core.config import Config
+from core.extensions import async_runtime
+from main import app as flask_app, rate_image_async, compare_beauty_async
+
+# (method, path) -> coroutine function run in the request's Flask context
+ASYNC_ROUTES = {
+    ('POST', '/api/rate-image'): rate_image_async,
+    ('POST', '/api/compare-beauty'): compare_beauty_async,
+}
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """The WSGI environ for an ASGI http scope and its request body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def send_response(send, status: int, headers, body: bytes):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def dispatch_async(handler, environ):
+    """Run an async view the way Flask's full_dispatch_request runs a sync one."""
+    with flask_app.request_context(environ):
+        try:
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                verify_jwt_in_request(optional=True)
+                rv = await async_runtime.serve(handler())
+        except Exception as e:
+            # Registered handlers (JWT errors, HTTPExceptions) first, then a plain 500
+            try:
+                rv = flask_app.handle_user_exception(e)
+            except Exception as unhandled:
+                rv = flask_app.handle_exception(unhandled)
+        response = flask_app.process_response(flask_app.make_response(rv))
+        return response.status_code, response.headers.items(), response.get_data()
+
+
+def dispatch_wsgi(environ):
+    """Run the Flask WSGI app to completion (called in a worker thread)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers'], body
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Importing main already warmed the analysis stack (or deferred it)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Connections opened on the server's loop are closed before it stops
+            await async_runtime.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if handler is not None and async_runtime.serving >= Config.ASGI_MAX_IN_FLIGHT:
+        return await send_response(send, 503, [('Content-Type', 'application/json'), ('Retry-After', '5')],
+                                   b'{"error": "Server busy, please retry"}')
+
+    environ = wsgi_environ(scope, await read_body(receive))
+    if handler is not None:
+        status, headers, body = await dispatch_async(handler, environ)
+    else:
+        status, headers, body = await asyncio.to_thread(dispatch_wsgi, environ)
+    await send_response(send, status, headers, body)
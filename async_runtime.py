@@ -0,0 +1,315 @@
+"""
+Worker-level async runtime for the rating endpoints.
+
+The rating views are synchronous Flask views that fan out model calls with asyncio.
+Running each request under asyncio.run with its own AsyncOpenAI client pays, on every
+request, for a new event loop, a new connection pool and a fresh TLS handshake to the
+API (and to the image hosts, whose async httpx client is per loop too).
+
+AsyncRuntime keeps one event loop running in a daemon thread and one pooled
+AsyncOpenAI client on it. Views submit coroutines with run(), which blocks the
+calling thread until the result is ready. The caller's contextvars (and with them
+the Flask app and request context) are carried into the coroutine, so database
+queries and jsonify work as they did under asyncio.run.
+
+Every request's coroutines share the loop, so anything CPU-bound or blocking inside
+them has to go through asyncio.to_thread (the loop's executor has `threads` workers)
+or the hash pool.
+
+Each attempt of an OpenAI call is cut after OPENAI_REQUEST_TIMEOUT seconds (the SDK's
+default is ten minutes); the scheduler retries the timeout, so a stalled completion
+costs at most OPENAI_MAX_RETRIES + 1 of those.
+
+With ASYNC_RUNTIME_ENABLED=false run() falls back to asyncio.run with a client per
+call, closed when the call finishes.
+
+Threads do not survive fork, so the loop is started lazily in the process that uses
+it and restarted if the process has forked since.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import os
+import threading
+import weakref
+
+
+class AsyncRuntime:
+    """One long-lived event loop thread and AsyncOpenAI client per worker process."""
+
+    def __init__(self, enabled: bool = True, max_connections: int = 100, keepalive_expiry: float = 60.0,
+                 threads: int = 16, shutdown_timeout: float = 10.0, request_timeout: float = 60.0,
+                 connect_timeout: float = 5.0):
+        self.enabled = enabled
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.threads = threads
+        self.shutdown_timeout = shutdown_timeout
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.api_key = None
+        self.http_client = None  # PooledHttpClient whose per-loop async clients close with the loop
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._tasks = set()
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.serving = 0  # ASGI request handlers in flight
+        self._reset_stats()
+
+    def init_app(self, app, http_client=None):
+        """Configure from app config and drain the loop at worker shutdown."""
+        self.enabled = app.config.get("ASYNC_RUNTIME_ENABLED", self.enabled)
+        self.max_connections = app.config.get("OPENAI_MAX_CONNECTIONS", self.max_connections)
+        self.keepalive_expiry = app.config.get("OPENAI_KEEPALIVE_SECONDS", self.keepalive_expiry)
+        self.threads = app.config.get("ASYNC_RUNTIME_THREADS", self.threads)
+        self.shutdown_timeout = app.config.get("ASYNC_RUNTIME_SHUTDOWN_SECONDS", self.shutdown_timeout)
+        self.request_timeout = app.config.get("OPENAI_REQUEST_TIMEOUT", self.request_timeout)
+        self.connect_timeout = app.config.get("OPENAI_CONNECT_TIMEOUT", self.connect_timeout)
+        self.api_key = app.config.get("OPENAI_API_KEY")
+        self.http_client = http_client
+        atexit.register(self.shutdown)
+
+    def start(self):
+        """Start the loop thread if this process does not have one running yet."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Async runtime is shut down")
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # After a fork the loop object was copied but its thread was not
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix='async-runtime'))
+            ready = threading.Event()
+            thread = threading.Thread(target=self._run_loop, args=(loop, ready), name='async-runtime', daemon=True)
+            thread.start()
+            ready.wait()
+            self._loop, self._thread, self._pid = loop, thread, os.getpid()
+            self._tasks = set()
+        with self._stats_lock:
+            self._loops_started += 1
+        print(f"Async runtime started (pid {os.getpid()})")
+
+    @staticmethod
+    def _run_loop(loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    def openai_client(self):
+        """The AsyncOpenAI client for the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self._create_client()
+        return client
+
+    def _create_client(self):
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        async def trace_request(request):
+            # httpx only traces requests that ask for it, and the SDK builds the requests
+            request.extensions['trace'] = self._atrace
+
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections,
+                                keepalive_expiry=self.keepalive_expiry),
+            event_hooks={'request': [trace_request]},
+        )
+        with self._stats_lock:
+            self._clients_created += 1
+        # Retries are the OpenAI scheduler's, which paces them against the rate limits. The
+        # timeout is per attempt; the SDK sends it with every request, overriding the pool's
+        timeout = httpx.Timeout(self.request_timeout, connect=self.connect_timeout)
+        return AsyncOpenAI(api_key=self.api_key, http_client=http_client, max_retries=0, timeout=timeout)
+
+    def run(self, coro, timeout: float = None):
+        """
+        Run a coroutine on the runtime's loop and wait for its result.
+
+        Args:
+            coro: Coroutine to run; it sees the caller's contextvars (Flask app context)
+            timeout: Seconds to wait before cancelling it, or None to wait indefinitely
+
+        Returns:
+            The coroutine's result; its exception is raised in the caller
+        """
+        if not self.enabled:
+            with self._stats_lock:
+                self._submitted += 1
+                self._loops_started += 1
+            failed = True
+            try:
+                result = asyncio.run(self._run_and_close(coro))
+                failed = False
+                return result
+            finally:
+                with self._stats_lock:
+                    self._completed += 1
+                    self._failed += failed
+
+        try:
+            self.start()
+        except RuntimeError:
+            coro.close()
+            raise
+        loop = self._loop
+        context = contextvars.copy_context()
+        result = concurrent.futures.Future()
+        started = []
+
+        def submit():
+            # Tasks copy the current context, which call_soon_threadsafe set to the caller's
+            task = loop.create_task(self._track(coro))
+            task.add_done_callback(self._record_done)
+            task.add_done_callback(lambda done: self._resolve(done, result))
+            started.append(task)
+
+        with self._stats_lock:
+            self._submitted += 1
+        try:
+            loop.call_soon_threadsafe(submit, context=context)
+        except RuntimeError:
+            # Loop closed by shutdown
+            coro.close()
+            raise RuntimeError("Async runtime is shut down") from None
+        try:
+            return result.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            loop.call_soon_threadsafe(lambda: [task.cancel() for task in started])
+            raise
+
+    async def _track(self, coro):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await coro
+        finally:
+            self._tasks.discard(task)
+
+    async def _run_and_close(self, coro):
+        try:
+            return await coro
+        finally:
+            # Per-call loop: close its clients before asyncio.run closes it
+            await self.aclose()
+
+    async def serve(self, coro):
+        """Await a request handler on the running loop (asgi.py), counting it as in flight."""
+        with self._stats_lock:
+            self.serving += 1
+            self._peak_serving = max(self._peak_serving, self.serving)
+        try:
+            return await coro
+        finally:
+            with self._stats_lock:
+                self.serving -= 1
+
+    async def aclose(self):
+        """Close the running loop's OpenAI client and async image client."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+        if self.http_client is not None:
+            await self.http_client.aclose()
+
+    @staticmethod
+    def _resolve(task, result):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def _record_done(self, task):
+        with self._stats_lock:
+            self._completed += 1
+            if task.cancelled() or task.exception() is not None:
+                self._failed += 1
+
+    def _trace(self, event, info):
+        if event == 'connection.connect_tcp.complete':
+            with self._stats_lock:
+                self._connections_opened += 1
+        elif event.endswith('.send_request_headers.started'):
+            with self._stats_lock:
+                self._requests += 1
+
+    async def _atrace(self, event, info):
+        self._trace(event, info)
+
+    def shutdown(self, timeout: float = None):
+        """Wait up to timeout for in-flight coroutines, cancel the rest, close the clients and stop the loop."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked child that never started its own loop: nothing of ours to stop
+                return
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+            self._closed = True
+            if loop is None:
+                return
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(timeout), loop).result(timeout + 5)
+        except Exception as e:
+            print(f"Async runtime shutdown did not finish cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        if not thread.is_alive():
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+        print("Async runtime stopped")
+
+    async def _drain(self, timeout):
+        pending = set(self._tasks)
+        if pending:
+            print(f"Async runtime waiting for {len(pending)} in-flight requests")
+            done, pending = await asyncio.wait(pending, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self.aclose()
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._submitted = 0
+            self._completed = 0
+            self._failed = 0
+            self._loops_started = 0
+            self._clients_created = 0
+            self._requests = 0
+            self._connections_opened = 0
+            self._peak_serving = self.serving
+
+    def reset_stats(self):
+        self._reset_stats()
+
+    def stats(self) -> dict:
+        """Runtime and OpenAI connection-reuse counters since start (or the last reset_stats)."""
+        with self._stats_lock:
+            requests_sent, opened = self._requests, self._connections_opened
+            return {
+                'enabled': self.enabled,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'submitted': self._submitted,
+                'in_flight': self._submitted - self._completed,
+                'failed': self._failed,
+                'serving': self.serving,
+                'peak_serving': self._peak_serving,
+                'loops_started': self._loops_started,
+                'openai_clients_created': self._clients_created,
+                'openai_requests': requests_sent,
+                'openai_connections_opened': opened,
+                'openai_connections_reused': max(0, requests_sent - opened),
+                'openai_reuse_rate': (requests_sent - opened) / requests_sent if requests_sent else 0.0,
+            }
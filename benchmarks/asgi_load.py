@@ -0,0 +1,263 @@
+"""
+In-flight ratings per worker: WSGI threads against the ASGI entry point.
+
+Usage:
+    python -m benchmarks.asgi_load [--requests 200] [--threads 8] [--api-latency-ms 2000]
+
+Runs the real /api/rate-image pipeline (download, quality gate, hashing, validation,
+category calls, result storage) in this process. A local server plays the OpenAI API,
+answering each completion after --api-latency-ms (real ratings wait 10-60 s), and
+another serves a distinct photo-like image per request so nothing is a cache hit;
+both run in a child process so they are not counted.
+    wsgi    --threads request threads, as gunicorn gthread or flask run would use
+    asgi    every request awaited at once on one event loop through asgi.app
+
+Reported per mode: wall time and throughput, request latency, the peak number of
+ratings in flight at once, the peak thread count, and resident memory added per
+in-flight rating (peak RSS over the idle baseline, divided by peak in flight).
+Download, quality gate and hashing are CPU work, so with short --api-latency-ms the
+CPU count, not the serving model, bounds throughput.
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # A burst of connections must not hit the default backlog of 5
+
+
+def completion(content):
+    return json.dumps({
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-5.1",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": json.dumps(content)}}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200},
+    }).encode()
+
+
+VALIDATION = completion({"contains_camel": True, "overall_suitability": True, "feedback": "ok",
+                         "visible_parts": {"head": True, "neck": True, "body": True, "legs": True},
+                         "missing_parts": [], "quality_issues": []})
+CATEGORY = completion({"error": False, "age_class": "ADULT", "summary": "ok",
+                       "attributes": [{"name": "HEAD SIZE", "score": 7, "reason": "ok"}]})
+
+
+def api_handler(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            time.sleep(latency)
+            response = VALIDATION if b'camel detection expert' in body else CATEGORY
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+    return Handler
+
+
+def variant_image(photo, n):
+    """A different crop and tone of the photo per n: distinct bytes and perceptual hashes."""
+    from PIL import ImageEnhance
+
+    width, height = photo.size
+    left, top = (n * 37) % (width // 3), (n * 53) % (height // 3)
+    image = photo.crop((left, top, left + width * 2 // 3, top + height * 2 // 3))
+    image = ImageEnhance.Color(image).enhance(0.5 + (n % 10) / 10)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def image_handler(bodies):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = bodies[int(self.path.rsplit('/', 1)[-1])]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def serve(api_latency, bodies, ports):
+    api = Server(('127.0.0.1', 0), api_handler(api_latency))
+    images = Server(('127.0.0.1', 0), image_handler(bodies))
+    threading.Thread(target=images.serve_forever, daemon=True).start()
+    ports.put((api.server_address[1], images.server_address[1]))
+    api.serve_forever()
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Sampler:
+    """Peak RSS, thread count and in-flight ratings while a mode runs."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_rss = self.baseline_rss = rss_bytes()
+        self.peak_threads = threading.active_count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(0.02):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_wsgi(main, urls, threads, sampler):
+    def rate(url):
+        sampler.enter()
+        start = time.perf_counter()
+        try:
+            status = main.app.test_client().post('/api/rate-image', json={'image_url': url}).status_code
+        finally:
+            sampler.exit()
+        return status, (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(rate, urls))
+
+
+def run_asgi(asgi, urls, sampler):
+    async def rate(url):
+        body = json.dumps({'image_url': url}).encode()
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/rate-image', 'query_string': b'',
+                 'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]}
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        sampler.enter()
+        start = time.perf_counter()
+        try:
+            await asgi.app(scope, receive, send)
+        finally:
+            sampler.exit()
+        return sent[0]['status'], (time.perf_counter() - start) * 1000
+
+    async def burst():
+        results = await asyncio.gather(*(rate(url) for url in urls))
+        await asgi.async_runtime.aclose()
+        return results
+
+    return asyncio.run(burst())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='ratings per mode')
+    parser.add_argument('--threads', type=int, default=8, help='WSGI request threads')
+    parser.add_argument('--api-latency-ms', type=float, default=2000.0)
+    parser.add_argument('--image', default='img/camel1.jpg')
+    args = parser.parse_args()
+
+    from PIL import Image
+
+    photo = Image.open(args.image).convert('RGB')
+    photo.thumbnail((1600, 1600))
+    with ThreadPoolExecutor() as executor:
+        bodies = list(executor.map(lambda n: variant_image(photo, n), range(2 * args.requests)))
+
+    # The stand-in servers run in their own process so their threads and memory are not counted
+    ports = multiprocessing.Queue()
+    servers = multiprocessing.Process(target=serve, args=(args.api_latency_ms / 1000, bodies, ports), daemon=True)
+    servers.start()
+    api_port, image_port = ports.get()
+    del bodies
+
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    os.environ.update({
+        'OPENAI_API_KEY': os.environ.get('OPENAI_API_KEY', 'benchmark'),
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{api_port}/v1",
+        'OPENAI_MAX_CONNECTIONS': str(args.requests * 5),  # the fake API has no rate limit
+        'DATABASE_URL': f"sqlite:///{database.name}",
+        'IMAGE_CACHE_DIR': '',
+        'STARTUP_MODE': 'deferred',
+    })
+    import asgi
+    import main as app_module
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    app_module.startup.ensure_ready()
+
+    print(f"{args.requests} ratings per mode, {args.api_latency_ms:.0f} ms per simulated model call")
+    print(f"{'mode':>5} | {'wall':>7} | {'rate/s':>6} | {'p50':>8} | {'p95':>8} | {'in flight':>9} | "
+          f"{'threads':>7} | {'MB/rating':>9} | statuses")
+    image_base = f"http://127.0.0.1:{image_port}"
+    for offset, mode in enumerate(('wsgi', 'asgi')):
+        urls = [f"{image_base}/{n}" for n in range(offset * args.requests, (offset + 1) * args.requests)]
+        sampler = Sampler()
+        start = time.perf_counter()
+        if mode == 'wsgi':
+            results = run_wsgi(app_module, urls, args.threads, sampler)
+        else:
+            results = run_asgi(asgi, urls, sampler)
+        wall = time.perf_counter() - start
+        sampler.stop()
+
+        latencies = sorted(ms for _, ms in results)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        statuses = {}
+        for status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        per_rating = (sampler.peak_rss - sampler.baseline_rss) / max(1, sampler.peak_in_flight) / 2 ** 20
+        print(f"{mode:>5} | {wall:>5.1f} s | {len(results) / wall:>6.1f} | {statistics.median(latencies):>5.0f} ms | "
+              f"{p95:>5.0f} ms | {sampler.peak_in_flight:>9} | {sampler.peak_threads:>7} | {per_rating:>9.2f} | "
+              f"{statuses}")
+
+    servers.terminate()
+    os.unlink(database.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Per-request asyncio.run against the worker's long-lived async runtime.
+
+Usage:
+    python -m benchmarks.async_runtime [--requests 50] [--calls 5] [--latency-ms 20] [--threads 4]
+
+A local HTTP server plays the OpenAI API, answering every chat completion after
+--latency-ms. Each simulated rating makes --calls concurrent completions (validation
+plus the categories), and --threads Flask threads issue ratings at once:
+    per-request   asyncio.run and a new AsyncOpenAI client per rating (ASYNC_RUNTIME_ENABLED=false)
+    runtime       one event loop thread and pooled client for the worker
+
+Reported: rating latency, event loops and clients created, and OpenAI connections
+opened. The local server is plain HTTP, so a new connection costs a TCP handshake
+only; against api.openai.com each one also pays a TLS handshake (tens of ms).
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from async_runtime import AsyncRuntime
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode()
+
+
+def make_handler(latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(COMPLETION)))
+            self.end_headers()
+            self.wfile.write(COMPLETION)
+
+    return Handler
+
+
+def run_variant(runtime, ratings, calls, threads):
+    async def rating():
+        client = runtime.openai_client()
+        await asyncio.gather(*(client.chat.completions.create(
+            model="gpt-4o", messages=[{"role": "user", "content": "hi"}]) for _ in range(calls)))
+
+    def timed_rating(_):
+        start = time.perf_counter()
+        runtime.run(rating())
+        return (time.perf_counter() - start) * 1000
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        timings = sorted(executor.map(timed_rating, range(ratings)))
+    runtime.shutdown()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='simulated ratings per variant')
+    parser.add_argument('--calls', type=int, default=5, help='concurrent completions per rating')
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--threads', type=int, default=4, help='ratings in flight at once')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.latency_ms / 1000))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    print(f"{args.requests} ratings x {args.calls} calls, {args.threads} at once, "
+          f"{args.latency_ms:.0f} ms simulated API latency")
+    print(f"{'variant':>12} | {'p50':>8} | {'p95':>8} | {'loops':>5} | {'clients':>7} | connections opened")
+    for variant, enabled in (('per-request', False), ('runtime', True)):
+        runtime = AsyncRuntime(enabled=enabled)
+        runtime.api_key = 'benchmark'
+        timings = run_variant(runtime, args.requests, args.calls, args.threads)
+        stats = runtime.stats()
+        p95 = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+        print(f"{variant:>12} | {statistics.median(timings):>5.1f} ms | {p95:>5.1f} ms | {stats['loops_started']:>5} | "
+              f"{stats['openai_clients_created']:>7} | {stats['openai_connections_opened']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
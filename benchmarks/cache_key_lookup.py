@@ -0,0 +1,125 @@
+"""
+Compare cache lookups on the legacy string key and the binary hash_key at scale.
+
+Usage:
+    python -m benchmarks.cache_key_lookup [--rows 1000000] [--lookups 20000]
+
+Builds two SQLite tables with the same synthetic full-profile hashes: one with the
+old unique index on the ~500 character image_hash string, one with the unique index
+on its 32-byte SHA-256. Reports index size and per-lookup latency for hits and misses.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from hash_index import cache_key
+
+# Component lengths of a full-profile hash of img/camel1.jpg (phash, whash, colorhash,
+# crop-resistant, edge and histogram hashes)
+COMPONENT_HEX_LENGTHS = (64, 64, 28, 33, 36, 32)
+
+
+def synthetic_hash(rng):
+    return '_'.join('%0*x' % (n, rng.getrandbits(n * 4)) for n in COMPONENT_HEX_LENGTHS)
+
+
+def build(path, rows, binary, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    if binary:
+        conn.execute('CREATE TABLE beauty_results (id INTEGER PRIMARY KEY, image_hash VARCHAR(500) NOT NULL, '
+                     'hash_key BLOB, phash VARCHAR(64), whash VARCHAR(64))')
+        conn.execute('CREATE UNIQUE INDEX ix_beauty_results_hash_key ON beauty_results (hash_key)')
+    else:
+        conn.execute('CREATE TABLE beauty_results (id INTEGER PRIMARY KEY, image_hash VARCHAR(500) NOT NULL)')
+        conn.execute('CREATE UNIQUE INDEX ix_beauty_results_image_hash ON beauty_results (image_hash)')
+
+    batch = []
+    for _ in range(rows):
+        image_hash = synthetic_hash(rng)
+        if binary:
+            batch.append((image_hash, cache_key(image_hash), image_hash[:64], image_hash[65:129]))
+        else:
+            batch.append((image_hash,))
+        if len(batch) == 10000:
+            _insert(conn, batch, binary)
+            batch = []
+    if batch:
+        _insert(conn, batch, binary)
+    conn.commit()
+    return conn
+
+
+def _insert(conn, batch, binary):
+    if binary:
+        conn.executemany('INSERT INTO beauty_results (image_hash, hash_key, phash, whash) VALUES (?, ?, ?, ?)', batch)
+    else:
+        conn.executemany('INSERT INTO beauty_results (image_hash) VALUES (?)', batch)
+
+
+def index_bytes(conn, name):
+    try:
+        return conn.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = ?', (name,)).fetchone()[0]
+    except sqlite3.OperationalError:
+        return None  # SQLite built without the dbstat virtual table
+
+
+def time_lookups(conn, binary, queries):
+    if binary:
+        sql = 'SELECT id FROM beauty_results WHERE hash_key = ?'
+    else:
+        sql = 'SELECT id FROM beauty_results WHERE image_hash = ?'
+
+    latencies_us = []
+    for image_hash in queries:
+        start = time.perf_counter()
+        # The binary path includes deriving the key, as the request path does
+        key = cache_key(image_hash) if binary else image_hash
+        conn.execute(sql, (key,)).fetchone()
+        latencies_us.append((time.perf_counter() - start) * 1e6)
+    latencies_us.sort()
+    return statistics.median(latencies_us), latencies_us[int(len(latencies_us) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    # Hits re-generate a sample of stored hashes; misses come from a different seed
+    rng = random.Random(args.seed)
+    stored = [synthetic_hash(rng) for _ in range(args.rows)]
+    hits = random.Random(1).sample(stored, min(args.lookups, args.rows))
+    del stored
+    miss_rng = random.Random(args.seed + 1)
+    misses = [synthetic_hash(miss_rng) for _ in range(args.lookups)]
+
+    print(f"{args.rows:,} rows, {args.lookups:,} hit and {args.lookups:,} miss lookups")
+    print(f"{'key':>11} | {'build':>7} | {'index size':>10} | {'hit p50':>8} | {'hit p99':>8} | {'miss p50':>8} | {'miss p99':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for binary, label, index_name in ((False, 'image_hash', 'ix_beauty_results_image_hash'),
+                                          (True, 'hash_key', 'ix_beauty_results_hash_key')):
+            start = time.perf_counter()
+            conn = build(os.path.join(tmp, f'{label}.db'), args.rows, binary, args.seed)
+            build_s = time.perf_counter() - start
+
+            size = index_bytes(conn, index_name)
+            size_text = f"{size / 2**20:>7.1f} MB" if size is not None else f"{'n/a':>10}"
+            hit_p50, hit_p99 = time_lookups(conn, binary, hits)
+            miss_p50, miss_p99 = time_lookups(conn, binary, misses)
+            conn.close()
+
+            print(f"{label:>11} | {build_s:>5.1f} s | {size_text} | {hit_p50:>5.1f} us | {hit_p99:>5.1f} us | "
+                  f"{miss_p50:>5.1f} us | {miss_p99:>5.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Compare scoring the beauty categories with one call each against one combined call.
+
+Usage:
+    python -m benchmarks.category_engine
+    python -m benchmarks.category_engine --image-url https://... [--rounds 5] [--concurrency 4]
+
+Engines (CATEGORY_ENGINE):
+    fanout     one json_object call per category, run concurrently (the original behaviour)
+    combined   one strict json_schema call rating every category
+
+Without --image-url only the request shape is reported: calls, bytes sent, system
+prompt size, image parts, and the target image tokens billed (OpenAI's tile formula at
+CATEGORY_IMAGE_DETAIL). Reference images are URLs of unknown size, so they are counted
+rather than estimated.
+
+With --image-url (and OPENAI_API_KEY set) each round runs --concurrency ratings at once
+with each engine, interleaved so both see the same network conditions and rate-limit
+state, and reports wall time per rating, the prompt and completion tokens the API
+billed, and the calls rejected with 429. Calls are made with retries disabled so that
+rate limiting shows up as a count instead of as latency. This sends real requests and
+is billed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from image_inline import estimate_image_tokens
+from prompt_loader import PromptLoader
+
+ENGINES = ('fanout', 'combined')
+
+
+def build_requests(prompt_loader, engine, image_url, detail, gender=None):
+    """The chat.completions.create kwargs one rating sends (model omitted)."""
+    categories = prompt_loader.get_available_categories()
+    if engine == 'combined':
+        return [{
+            "messages": [{"role": "system", "content": prompt_loader.get_combined_system_prompt(categories, gender)}]
+            + prompt_loader.build_combined_messages(categories, image_url, detail=detail),
+            "response_format": prompt_loader.get_combined_response_format(categories),
+        }]
+    return [{
+        "messages": [{"role": "system", "content": prompt_loader.get_system_prompt(category, gender)}]
+        + prompt_loader.build_messages(category, image_url, detail=detail),
+        "response_format": {"type": "json_object"},
+    } for category in categories]
+
+
+def image_parts(messages):
+    return sum(1 for message in messages if isinstance(message['content'], list)
+               for part in message['content'] if part.get('type') == 'image_url')
+
+
+def offline(image_path, detail):
+    prompt_loader = PromptLoader()
+    # No database here, so no golden examples; they add the same images to both engines
+    prompt_loader.golden_example_messages = lambda category: []
+    width, height = Image.open(image_path).size
+    target_tokens = estimate_image_tokens(width, height, detail)
+
+    print(f"{width}x{height} target image at detail={detail}: {target_tokens} image tokens per copy")
+    print(f"{'engine':>8} | {'calls':>5} | {'sent':>8} | {'system':>12} | {'image parts':>11} | target tokens")
+    for engine in ENGINES:
+        requests = build_requests(prompt_loader, engine, "https://example.com/camel.jpg", detail)
+        sent = sum(len(json.dumps(request)) for request in requests)
+        system = sum(len(request['messages'][0]['content']) for request in requests)
+        parts = sum(image_parts(request['messages']) for request in requests)
+        print(f"{engine:>8} | {len(requests):>5} | {sent / 1024:>5.0f} KB | {system:>6} chars | "
+              f"{parts:>11} | {target_tokens * len(requests)}")
+
+
+async def rate_once(client, prompt_loader, engine, image_url, detail):
+    """One rating's category calls; returns (wall ms, prompt tokens, completion tokens, 429s)."""
+    import openai
+
+    async def call(request):
+        try:
+            response = await client.chat.completions.create(model="gpt-5.1", **request)
+        except openai.RateLimitError:
+            return 0, 0, 1
+        return response.usage.prompt_tokens, response.usage.completion_tokens, 0
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call(request) for request in
+                                     build_requests(prompt_loader, engine, image_url, detail)))
+    wall_ms = (time.perf_counter() - start) * 1000
+    return (wall_ms,) + tuple(sum(column) for column in zip(*results))
+
+
+async def run_round(main, image_url, engine, concurrency, detail):
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=main.Config.OPENAI_API_KEY, max_retries=0)
+    prompt_loader = main.PromptLoader()
+    try:
+        return await asyncio.gather(*(rate_once(client, prompt_loader, engine, image_url, detail)
+                                      for _ in range(concurrency)))
+    finally:
+        await client.close()
+
+
+def online(image_url, rounds, concurrency, detail):
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('STARTUP_MODE', 'deferred')
+    import main
+
+    results = {engine: [] for engine in ENGINES}
+    with main.app.app_context():
+        for _ in range(rounds):
+            for engine in results:
+                results[engine].extend(asyncio.run(run_round(main, image_url, engine, concurrency, detail)))
+
+    print(f"{rounds} rounds of {concurrency} concurrent ratings per engine")
+    print(f"{'engine':>8} | {'p50':>8} | {'p95':>8} | {'prompt tok':>10} | {'output tok':>10} | 429s")
+    for engine, samples in results.items():
+        latencies = sorted(sample[0] for sample in samples)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        print(f"{engine:>8} | {statistics.median(latencies):>5.0f} ms | {p95:>5.0f} ms | "
+              f"{statistics.median(s[1] for s in samples):>10.0f} | "
+              f"{statistics.median(s[2] for s in samples):>10.0f} | {sum(s[3] for s in samples)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg', help='local photo for the offline token estimate')
+    parser.add_argument('--image-url', help='public image URL; enables the billed online comparison')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4, help='ratings run at once per round')
+    parser.add_argument('--detail', default='high', help='category image detail')
+    args = parser.parse_args()
+
+    offline(args.image, args.detail)
+    if args.image_url:
+        print()
+        online(args.image_url, args.rounds, args.concurrency, args.detail)
+
+
+if __name__ == '__main__':
+    main()
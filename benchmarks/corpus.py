@@ -0,0 +1,79 @@
+"""
+Transformation corpus for hashing benchmarks.
+
+Starting from one source photo, builds re-uploads that should hit the cache (the
+same camel resized, recompressed, cropped, rotated, relit or watermarked) and
+distractors that must not (different framing of the scene and synthetic images).
+"""
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageEnhance
+
+
+def _encode(image, quality=90):
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _watermark(image, text="CAMEL MARKET"):
+    marked = image.copy()
+    draw = ImageDraw.Draw(marked)
+    width, height = marked.size
+    step = max(1, height // 6)
+    for y in range(step, height, step * 2):
+        draw.text((width // 10, y), text, fill=(255, 255, 255))
+    draw.rectangle((width - width // 6, height - height // 12, width - 10, height - 10), fill=(255, 255, 255))
+    return marked
+
+
+def _crop(image, fraction):
+    width, height = image.size
+    dx, dy = int(width * fraction / 2), int(height * fraction / 2)
+    return image.crop((dx, dy, width - dx, height - dy))
+
+
+def duplicates(source):
+    """(name, jpeg_bytes) variants of source that a re-upload could plausibly produce."""
+    width, height = source.size
+    variants = [
+        ('original', source),
+        ('resize_50', source.resize((width // 2, height // 2), Image.Resampling.LANCZOS)),
+        ('resize_25', source.resize((width // 4, height // 4), Image.Resampling.BILINEAR)),
+        ('resize_1080', source.resize((1080, int(height * 1080 / width)), Image.Resampling.LANCZOS)),
+        ('crop_2', _crop(source, 0.02)),
+        ('crop_5', _crop(source, 0.05)),
+        ('crop_10', _crop(source, 0.10)),
+        ('rotate_1', source.rotate(1, resample=Image.Resampling.BICUBIC)),
+        ('rotate_3', source.rotate(3, resample=Image.Resampling.BICUBIC)),
+        ('brightness_90', ImageEnhance.Brightness(source).enhance(0.9)),
+        ('brightness_120', ImageEnhance.Brightness(source).enhance(1.2)),
+        ('contrast_120', ImageEnhance.Contrast(source).enhance(1.2)),
+        ('watermark', _watermark(source)),
+    ]
+    encoded = [(name, _encode(image)) for name, image in variants]
+    encoded += [(f'recompress_q{q}', _encode(source, quality=q)) for q in (75, 50, 25)]
+    return encoded
+
+
+def distractors(source, seed=0):
+    """(name, jpeg_bytes) images that share content or statistics with source but are different photos."""
+    rng = random.Random(seed)
+    width, height = source.size
+    images = [
+        ('mirror', source.transpose(Image.Transpose.FLIP_LEFT_RIGHT)),
+        ('flip', source.transpose(Image.Transpose.FLIP_TOP_BOTTOM)),
+        ('rotate_90', source.transpose(Image.Transpose.ROTATE_90)),
+    ]
+    # Tight crops of different parts of the scene, like another photo from the same shoot
+    for i in range(6):
+        crop_w, crop_h = width // 3, height // 3
+        left, top = rng.randint(0, width - crop_w), rng.randint(0, height - crop_h)
+        images.append((f'region_{i}', source.crop((left, top, left + crop_w, top + crop_h))))
+    # Synthetic images with similar colour statistics
+    for i in range(4):
+        small = source.resize((rng.randint(3, 8), rng.randint(3, 8)), Image.Resampling.BOX)
+        images.append((f'blocks_{i}', small.resize((width // 4, height // 4), Image.Resampling.NEAREST)))
+    images.append(('sand', Image.new('RGB', (800, 533), (214, 184, 140))))
+    return [(name, _encode(image)) for name, image in images]
@@ -0,0 +1,103 @@
+"""
+Peak memory and time of decoding + hashing large photos, full vs reduced decode.
+
+Usage:
+    python -m benchmarks.decode [--image img/camel1.jpg] [--decode-size 1024]
+
+Each measurement runs in a fresh interpreter so ru_maxrss reflects only that decode.
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+SIZES = [(4032, 3024), (6000, 4000), (8000, 6000)]  # 12, 24 and 48 MP
+
+
+def child(path, decode_size):
+    """Decode and hash one file, printing timings and RSS growth as JSON."""
+    from image_hashing import generate_image_hash
+    from image_ingest import open_image
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Import and warm the hashing stack on a tiny image so only the large decode is measured
+    small = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(small, 'JPEG')
+    generate_image_hash(small)
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    image = open_image(io.BytesIO(data), decode_size)
+    decode_ms = (time.perf_counter() - start) * 1000
+    decoded_size = image.size
+    del image
+
+    start = time.perf_counter()
+    generate_image_hash(io.BytesIO(data), decode_size=decode_size)
+    hash_ms = (time.perf_counter() - start) * 1000
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        'decoded_size': decoded_size,
+        'decode_ms': decode_ms,
+        'hash_ms': hash_ms,
+        'peak_rss_mb': peak_kb / 1024,
+        'peak_rss_growth_mb': (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def prepare(source_path, directory):
+    """Write the large test photos."""
+    source = Image.open(source_path).convert('RGB')
+    for width, height in SIZES:
+        source.resize((width, height), Image.Resampling.BICUBIC).save(
+            os.path.join(directory, f'{width}x{height}.jpg'), 'JPEG', quality=90)
+
+
+def run(*args):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.decode', *args],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return output.strip().splitlines()[-1] if output.strip() else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg')
+    parser.add_argument('--decode-size', type=int, default=1024)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.decode_size or None)
+        return
+    if args.prepare:
+        prepare(args.image, args.prepare)
+        return
+
+    # Linux carries the RSS high-water mark across fork/exec, so this process never
+    # holds a large image itself: the photos are written by a helper process too
+    print(f"{'photo':>10} | {'mode':>7} | {'decoded':>10} | {'decode':>8} | {'decode+hash':>11} | {'peak RSS':>8} | growth")
+    with tempfile.TemporaryDirectory() as tmp:
+        run('--prepare', tmp, '--image', args.image)
+        for width, height in SIZES:
+            path = os.path.join(tmp, f'{width}x{height}.jpg')
+            for label, decode_size in (('full', 0), ('reduced', args.decode_size)):
+                r = json.loads(run('--child', path, '--decode-size', str(decode_size)))
+                decoded = f"{r['decoded_size'][0]}x{r['decoded_size'][1]}"
+                print(f"{width:>4}x{height:<5} | {label:>7} | {decoded:>10} | {r['decode_ms']:>5.0f} ms | "
+                      f"{r['hash_ms']:>8.0f} ms | {r['peak_rss_mb']:>5.0f} MB | {r['peak_rss_growth_mb']:>4.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
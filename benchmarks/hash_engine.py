@@ -0,0 +1,61 @@
+"""
+Benchmark the shared-downsample hash engine against the original implementation.
+
+Usage:
+    python -m benchmarks.hash_engine [--image img/camel1.jpg] [--repeat 5]
+
+For each input size it checks that both implementations produce the same hash and
+reports per-image CPU time (process_time).
+"""
+import argparse
+import io
+import time
+
+from PIL import Image
+
+from image_hashing import generate_image_hash, reference_image_hash
+
+SIZES = [(640, 427), (1280, 853), (3000, 2000)]
+
+
+def encode(image, size):
+    buffer = io.BytesIO()
+    image.resize(size, Image.Resampling.LANCZOS).save(buffer, 'JPEG', quality=90)
+    buffer.seek(0)
+    return buffer
+
+
+def measure(hash_func, image_file, repeat):
+    """Best-of-repeat CPU time in milliseconds, plus the hash."""
+    cpu_times = []
+    result = None
+    for _ in range(repeat):
+        cpu_start = time.process_time()
+        result = hash_func(image_file)
+        cpu_times.append((time.process_time() - cpu_start) * 1000)
+    return min(cpu_times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    source = Image.open(args.image).convert('RGB')
+
+    # Warm up lazy imports (cv2, scipy.fftpack, pywt) so they are not billed to either side
+    generate_image_hash(encode(source, SIZES[0]))
+    reference_image_hash(encode(source, SIZES[0]))
+
+    print(f"{'size':>11} | {'reference cpu':>13} | {'engine cpu':>10} | {'speedup':>7} | identical")
+    for size in SIZES:
+        image_file = encode(source, size)
+        ref_cpu, ref_hash = measure(reference_image_hash, image_file, args.repeat)
+        new_cpu, new_hash = measure(generate_image_hash, image_file, args.repeat)
+        print(f"{size[0]:>5}x{size[1]:<5} | {ref_cpu:>10.1f} ms | {new_cpu:>7.1f} ms | "
+              f"{ref_cpu / new_cpu:>6.1f}x | {ref_hash == new_hash}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the "fast" and "full" hash profiles on a generated transformation corpus.
+
+Usage:
+    python -m benchmarks.hash_profiles [--image img/camel1.jpg] [--distance 24]
+
+Latency is the per-image CPU time of generate_image_hash. Recall is the share of
+duplicate variants that would hit the cache of the original, either by exact key
+or through the near-duplicate index; false matches count distractors that would.
+"""
+import argparse
+import io
+import statistics
+import time
+
+from PIL import Image
+
+from benchmarks.corpus import duplicates, distractors
+from hash_index import NearDuplicateIndex
+from image_hashing import generate_image_hash, HASH_PROFILES
+
+
+def evaluate(profile, source_bytes, duplicate_set, distractor_set, max_distance):
+    original = generate_image_hash(io.BytesIO(source_bytes), profile)
+    index = NearDuplicateIndex(max_distance=max_distance)
+    index.add(1, original)
+
+    cpu_ms = []
+    exact_hits = near_hits = false_matches = 0
+    for _, image_bytes in duplicate_set:
+        start = time.process_time()
+        image_hash = generate_image_hash(io.BytesIO(image_bytes), profile)
+        cpu_ms.append((time.process_time() - start) * 1000)
+        exact_hits += image_hash == original
+        near_hits += index.find(image_hash) is not None
+
+    for _, image_bytes in distractor_set:
+        false_matches += index.find(generate_image_hash(io.BytesIO(image_bytes), profile)) is not None
+
+    return {
+        'profile': profile,
+        'median_cpu_ms': statistics.median(cpu_ms),
+        'max_cpu_ms': max(cpu_ms),
+        'exact_recall': exact_hits / len(duplicate_set),
+        'near_recall': near_hits / len(duplicate_set),
+        'false_matches': false_matches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg')
+    parser.add_argument('--distance', type=int, default=24, help='near-duplicate radius in bits')
+    args = parser.parse_args()
+
+    source = Image.open(args.image).convert('RGB')
+    duplicate_set = duplicates(source)
+    distractor_set = distractors(source)
+    source_bytes = duplicate_set[0][1]
+
+    # Warm up lazy imports
+    generate_image_hash(io.BytesIO(source_bytes))
+
+    print(f"{len(duplicate_set)} duplicates, {len(distractor_set)} distractors, radius {args.distance} bits")
+    print(f"{'profile':>7} | {'median cpu':>10} | {'max cpu':>9} | {'exact recall':>12} | {'near recall':>11} | false matches")
+    for profile in HASH_PROFILES:
+        r = evaluate(profile, source_bytes, duplicate_set, distractor_set, args.distance)
+        print(f"{r['profile']:>7} | {r['median_cpu_ms']:>7.1f} ms | {r['max_cpu_ms']:>6.1f} ms | "
+              f"{r['exact_recall']:>12.0%} | {r['near_recall']:>11.0%} | {r['false_matches']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Offline hashing benchmark and robustness report for generate_image_hash.
+
+Usage:
+    python -m benchmarks.hashing_suite [--image img/camel1.jpg] [--backend both]
+                                       [--output hashing_report.json]
+
+Builds the transformation corpus from benchmarks.corpus and, for the OpenCV path
+and the PIL-only fallback, measures per-image latency percentiles, throughput per
+core, the share of re-uploads that would hit the cache of the original (exactly or
+through the near-duplicate index) and the share of distinct images that would
+falsely collide with it. Each backend runs in its own interpreter; the PIL-only run
+hides cv2 from the import system so generate_image_hash takes its real fallback.
+
+The report is JSON with a fixed schema so runs can be diffed or tracked over time.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from PIL import Image
+
+REPORT_VERSION = 1
+BACKENDS = ('opencv', 'pil')
+
+
+def _disable_opencv():
+    # A None entry makes `import cv2` raise ImportError, exactly as when it is not installed
+    sys.modules['cv2'] = None
+
+
+def _quiet():
+    """Silence the per-call prints of the hashing fallbacks while timing."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _hash(image_bytes, profile, decode_size):
+    from image_hashing import generate_image_hash
+    return generate_image_hash(io.BytesIO(image_bytes), profile, decode_size=decode_size)
+
+
+def _hash_batch(args):
+    batch, profile, decode_size = args
+    with _quiet():
+        for image_bytes in batch:
+            _hash(image_bytes, profile, decode_size)
+    return len(batch)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'max': ordered[-1],
+        'mean': statistics.fmean(ordered),
+    }
+
+
+def measure_latency(corpus, profile, decode_size, repeat):
+    wall_ms, cpu_ms = [], []
+    with _quiet():
+        for _ in range(repeat):
+            for _, image_bytes in corpus:
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                _hash(image_bytes, profile, decode_size)
+                wall_ms.append((time.perf_counter() - wall_start) * 1000)
+                cpu_ms.append((time.process_time() - cpu_start) * 1000)
+    return {'samples': len(wall_ms), 'wall_ms': percentiles(wall_ms), 'cpu_ms': percentiles(cpu_ms)}
+
+
+def measure_throughput(corpus, profile, decode_size, workers, repeat, backend):
+    """Images per second with `workers` processes hashing the corpus `repeat` times."""
+    images = [image_bytes for _ in range(repeat) for _, image_bytes in corpus]
+    batches = [images[i::workers] for i in range(workers)]
+    context = multiprocessing.get_context('fork')
+    initializer = _disable_opencv if backend == 'pil' else None
+    with context.Pool(workers, initializer=initializer) as pool:
+        # Warm every worker's imports before the clock starts
+        pool.map(_hash_batch, [([corpus[0][1]], profile, decode_size)] * workers)
+        start = time.perf_counter()
+        hashed = sum(pool.map(_hash_batch, [(batch, profile, decode_size) for batch in batches]))
+        elapsed = time.perf_counter() - start
+    return {
+        'workers': workers,
+        'images': hashed,
+        'images_per_second': hashed / elapsed,
+        'images_per_second_per_core': hashed / elapsed / workers,
+    }
+
+
+def measure_robustness(duplicate_set, distractor_set, profile, decode_size, max_distance):
+    from hash_index import NearDuplicateIndex
+
+    with _quiet():
+        duplicate_hashes = [(name, _hash(data, profile, decode_size)) for name, data in duplicate_set]
+        distractor_hashes = [(name, _hash(data, profile, decode_size)) for name, data in distractor_set]
+
+    original = duplicate_hashes[0][1]
+    index = NearDuplicateIndex(max_distance=max_distance)
+    index.add(0, original)
+
+    variants = {}
+    exact_hits = near_hits = 0
+    for name, image_hash in duplicate_hashes[1:]:
+        match = index.find(image_hash)
+        exact_hits += image_hash == original
+        near_hits += match is not None
+        variants[name] = {'exact': image_hash == original, 'distance': match[1] if match else None}
+
+    # False collisions: distractors that would be served the original's cached result,
+    # and pairs of distinct images (original + distractors) that would share a result
+    false_hits = []
+    for name, image_hash in distractor_hashes:
+        if image_hash == original or index.find(image_hash) is not None:
+            false_hits.append(name)
+
+    distinct = [original] + [image_hash for _, image_hash in distractor_hashes]
+    pairs = [(a, b) for i, a in enumerate(distinct) for b in distinct[i + 1:]]
+    colliding_pairs = sum(1 for a, b in pairs if _within(a, b, max_distance))
+
+    duplicates_tested = len(duplicate_hashes) - 1
+    return {
+        'duplicates': duplicates_tested,
+        'distractors': len(distractor_hashes),
+        'max_distance': max_distance,
+        'exact_hit_rate': exact_hits / duplicates_tested,
+        'cache_hit_rate': near_hits / duplicates_tested,
+        'false_collision_rate': len(false_hits) / len(distractor_hashes),
+        'false_collisions': false_hits,
+        'pairwise_collision_rate': colliding_pairs / len(pairs) if pairs else 0.0,
+        'failed_hashes': sum(1 for _, h in duplicate_hashes + distractor_hashes if h is None),
+        'variants': variants,
+    }
+
+
+def _within(first, second, max_distance):
+    from hash_index import perceptual_key
+    a, b = perceptual_key(first), perceptual_key(second)
+    return a is not None and b is not None and (a ^ b).bit_count() <= max_distance
+
+
+def run_backend(args):
+    """Measure one backend in this interpreter and print its results as JSON."""
+    if args.child == 'pil':
+        _disable_opencv()
+
+    from benchmarks.corpus import duplicates, distractors
+
+    source = Image.open(args.image).convert('RGB')
+    duplicate_set = duplicates(source)
+    distractor_set = distractors(source)
+    corpus = duplicate_set + distractor_set
+
+    # Warm up lazy imports
+    with _quiet():
+        _hash(corpus[0][1], args.profile, args.decode_size)
+
+    print(json.dumps({
+        'backend': args.child,
+        'corpus_images': len(corpus),
+        'latency': measure_latency(corpus, args.profile, args.decode_size, args.repeat),
+        'throughput_single': measure_throughput(corpus, args.profile, args.decode_size, 1, 1, args.child),
+        'throughput': measure_throughput(corpus, args.profile, args.decode_size, args.workers, args.repeat,
+                                         args.child),
+        'robustness': measure_robustness(duplicate_set, distractor_set, args.profile, args.decode_size,
+                                         args.distance),
+    }))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _package_versions():
+    from importlib import metadata
+    versions = {}
+    for package in ('Pillow', 'ImageHash', 'numpy', 'scipy', 'PyWavelets', 'opencv-python',
+                    'opencv-python-headless'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    return versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg')
+    parser.add_argument('--backend', choices=BACKENDS + ('both',), default='both')
+    parser.add_argument('--profile', default='full')
+    parser.add_argument('--decode-size', type=int, default=None, help='reduced JPEG decode long edge')
+    parser.add_argument('--distance', type=int, default=24, help='near-duplicate radius in bits')
+    parser.add_argument('--repeat', type=int, default=3, help='passes over the corpus for latency/throughput')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--child', choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args)
+        return
+
+    results = {}
+    backends = BACKENDS if args.backend == 'both' else (args.backend,)
+    for backend in backends:
+        command = [sys.executable, '-m', 'benchmarks.hashing_suite', '--child', backend,
+                   '--image', args.image, '--profile', args.profile, '--distance', str(args.distance),
+                   '--repeat', str(args.repeat), '--workers', str(args.workers)]
+        if args.decode_size:
+            command += ['--decode-size', str(args.decode_size)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results[backend] = json.loads(output.strip().splitlines()[-1])
+        print(f"{backend}: p50 {results[backend]['latency']['wall_ms']['p50']:.1f} ms, "
+              f"{results[backend]['throughput']['images_per_second_per_core']:.1f} img/s/core, "
+              f"cache hit {results[backend]['robustness']['cache_hit_rate']:.0%}, "
+              f"false collision {results[backend]['robustness']['false_collision_rate']:.0%}",
+              file=sys.stderr)
+
+    report = {
+        'report_version': REPORT_VERSION,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'packages': _package_versions(),
+        },
+        'config': {
+            'image': args.image,
+            'profile': args.profile,
+            'decode_size': args.decode_size,
+            'max_distance': args.distance,
+            'repeat': args.repeat,
+            'workers': args.workers,
+        },
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Rating latency with a heavy-tailed API: no deadline, a deadline, and hedged calls.
+
+Usage:
+    python -m benchmarks.hedging [--ratings 400] [--median-ms 40] [--slow 0.03] [--stall 0.005] [--budget 10]
+
+Each simulated rating makes four concurrent category calls and finishes with the
+slowest. A call takes a log-normal time around --median-ms; a --slow share of calls
+takes 10x that, and a --stall share never answers (a hung connection). Times are
+scaled down from production (a median of 40 ms stands for about 4 s). Modes:
+    baseline   no deadline; a stalled call is cut at 100x the median, standing in
+               for the SDK timeout
+    deadline   HedgedCalls with a deadline of 10x the median; a call out of time fails
+               its rating (504), as in the views
+    hedged     the same deadline, and a hedge once a call passes its category's p90,
+               within --budget percent extra calls
+
+Reported: p50 / p99 of the ratings that completed, ratings failed by the deadline,
+calls and hedges sent.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from hedging import CallDeadlineError, HedgedCalls
+
+CATEGORIES = ('head', 'neck', 'body', 'leg')
+
+
+def make_call_factory(rng, args, counts):
+    def make_call():
+        counts['calls'] += 1
+        roll = rng.random()
+        if roll < args.stall:
+            delay = args.median_ms * 100
+        elif roll < args.stall + args.slow:
+            delay = args.median_ms * 10 * rng.lognormvariate(0, 0.3)
+        else:
+            delay = args.median_ms * rng.lognormvariate(0, 0.3)
+        return asyncio.sleep(delay / 1000, result='ok')
+    return make_call
+
+
+async def run(mode, args):
+    rng = random.Random(args.seed)
+    counts = {'calls': 0, 'failed': 0}
+    make_call = make_call_factory(rng, args, counts)
+    calls = HedgedCalls(deadline_seconds=args.median_ms * 10 / 1000, hedge_enabled=mode == 'hedged',
+                        hedge_min_delay=0.0, hedge_budget_percent=args.budget)
+
+    async def category(label):
+        if mode == 'baseline':
+            return await make_call()
+        return await calls.call(label, make_call)
+
+    latencies = []
+    for _ in range(args.ratings):
+        start = time.monotonic()
+        tasks = [asyncio.create_task(category(label)) for label in CATEGORIES]
+        try:
+            await asyncio.gather(*tasks)
+        except CallDeadlineError:
+            counts['failed'] += 1
+            continue
+        finally:
+            for task in tasks:
+                task.cancel()
+        latencies.append((time.monotonic() - start) * 1000)
+    hedged = sum(stats['hedged'] for stats in calls.stats().get('default', {}).values())
+    return latencies, counts, hedged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ratings', type=int, default=400)
+    parser.add_argument('--median-ms', type=float, default=40)
+    parser.add_argument('--slow', type=float, default=0.03, help='share of calls 10x slower')
+    parser.add_argument('--stall', type=float, default=0.005, help='share of calls that hang')
+    parser.add_argument('--budget', type=float, default=10, help='hedges, percent of calls')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.ratings} ratings x {len(CATEGORIES)} calls, median {args.median_ms:g} ms, "
+          f"{args.slow:.1%} slow, {args.stall:.1%} stalled")
+    print(f"{'mode':>8} | {'p50 ms':>7} | {'p99 ms':>7} | {'calls':>5} | {'hedges':>6} | ratings failed")
+    for mode in ('baseline', 'deadline', 'hedged'):
+        latencies, counts, hedged = asyncio.run(run(mode, args))
+        ordered = sorted(latencies)
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        print(f"{mode:>8} | {statistics.median(ordered):>7.0f} | {p99:>7.0f} | {counts['calls']:>5} | "
+              f"{hedged:>6} | {counts['failed']}")
+
+
+if __name__ == '__main__':
+    main()
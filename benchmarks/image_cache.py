@@ -0,0 +1,87 @@
+"""
+Repeat image fetches with and without the on-disk image cache.
+
+Usage:
+    python -m benchmarks.image_cache [--image img/camel1.jpg] [--latency-ms 80] [--rounds 20]
+
+A local HTTP server plays the image host, adding --latency-ms before every response
+to stand in for the round trip to Cloudinary. Each round fetches the same URLs:
+    no cache     every fetch transfers the body
+    fresh        Cache-Control max-age, so repeats are local reads
+    revalidate   ETag with no-cache, so repeats are conditional GETs answered by 304
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from blob_cache import BlobCache
+from http_client import PooledHttpClient
+from image_download import download_image
+
+
+def make_handler(body, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith('/revalidate') and self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', '"v1"')
+            self.send_header('Cache-Control', 'no-cache' if self.path.startswith('/revalidate') else 'max-age=3600')
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg')
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        body = f.read()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(body, args.latency_ms / 1000))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    client = PooledHttpClient()
+
+    print(f"{len(body) / 1024:.0f} KB image, {args.latency_ms:.0f} ms simulated origin latency")
+    print(f"{'variant':>10} | {'first':>8} | {'repeat p50':>10} | {'repeat max':>10} | cache stats")
+    with tempfile.TemporaryDirectory() as directory:
+        for variant, path, cache in (('no cache', '/plain.jpg', None),
+                                     ('fresh', '/fresh.jpg', BlobCache(directory)),
+                                     ('revalidate', '/revalidate.jpg', BlobCache(directory))):
+            timings = []
+            for _ in range(args.rounds + 1):
+                start = time.perf_counter()
+                download_image(base + path, client, cache=cache)
+                timings.append((time.perf_counter() - start) * 1000)
+            repeats = timings[1:]
+            stats = cache.stats() if cache else {}
+            summary = f"hits={stats['hits']} revalidated={stats['revalidated']} misses={stats['misses']}" \
+                if cache else '-'
+            print(f"{variant:>10} | {timings[0]:>5.1f} ms | {statistics.median(repeats):>7.1f} ms | "
+                  f"{max(repeats):>7.1f} ms | {summary}")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
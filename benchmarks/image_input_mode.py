@@ -0,0 +1,153 @@
+"""
+Compare how the rating pipeline hands images to the vision model.
+
+Usage:
+    python -m benchmarks.image_input_mode [--image img/camel1.jpg]
+    python -m benchmarks.image_input_mode --image-url https://... [--rounds 5]
+
+Variants (one validation call plus one call per beauty category, as in rate_image):
+    url            public URL, no detail set on any call (the original behaviour)
+    url-low        public URL, low-detail validation, high-detail categories
+    inline-full    downloaded bytes inlined at their original resolution
+    inline         model-ready derivative, low-detail validation, high-detail categories
+
+Without --image-url only offline numbers are reported for photos of common sizes:
+preparation time, payload per call, and the image tokens one request is billed for
+(OpenAI's tile formula; "auto" counted as high, which is what it picks for photos).
+
+With --image-url (and OPENAI_API_KEY set) each round replays the model calls for
+every variant using the real prompts, and reports wall time and the prompt tokens the
+API actually billed. Inline rounds include downloading and preparing the image. This
+sends real requests and is billed.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from image_inline import to_data_url, estimate_image_tokens
+
+SIZES = [(1080, 720), (4032, 3024), (8000, 6000)]
+
+# variant -> (inline mode, validation detail, category detail)
+VARIANTS = {
+    'url': (None, None, None),
+    'url-low': (None, 'low', 'high'),
+    'inline-full': ('full', None, None),
+    'inline': ('derivative', 'low', 'high'),
+}
+
+
+def full_data_url(image_bytes):
+    """Original bytes as a data URL, i.e. inlining without a derivative."""
+    return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode('ascii')
+
+
+def request_image_tokens(width, height, validation_detail, category_detail, categories):
+    return (estimate_image_tokens(width, height, validation_detail or 'auto')
+            + categories * estimate_image_tokens(width, height, category_detail or 'auto'))
+
+
+def offline(image_path, categories):
+    source = Image.open(image_path).convert('RGB')
+    print(f"image tokens per request assume {categories} category calls + 1 validation call")
+    print(f"{'source':>11} | {'variant':>11} | {'prepare':>8} | {'per call':>8} | {'image tokens':>12}")
+    for width, height in SIZES:
+        buffer = io.BytesIO()
+        source.resize((width, height), Image.Resampling.BILINEAR).save(buffer, 'JPEG', quality=92)
+        image_bytes = buffer.getvalue()
+
+        for variant, (inline, validation_detail, category_detail) in VARIANTS.items():
+            prepare_ms, payload = 0.0, 0
+            if inline:
+                prepare = to_data_url if inline == 'derivative' else full_data_url
+                timings = []
+                for _ in range(3):
+                    start = time.perf_counter()
+                    data_url = prepare(image_bytes)
+                    timings.append((time.perf_counter() - start) * 1000)
+                prepare_ms, payload = min(timings), len(data_url)
+            tokens = request_image_tokens(width, height, validation_detail, category_detail, categories)
+            per_call = f"{payload / 1024:>5.0f} KB" if payload else f"{'url':>8}"
+            print(f"{width:>5}x{height:<5} | {variant:>11} | {prepare_ms:>5.1f} ms | {per_call} | {tokens:>12}")
+
+
+async def replay_request(main, image_url, variant):
+    """One rate_image worth of model calls; returns (wall ms, prompt tokens)."""
+    from openai import AsyncOpenAI
+    from image_download import download_image_async
+
+    inline, validation_detail, category_detail = VARIANTS[variant]
+    client = AsyncOpenAI(api_key=main.Config.OPENAI_API_KEY)
+    prompt_loader = main.PromptLoader()
+    start = time.perf_counter()
+    try:
+        model_url = image_url
+        if inline:
+            downloaded = await download_image_async(image_url, main.http_client)
+            prepare = (lambda content: to_data_url(content, **main.model_image_options())) \
+                if inline == 'derivative' else full_data_url
+            model_url = await asyncio.to_thread(prepare, downloaded.content)
+
+        validation = await main.validate_camel_image(model_url, client, validation_detail)
+        if not validation['success']:
+            raise RuntimeError(validation['error'])
+
+        async def category_call(category):
+            response = await client.chat.completions.create(
+                model="gpt-5.1",
+                messages=[{"role": "system", "content": prompt_loader.get_system_prompt(category)}]
+                + prompt_loader.build_messages(category, model_url, detail=category_detail),
+                response_format={"type": "json_object"},
+            )
+            return response.usage.prompt_tokens
+
+        prompt_tokens = sum(await asyncio.gather(
+            *(category_call(category) for category in prompt_loader.get_available_categories())))
+    finally:
+        await client.close()
+        await main.http_client.aclose()
+    return (time.perf_counter() - start) * 1000, prompt_tokens
+
+
+def online(image_url, rounds):
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ.setdefault('STARTUP_MODE', 'deferred')
+    import main
+
+    results = {variant: [] for variant in VARIANTS}
+    with main.app.app_context():
+        for _ in range(rounds):
+            # Interleave so every variant sees the same network conditions
+            for variant in results:
+                results[variant].append(asyncio.run(replay_request(main, image_url, variant)))
+
+    print(f"{'variant':>11} | {'p50':>8} | {'p95':>8} | {'mean':>8} | category prompt tokens")
+    for variant, samples in results.items():
+        latencies = sorted(ms for ms, _ in samples)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        print(f"{variant:>11} | {statistics.median(latencies):>5.0f} ms | {p95:>5.0f} ms | "
+              f"{statistics.fmean(latencies):>5.0f} ms | {statistics.median(t for _, t in samples):.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--image', default='img/camel1.jpg', help='local photo for the offline measurements')
+    parser.add_argument('--image-url', help='public image URL; enables the billed online comparison')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--categories', type=int, default=4, help='category calls per request (offline)')
+    args = parser.parse_args()
+
+    offline(args.image, args.categories)
+    if args.image_url:
+        print()
+        online(args.image_url, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
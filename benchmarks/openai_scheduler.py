@@ -0,0 +1,141 @@
+"""
+Rating bursts against a rate-limited API: unscheduled calls against the OpenAI scheduler.
+
+Usage:
+    python -m benchmarks.openai_scheduler [--ratings 40] [--calls 5] [--rpm 600] [--latency-ms 300]
+
+A local server plays the OpenAI API with a limit of --rpm requests per minute (a
+token bucket holding one second's worth). Calls over the limit get a 429 with
+retry-after-ms, as the real API sends. --ratings ratings start at once, each making
+--calls concurrent completions:
+    unscheduled   client.chat.completions.create with the SDK's own retries (2, short
+                  backoff); a call that still fails is what used to become a score of 0
+    scheduled     OpenAIScheduler.create paced at the same --rpm, SDK retries off
+
+Reported: calls that succeeded or failed, ratings with at least one failed call, 429s
+the server sent, wall time and rating latency.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai_scheduler import OpenAIScheduler, OpenAIUnavailableError
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-5.1",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+    "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200},
+}).encode()
+RATE_LIMITED = json.dumps({"error": {"message": "Rate limit reached", "type": "requests",
+                                     "code": "rate_limit_exceeded"}}).encode()
+
+
+def make_handler(rpm, latency, counts):
+    rate = rpm / 60
+    bucket = {'level': rate, 'updated': time.monotonic()}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            with lock:
+                now = time.monotonic()
+                bucket['level'] = min(rate, bucket['level'] + (now - bucket['updated']) * rate)
+                bucket['updated'] = now
+                allowed = bucket['level'] >= 1
+                if allowed:
+                    bucket['level'] -= 1
+                    counts['ok'] += 1
+                else:
+                    counts['429'] += 1
+                    wait_ms = (1 - bucket['level']) / rate * 1000
+            if allowed:
+                time.sleep(latency)
+                status, body, headers = 200, COMPLETION, {}
+            else:
+                status, body, headers = 429, RATE_LIMITED, {'retry-after-ms': f"{wait_ms:.0f}"}
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+async def run_variant(variant, base_url, ratings, calls, rpm):
+    from openai import APIError, AsyncOpenAI
+
+    scheduled = variant == 'scheduled'
+    client = AsyncOpenAI(api_key='benchmark', base_url=base_url, max_retries=0 if scheduled else 2)
+    scheduler = OpenAIScheduler(rpm=rpm, max_retries=8, backoff_max=30)
+    params = {'model': 'gpt-5.1', 'messages': [{'role': 'user', 'content': 'rate'}], 'max_completion_tokens': 200}
+    outcomes = {'ok': 0, 'failed': 0, 'ratings_failed': 0}
+
+    async def one_call():
+        try:
+            if scheduled:
+                await scheduler.create(client, **params)
+            else:
+                await client.chat.completions.create(**params)
+            outcomes['ok'] += 1
+            return True
+        except (APIError, OpenAIUnavailableError):
+            outcomes['failed'] += 1
+            return False
+
+    async def rating():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one_call() for _ in range(calls)))
+        outcomes['ratings_failed'] += not all(results)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    latencies = sorted(await asyncio.gather(*(rating() for _ in range(ratings))))
+    wall = time.perf_counter() - start
+    await client.close()
+    return outcomes, latencies, wall, scheduler.stats().get('gpt-5.1', {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ratings', type=int, default=40, help='ratings started at once')
+    parser.add_argument('--calls', type=int, default=5, help='concurrent completions per rating')
+    parser.add_argument('--rpm', type=int, default=600, help="the simulated API's requests per minute")
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    args = parser.parse_args()
+
+    print(f"{args.ratings} ratings x {args.calls} calls at once, limit {args.rpm} rpm, "
+          f"{args.latency_ms:.0f} ms per call")
+    print(f"{'variant':>12} | {'ok':>4} | {'failed':>6} | {'ratings failed':>14} | {'429s':>5} | "
+          f"{'wall':>7} | {'p50':>8} | {'p95':>8} | retries")
+    for variant in ('unscheduled', 'scheduled'):
+        counts = {'ok': 0, '429': 0}
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.rpm, args.latency_ms / 1000, counts))
+        server.daemon_threads = True
+        server.request_queue_size = 1024
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        outcomes, latencies, wall, stats = asyncio.run(
+            run_variant(variant, base_url, args.ratings, args.calls, args.rpm))
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        print(f"{variant:>12} | {outcomes['ok']:>4} | {outcomes['failed']:>6} | {outcomes['ratings_failed']:>14} | "
+              f"{counts['429']:>5} | {wall:>5.1f} s | {statistics.median(latencies):>5.0f} ms | {p95:>5.0f} ms | "
+              f"{stats.get('retries', '-')}")
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Prompt-cache-eligible tokens per category call: inline against prefix message layout.
+
+Usage:
+    python -m benchmarks.prompt_layout [--requests 300] [--gender-mix 0.4,0.4,0.2] [--golden-every 50] [--window 3]
+
+Upstream prompt caching reuses the longest prefix a call shares with an earlier one
+(at least 1024 tokens, then in 128-token steps). This replays a stream of ratings
+offline, with no API calls: each gets a random gender (male, female, unknown
+in --gender-mix proportions), and every --golden-every ratings an expert approves a
+new correction, which changes the golden examples. For each category call it
+measures the longest prefix shared with the --window previous calls of the category
+(cache entries are evicted after minutes idle, so at low traffic only recent calls
+count), and reports what fraction of prompt tokens could be served from the cache.
+
+Token counts are estimates (4 characters per token, 765 per high-detail image).
+"""
+import argparse
+import json
+import random
+from unittest.mock import MagicMock
+
+from openai_scheduler import HIGH_DETAIL_IMAGE_TOKENS, LOW_DETAIL_IMAGE_TOKENS
+from prompt_loader import PromptLoader
+
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+
+
+def parts(messages):
+    """The request as a flat sequence of (role, kind, payload) parts, in the order it is tokenized."""
+    flat = []
+    for message in messages:
+        content = message['content']
+        for part in [{'type': 'text', 'text': content}] if isinstance(content, str) else content:
+            if part['type'] == 'text':
+                flat.append((message['role'], 'text', part['text']))
+            else:
+                flat.append((message['role'], 'image', json.dumps(part['image_url'], sort_keys=True)))
+    return flat
+
+
+def part_tokens(part):
+    role, kind, payload = part
+    if kind == 'text':
+        return len(payload) // 4
+    return LOW_DETAIL_IMAGE_TOKENS if '"low"' in payload else HIGH_DETAIL_IMAGE_TOKENS
+
+
+def shared_tokens(a, b):
+    tokens = 0
+    for first, second in zip(a, b):
+        if first == second:
+            tokens += part_tokens(first)
+            continue
+        if first[:2] == second[:2] and first[1] == 'text':
+            # The cache matches tokens, so a text part counts up to where it differs
+            common = 0
+            for x, y in zip(first[2], second[2]):
+                if x != y:
+                    break
+                common += 1
+            tokens += common // 4
+        break
+    return tokens
+
+
+def cacheable(tokens):
+    return 0 if tokens < CACHE_MIN_TOKENS else tokens - tokens % CACHE_STEP_TOKENS
+
+
+def golden_examples(version):
+    """Three approved corrections; each new version drops the oldest."""
+    messages = []
+    for n in range(version, version + 3):
+        messages.append({"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": f"https://example.com/golden-{n}.jpg"}},
+            {"type": "text", "text": "Rate this camel."}]})
+        messages.append({"role": "assistant", "content": f"Based on expert feedback, here is the correct rating: {n}"})
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--gender-mix', default='0.4,0.4,0.2', help='male,female,unknown proportions')
+    parser.add_argument('--golden-every', type=int, default=50, help='ratings between approved corrections')
+    parser.add_argument('--window', type=int, default=3, help='earlier calls still in the cache (0 = all)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    weights = [float(w) for w in args.gender_mix.split(',')]
+    genders = rng.choices(['male', 'female', None], weights=weights, k=args.requests)
+    loader = PromptLoader()
+    categories = sorted(loader.get_available_categories())
+
+    print(f"{args.requests} ratings, gender mix {args.gender_mix}, new golden example every {args.golden_every}, "
+          f"cache holds the last {args.window or 'all'} calls")
+    print(f"{'layout':>7} | {'category':>8} | {'prompt tokens':>13} | {'cacheable':>9} | share")
+    for layout in ('inline', 'prefix'):
+        for category in categories:
+            seen, total, cached = [], 0, 0
+            for n, gender in enumerate(genders):
+                loader.golden_example_messages = MagicMock(return_value=golden_examples(n // args.golden_every))
+                request = parts(loader.build_category_messages(
+                    category, f"https://example.com/upload-{n}.jpg", gender=gender, detail='high', layout=layout))
+                total += sum(part_tokens(part) for part in request)
+                recent = seen[-args.window:] if args.window else seen
+                cached += cacheable(max((shared_tokens(request, earlier) for earlier in recent), default=0))
+                seen.append(request)
+            print(f"{layout:>7} | {category:>8} | {total:>13} | {cached:>9} | {cached / total:.1%}")
+
+
+if __name__ == '__main__':
+    main()
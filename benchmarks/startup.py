@@ -0,0 +1,117 @@
+"""
+Import-time profile and time-to-first-request of the app in each startup mode.
+
+Usage:
+    python -m benchmarks.startup [--top 15] [--runs 3] [--json]
+
+The profile runs `python -X importtime -c "import main"` and lists the slowest
+top-level packages by cumulative import time. Each startup mode is then measured in
+a fresh interpreter: wall time from spawning the process until the app is importable,
+until the first /ping response, and until the first rating-path work (loading the
+analysis stack and hashing img/camel1.jpg) completes.
+
+DATABASE_URL defaults to an in-memory SQLite database and OPENAI_API_KEY to a dummy
+value; nothing is sent over the network.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from core.startup import STARTUP_MODES
+
+
+def _env(mode=None):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    env.setdefault('OPENAI_API_KEY', 'benchmark')
+    if mode:
+        env['STARTUP_MODE'] = mode
+    return env
+
+
+def import_profile(top):
+    """
+    Cumulative import time (ms) of each top-level package imported by main.
+
+    A package's time includes dependencies it is the first to import (sqlalchemy
+    under flask_sqlalchemy, for example), so rows overlap and do not sum to the total.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            env=_env('deferred'), capture_output=True, text=True, check=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        if '.' not in name and name != 'main':
+            packages[name] = int(fields[1]) / 1000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def child():
+    """Measure one cold start in this interpreter; prints wall-clock stamps as JSON."""
+    stamps = {}
+    import main
+    stamps['app_ready'] = time.time()
+
+    client = main.app.test_client()
+    client.get('/ping')
+    stamps['first_ping'] = time.time()
+
+    with open('img/camel1.jpg', 'rb') as f:
+        image_bytes = f.read()
+    main.startup.ensure_ready()
+    main.hash_pool.hash_image(image_bytes, profile=main.Config.HASH_PROFILE)
+    stamps['first_rating_work'] = time.time()
+    print(json.dumps(stamps))
+
+
+def measure_mode(mode, runs):
+    samples = {'app_ready': [], 'first_ping': [], 'first_rating_work': []}
+    for _ in range(runs):
+        spawned = time.time()
+        result = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child'],
+                                env=_env(mode), capture_output=True, text=True, check=True)
+        stamps = json.loads(result.stdout.strip().splitlines()[-1])
+        for key in samples:
+            samples[key].append((stamps[key] - spawned) * 1000)
+    return {key: statistics.median(values) for key, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top', type=int, default=15, help='packages to list in the import profile')
+    parser.add_argument('--runs', type=int, default=3, help='cold starts per mode (median reported)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    profile = import_profile(args.top)
+    modes = {mode: measure_mode(mode, args.runs) for mode in STARTUP_MODES}
+
+    if args.json:
+        print(json.dumps({'import_profile_ms': dict(profile), 'startup_ms': modes}, indent=2))
+        return
+
+    print("Import profile of `import main` (deferred mode), cumulative ms per top-level package:")
+    for package, ms in profile:
+        print(f"  {package:<24} {ms:>8.1f}")
+    print()
+    print(f"Median of {args.runs} cold starts, ms since process spawn:")
+    print(f"{'mode':>9} | {'app ready':>9} | {'first /ping':>11} | {'first rating work':>17}")
+    for mode, timings in modes.items():
+        print(f"{mode:>9} | {timings['app_ready']:>9.0f} | {timings['first_ping']:>11.0f} | "
+              f"{timings['first_rating_work']:>17.0f}")
+
+
+if __name__ == '__main__':
+    main()
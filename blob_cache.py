@@ -0,0 +1,313 @@
+"""
+On-disk cache of downloaded images, shared by every worker process on the host.
+
+Clients retry, compare_beauty re-fetches camels that were already rated, and the same
+Cloudinary URLs come back again and again. Each download is kept on local disk so a
+repeat becomes a file read:
+
+    <root>/blobs/ab/<sha256 of content>        image bytes, content-addressed
+    <root>/urls/cd/<sha256 of url>.json        url -> digest, type, ETag/Last-Modified
+
+A URL entry is fresh for the response's Cache-Control max-age (or the default TTL when
+the server sends none), and is served without touching the network. After that it is
+revalidated with If-None-Match / If-Modified-Since, so a 304 still avoids the body.
+
+Every file is written to a temporary name in the same directory and renamed into place,
+so readers in other processes never see partial files, and a blob that is evicted while
+being looked up simply reads as a miss. Recency is the file mtime, bumped on every hit.
+Once the blobs exceed the size budget, the least recently used ones are deleted, along
+with URL entries that have not been used since.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Optional
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 3600
+
+# Eviction frees down to this fraction of the budget so it does not rerun on every store
+EVICT_TO = 0.9
+
+# Temporary files left behind by a crashed writer are removed after this long
+STALE_TEMP_SECONDS = 3600
+
+
+class CachedImage(NamedTuple):
+    url: str
+    digest: str
+    image_type: str
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+    lifetime: float
+    fresh_until: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+    def validators(self) -> dict:
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def freshness_lifetime(headers, default_ttl: float) -> Optional[float]:
+    """
+    Seconds a response may be reused without revalidation, from its Cache-Control.
+
+    Returns:
+        float: max-age, 0 for no-cache, default_ttl when unspecified; None for no-store
+    """
+    directives = {}
+    for part in (headers.get('Cache-Control') or '').split(','):
+        name, _, value = part.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0.0
+    max_age = directives.get('max-age', '')
+    return float(max_age) if max_age.isdigit() else default_ttl
+
+
+class BlobCache:
+    """Content-addressed on-disk image cache with URL validators and an LRU size budget."""
+
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 default_ttl: float = DEFAULT_TTL_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._approx_bytes = None  # blob bytes as of the last scan plus this process's stores
+        self.reset_stats()
+
+    def init_app(self, app):
+        """Configure from app config. An empty directory or a zero budget disables the cache."""
+        self.directory = app.config.get("IMAGE_CACHE_DIR", self.directory)
+        self.max_bytes = app.config.get("IMAGE_CACHE_MAX_BYTES", self.max_bytes)
+        self.default_ttl = app.config.get("IMAGE_CACHE_TTL_SECONDS", self.default_ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) and self.max_bytes > 0
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest[:2], digest)
+
+    def _entry_path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'urls', key[:2], key + '.json')
+
+    def lookup(self, url: str) -> Optional[CachedImage]:
+        """The cached entry for url, or None (a miss is only counted once read() fails too)."""
+        if not self.enabled:
+            return None
+        try:
+            with open(self._entry_path(url), encoding='utf-8') as f:
+                entry = CachedImage(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Ignoring unreadable image cache entry for {url[:100]}: {e}")
+            return None
+        # Two URLs can hash to the same entry file only by a SHA-256 collision; guard anyway
+        return entry if entry.url == url else None
+
+    def read(self, entry: CachedImage) -> Optional[bytes]:
+        """The cached bytes for entry, marking them recently used; None if evicted or corrupt."""
+        path = self._blob_path(entry.digest)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Error reading cached image {entry.digest}: {e}")
+            return None
+        if hashlib.sha256(content).hexdigest() != entry.digest:
+            print(f"Discarding corrupt cached image {entry.digest}")
+            self._remove(path)
+            return None
+        now = time.time()
+        for touched in (path, self._entry_path(entry.url)):
+            try:
+                os.utime(touched, (now, now))
+            except OSError:
+                pass
+        return content
+
+    def store(self, url: str, content: bytes, image_type: str, headers) -> Optional[CachedImage]:
+        """Cache a freshly downloaded image under url with the response's validators."""
+        if not self.enabled:
+            return None
+        lifetime = freshness_lifetime(headers, self.default_ttl)
+        if lifetime is None:
+            return None
+        digest = hashlib.sha256(content).hexdigest()
+        entry = CachedImage(url, digest, image_type, len(content), headers.get('ETag'),
+                            headers.get('Last-Modified'), lifetime, time.time() + lifetime)
+        try:
+            blob = self._blob_path(digest)
+            if os.path.exists(blob):
+                os.utime(blob)
+            else:
+                self._write_atomic(blob, content)
+                self._add_bytes(len(content))
+            self._write_entry(entry)
+        except OSError as e:
+            print(f"Error caching image {url[:100]}: {e}")
+            self._count('errors')
+            return None
+        self._count('stores')
+        if self._over_budget():
+            self.evict()
+        return entry
+
+    def refresh(self, entry: CachedImage, headers) -> CachedImage:
+        """Extend entry after a 304 Not Modified, taking any updated validators and lifetime."""
+        # Headers a 304 leaves out keep their stored values
+        lifetime = freshness_lifetime(headers, entry.lifetime) if headers.get('Cache-Control') else entry.lifetime
+        entry = entry._replace(etag=headers.get('ETag') or entry.etag,
+                               last_modified=headers.get('Last-Modified') or entry.last_modified,
+                               lifetime=lifetime or 0.0, fresh_until=time.time() + (lifetime or 0.0))
+        try:
+            self._write_entry(entry)
+        except OSError as e:
+            print(f"Error updating image cache entry for {entry.url[:100]}: {e}")
+        return entry
+
+    def _write_entry(self, entry):
+        self._write_atomic(self._entry_path(entry.url), json.dumps(entry._asdict()).encode('utf-8'))
+
+    @staticmethod
+    def _write_atomic(path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            BlobCache._remove(temp_path)
+            raise
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _scan(self, kind):
+        """(mtime, size, path) of every file under kind, removing stale temporary files."""
+        files = []
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for dirpath, _, filenames in os.walk(os.path.join(self.directory, kind)):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # removed by another process meanwhile
+                if name.startswith('.tmp-'):
+                    if st.st_mtime < stale_before:
+                        self._remove(path)
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _add_bytes(self, size):
+        with self._lock:
+            if self._approx_bytes is not None:
+                self._approx_bytes += size
+
+    def _over_budget(self):
+        with self._lock:
+            approx = self._approx_bytes
+        if approx is None:
+            # First store in this process: start from what the other workers left on disk
+            approx = sum(size for _, size, _ in self._scan('blobs'))
+            with self._lock:
+                self._approx_bytes = approx
+        return approx > self.max_bytes
+
+    def evict(self) -> int:
+        """
+        Delete least recently used blobs until they fit in EVICT_TO of the budget.
+
+        Other workers' stores only show up at a scan, so the disk can run over the budget
+        by what they stored since their own last scan. Safe to run concurrently.
+
+        Returns:
+            int: Number of blobs deleted
+        """
+        blobs = sorted(self._scan('blobs'))
+        total = sum(size for _, size, _ in blobs)
+        target = self.max_bytes * EVICT_TO
+        evicted, cutoff = 0, None
+        for mtime, size, path in blobs:
+            if total <= target:
+                break
+            if self._remove(path):
+                evicted += 1
+            total -= size
+            cutoff = mtime
+        if cutoff is not None:
+            # URL entries unused since the newest evicted blob are at least as stale; the
+            # ones still pointing at live blobs just cost a fetch on their next lookup
+            for mtime, _, path in self._scan('urls'):
+                if mtime <= cutoff:
+                    self._remove(path)
+        with self._lock:
+            self._approx_bytes = total
+            self.evictions += evicted
+        return evicted
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_hit(self, revalidated: bool = False):
+        self._count('revalidated' if revalidated else 'hits')
+
+    def record_miss(self):
+        self._count('misses')
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.revalidated = 0
+            self.misses = 0
+            self.stores = 0
+            self.evictions = 0
+            self.errors = 0
+
+    def stats(self) -> dict:
+        """Counters for this process since start (or the last reset_stats)."""
+        with self._lock:
+            served = self.hits + self.revalidated
+            lookups = served + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'hit_rate': served / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'errors': self.errors,
+                'approx_bytes': self._approx_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,46 @@
+"""
+Batched backfill of the binary hash_key / phash / whash columns on cached results.
+
+Each batch picks up rows whose hash_key is still NULL and commits on its own, so the
+job can be interrupted and re-run at any point and simply continues where it stopped.
+"""
+from .extensions import db
+from .models import BeautyResult
+
+
+def backfill_hash_keys(batch_size=1000):
+    """
+    Derive hash_key, phash and whash for rows cached before those columns existed.
+
+    Args:
+        batch_size: Rows loaded and committed per transaction
+
+    Returns:
+        int: Number of rows updated
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        batch = (BeautyResult.query
+                 .filter(BeautyResult.hash_key.is_(None), BeautyResult.id > last_id)
+                 .order_by(BeautyResult.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+
+        for result in batch:
+            result.derive_hash_columns()
+        last_id = batch[-1].id
+
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Backfill stopped at id {last_id}: {e}")
+            raise
+
+        updated += len(batch)
+        print(f"Backfilled hash keys for {updated} rows (through id {last_id})")
+
+    return updated
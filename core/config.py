@@ -1,7 +1,7 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 import cloudinary
-from openai import OpenAI
 
 load_dotenv()
 
@@ -10,7 +10,152 @@ class Config:
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+    # "warmup" loads the analysis stack (OpenAI client, hashing libraries, hash pool,
+    # near-duplicate index) before serving; "deferred" loads it on the first rating
+    # request, so auth-only workers start fast and never pay for it
+    STARTUP_MODE = os.getenv("STARTUP_MODE", "warmup")
+
+    # Near-duplicate cache lookup: max Hamming distance (out of 512 phash+whash bits)
+    # for a re-encoded/resized upload to reuse a cached BeautyResult
+    NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "24"))
+    # Each worker indexes the rows other workers stored at most this often (0 = never)
+    NEAR_DUPLICATE_REFRESH_SECONDS = float(os.getenv("NEAR_DUPLICATE_REFRESH_SECONDS", "5"))
+
+    # Hash profile for new cache keys: "full" (six components) or "fast" (phash + whash only)
+    HASH_PROFILE = os.getenv("HASH_PROFILE", "full")
+
+    # Image ingest: reject images declaring more pixels than this before decoding them,
+    # and decode JPEGs for hashing at the smallest DCT scale with at least this long edge.
+    # 0 (the default) decodes in full, keeping keys bit-identical to reference_image_hash.
+    # A reduced decode changes the hash_key of large JPEGs: rows hashed before it is turned
+    # on are then found only by the near-duplicate fallback until those images are re-rated
+    MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "64000000"))
+    HASH_DECODE_SIZE = int(os.getenv("HASH_DECODE_SIZE", "0"))
+
+    # Image download: connect/per-read/overall timeouts (seconds) and body size cap (bytes)
+    IMAGE_DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_CONNECT_TIMEOUT", "3.05"))
+    IMAGE_DOWNLOAD_READ_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_READ_TIMEOUT", "10"))
+    IMAGE_DOWNLOAD_TOTAL_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TOTAL_TIMEOUT", "20"))
+    IMAGE_DOWNLOAD_MAX_BYTES = int(os.getenv("IMAGE_DOWNLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+    # On-disk image cache shared by the workers on this host (empty dir or 0 bytes disables)
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "camelai-image-cache"))
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    IMAGE_CACHE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL_SECONDS", "3600"))  # when no Cache-Control max-age
+
+    # Shared keep-alive HTTP client for image downloads (HTTP/2 when the h2 package is installed)
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+    HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "30"))
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+    # Rating coroutines run on one long-lived event loop per worker with a pooled
+    # AsyncOpenAI client (see async_runtime.py); false = asyncio.run and a client per request
+    ASYNC_RUNTIME_ENABLED = os.getenv("ASYNC_RUNTIME_ENABLED", "true").lower() == "true"
+    ASYNC_RUNTIME_THREADS = int(os.getenv("ASYNC_RUNTIME_THREADS", "16"))  # asyncio.to_thread workers
+    ASYNC_RUNTIME_SHUTDOWN_SECONDS = float(os.getenv("ASYNC_RUNTIME_SHUTDOWN_SECONDS", "10"))
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "60"))
+    # Seconds one attempt of an async OpenAI call may take (the SDK default is 600) and
+    # may spend connecting; a timed-out attempt is retried by the scheduler
+    OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "60"))
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    # Scheduling of async OpenAI calls, per worker and model (see openai_scheduler.py):
+    # calls in flight, requests and tokens per minute (0 = not paced), and retries of
+    # 429s, timeouts and 5xx. OPENAI_MODEL_LIMITS overrides per model, as
+    # "model=concurrency/rpm/tpm,..."; divide the organization's limits by the worker count
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+    OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0"))
+    OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0"))
+    OPENAI_MODEL_LIMITS = os.getenv("OPENAI_MODEL_LIMITS", "")
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+    OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "0.5"))
+    OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "20"))
+    # Deadlines and hedging of the category calls (see hedging.py): seconds a call may take,
+    # retries and queueing included (0 = no limit), overridden per category as
+    # "head=45,combined=120". A call out of time fails the rating with 504. Without a deadline
+    # the scheduler's worst case is (OPENAI_MAX_RETRIES + 1) x OPENAI_REQUEST_TIMEOUT plus
+    # OPENAI_MAX_RETRIES x OPENAI_RETRY_MAX_SECONDS, 380 s with the defaults. The default
+    # deadline allows two timed-out attempts and every backoff (200 s), so a rate-limit storm
+    # still ends in the scheduler's 503 first. With HEDGE_ENABLED a call slower than its rolling
+    # p90 (at least HEDGE_MIN_DELAY_SECONDS) is sent again, for at most HEDGE_BUDGET_PERCENT extra calls
+    CATEGORY_DEADLINE_SECONDS = float(os.getenv(
+        "CATEGORY_DEADLINE_SECONDS", str(2 * OPENAI_REQUEST_TIMEOUT + OPENAI_MAX_RETRIES * OPENAI_RETRY_MAX_SECONDS)))
+    CATEGORY_DEADLINES = os.getenv("CATEGORY_DEADLINES", "")
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "2"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_BUDGET_PERCENT = float(os.getenv("HEDGE_BUDGET_PERCENT", "10"))
+    HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "10"))
+    # Per-call LLM telemetry (see llm_telemetry.py): a JSON log line per call, prices in
+    # USD per 1M input/cached/output tokens as "model=in/cached/out,..." over the built-in
+    # list prices, and a "debug" block of calls and timings in the rating and comparison
+    # responses when the request sends "debug": true and LLM_DEBUG_RESPONSE is on
+    LLM_TELEMETRY_LOG = os.getenv("LLM_TELEMETRY_LOG", "true").lower() == "true"
+    LLM_PRICES = os.getenv("LLM_PRICES", "")
+    LLM_DEBUG_RESPONSE = os.getenv("LLM_DEBUG_RESPONSE", "false").lower() == "true"
+    # Analysis requests one ASGI worker holds at once before answering 503 (see asgi.py)
+    ASGI_MAX_IN_FLIGHT = int(os.getenv("ASGI_MAX_IN_FLIGHT", "200"))
+
+    # How images reach the vision model: "url" lets OpenAI fetch the public URL on every
+    # call; "inline" sends the already-downloaded bytes, normalized once, as a data URL
+    IMAGE_INPUT_MODE = os.getenv("IMAGE_INPUT_MODE", "url")
+
+    # Inline derivative: capped to the resolution the model works at in high detail
+    # (fit in 2048px, short side 768px), EXIF-rotated, re-encoded at this JPEG quality
+    MODEL_IMAGE_LONG_EDGE = int(os.getenv("MODEL_IMAGE_LONG_EDGE", "2048"))
+    MODEL_IMAGE_SHORT_EDGE = int(os.getenv("MODEL_IMAGE_SHORT_EDGE", "768"))
+    MODEL_IMAGE_JPEG_QUALITY = int(os.getenv("MODEL_IMAGE_JPEG_QUALITY", "85"))
+
+    # Start the camel validation call while the image is still downloading and hashing;
+    # it is cancelled if the hash finds a stored result. URL mode only: inline images are
+    # prepared for the model after the cache lookups miss
+    SPECULATIVE_VALIDATION = os.getenv("SPECULATIVE_VALIDATION", "true").lower() == "true"
+    # Also start every category call alongside validation, cancelling them if the image
+    # fails it: saves a validation round trip per rating at the cost of wasted calls on
+    # rejected images (see the category_calls_* counters in /api/metrics)
+    SPECULATIVE_CATEGORIES = os.getenv("SPECULATIVE_CATEGORIES", "false").lower() == "true"
+    # How the beauty categories are scored: "fanout" makes one call per category,
+    # "combined" one structured-output call for all of them (benchmarks/category_engine.py)
+    CATEGORY_ENGINE = os.getenv("CATEGORY_ENGINE", "fanout").lower()
+    # Message layout of the category calls: "inline" splices the gender into the system
+    # prompt; "prefix" orders system prompt, reference images, gender and golden examples,
+    # target image, so calls share a cacheable prefix (prompt_loader.build_category_messages).
+    # /api/metrics "prompt_cache" shows the cached share of prompt tokens per category.
+    PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "inline").lower()
+
+    # Concurrent ratings of the same image share one analysis (see single_flight.py):
+    # followers wait up to COALESCE_WAIT_SECONDS for the leader's stored result; across
+    # workers the leader holds an analysis_leases row that expires after COALESCE_LEASE_SECONDS,
+    # renewed every third of that while the analysis runs
+    COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+    COALESCE_CROSS_PROCESS = os.getenv("COALESCE_CROSS_PROCESS", "true").lower() == "true"
+    COALESCE_WAIT_SECONDS = float(os.getenv("COALESCE_WAIT_SECONDS", "90"))
+    COALESCE_LEASE_SECONDS = float(os.getenv("COALESCE_LEASE_SECONDS", "120"))
+    COALESCE_POLL_SECONDS = float(os.getenv("COALESCE_POLL_SECONDS", "0.5"))
+
+    # CPU quality gate: reject unusable uploads before any model call (see quality_gate.py)
+    QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "true").lower() == "true"
+    QUALITY_MIN_SHORT_EDGE = int(os.getenv("QUALITY_MIN_SHORT_EDGE", "200"))  # pixels
+    QUALITY_MAX_ASPECT_RATIO = float(os.getenv("QUALITY_MAX_ASPECT_RATIO", "4.0"))
+    QUALITY_MIN_CONTRAST = float(os.getenv("QUALITY_MIN_CONTRAST", "8"))  # grayscale std dev
+    QUALITY_MAX_CLIPPED_FRACTION = float(os.getenv("QUALITY_MAX_CLIPPED_FRACTION", "0.9"))
+    QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "15"))  # Laplacian variance at 512px
+    QUALITY_MAX_FLAT_FRACTION = float(os.getenv("QUALITY_MAX_FLAT_FRACTION", "0.85"))  # equal neighbour pixels
+
+    # Vision "detail" per call type ("low", "high" or "auto"). Low is one 512px view at
+    # 85 tokens, enough to find a camel; scoring needs the full tiled image.
+    VALIDATION_IMAGE_DETAIL = os.getenv("VALIDATION_IMAGE_DETAIL", "low")
+    CATEGORY_IMAGE_DETAIL = os.getenv("CATEGORY_IMAGE_DETAIL", "high")
+
+    # Image hashing process pool (0 workers = hash in the request thread)
+    HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+    HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", "8"))  # Beyond this, hash in-thread
+    # forkserver or spawn; fork only if the pool starts before any thread (see hash_pool.py)
+    HASH_POOL_START_METHOD = os.getenv("HASH_POOL_START_METHOD", "forkserver")
+    HASH_TIMEOUT_SECONDS = float(os.getenv("HASH_TIMEOUT_SECONDS", "10"))
     
     # CORS Configuration - Allow all origins
     CORS_ORIGINS = ["*"]
@@ -44,3 +189,15 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET"),
     secure=True
 )
+
+
+_openai_client = None
+
+
+def get_openai_client():
+    """Shared synchronous OpenAI client, created on first use (importing openai takes ~1s)."""
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
+    return _openai_client
@@ -1,6 +1,16 @@
 # extensions.py
 from core.imports import CORS, Swagger, SQLAlchemy, Mail, Bcrypt, JWTManager, OAuth, Migrate
 from itsdangerous import URLSafeTimedSerializer
+from hash_index import NearDuplicateIndex
+from hash_pool import HashPool
+from http_client import PooledHttpClient
+from blob_cache import BlobCache
+from async_runtime import AsyncRuntime
+from openai_scheduler import OpenAIScheduler
+from llm_telemetry import LLMTelemetry
+from hedging import HedgedCalls
+from single_flight import SingleFlight
+from core.startup import Startup
 
 
 
@@ -11,4 +21,14 @@ swagger = Swagger()
 cors = CORS()
 bcrypt = Bcrypt()
 migrate = Migrate()
+near_duplicate_index = NearDuplicateIndex()
+hash_pool = HashPool()
+http_client = PooledHttpClient()
+image_cache = BlobCache()
+async_runtime = AsyncRuntime()
+llm_telemetry = LLMTelemetry()
+openai_scheduler = OpenAIScheduler(telemetry=llm_telemetry)
+hedged_calls = HedgedCalls()
+analysis_flights = SingleFlight()
+startup = Startup()
 serializer = URLSafeTimedSerializer("secret_key")
@@ -1,5 +1,7 @@
 from .extensions import db
 from datetime import datetime
+from sqlalchemy.orm import validates
+from hash_index import cache_key, perceptual_components
 
 class TempUser(db.Model):
     __tablename__ = 'temp_users'
@@ -33,7 +35,12 @@ class BeautyResult(db.Model):
     __tablename__ = 'beauty_results'
     
     id = db.Column(db.Integer, primary_key=True)
-    image_hash = db.Column(db.String(500), unique=True, nullable=False, index=True)
+    image_hash = db.Column(db.String(500), nullable=False)  # Raw combined hash; look rows up by hash_key
+    hash_key = db.Column(db.LargeBinary(32), unique=True, nullable=True, index=True)  # SHA-256 of image_hash
+    phash = db.Column(db.String(64), nullable=True)  # Perceptual components of image_hash (not indexed)
+    whash = db.Column(db.String(64), nullable=True)
+    hash_profile = db.Column(db.String(20), nullable=False, default='full', server_default='full')  # "fast" or "full"
+    content_digest = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the downloaded bytes
     image_url = db.Column(db.String(500), nullable=True)
     beauty_ratings = db.Column(db.JSON, nullable=True)  # Store the complete beauty analysis results (null for validation failures)
     overall_score = db.Column(db.Float, nullable=True)
@@ -48,9 +55,29 @@ class BeautyResult(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    @validates('image_hash')
+    def _set_image_hash(self, key, image_hash):
+        self.derive_hash_columns(image_hash)
+        return image_hash
+
+    def derive_hash_columns(self, image_hash=None):
+        """Fill hash_key, phash and whash from the combined image hash."""
+        image_hash = image_hash or self.image_hash
+        self.hash_key = cache_key(image_hash)
+        self.phash, self.whash = perceptual_components(image_hash)
+
     def __repr__(self):
         return f'<BeautyResult {self.id}: {self.image_hash[:16]}...>'
 
+class AnalysisLease(db.Model):
+    """An image being analyzed by some worker; the other workers wait for its result (see single_flight.py)."""
+    __tablename__ = 'analysis_leases'
+
+    hash_key = db.Column(db.LargeBinary(32), primary_key=True)  # BeautyResult.hash_key of the image
+    owner = db.Column(db.String(100), nullable=False)  # host:pid of the leading worker
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
 class RatingFeedback(db.Model):
     __tablename__ = 'rating_feedback'
     
@@ -0,0 +1,98 @@
+"""
+Startup modes and cold-start timing.
+
+The analysis stack (openai, numpy/scipy/OpenCV/imagehash, the hash worker processes
+and the near-duplicate index) takes seconds to load, but only the rating endpoints
+need it. In "warmup" mode it is loaded before the worker serves anything, so the
+first rating request does not pay for it. In "deferred" mode it is loaded by the
+first request that calls ensure_ready(), so auth-only workers never load it.
+
+Either way the time from process start to the first response of each endpoint is
+printed and kept in `timings`.
+"""
+import multiprocessing
+import threading
+import time
+
+# Imported first thing by main.py, so this is close to interpreter start
+PROCESS_START = time.perf_counter()
+
+STARTUP_MODES = ('warmup', 'deferred')
+
+
+def _since_start_ms():
+    return (time.perf_counter() - PROCESS_START) * 1000
+
+
+class Startup:
+    """Runs the analysis-stack loaders once, at warmup or on first use, and times cold start."""
+
+    def __init__(self):
+        self.mode = 'warmup'
+        self.timings = {'loaders': {}, 'first_requests': {}}
+        self._loaders = []
+        self._ready = False
+        self._lock = threading.Lock()
+        self._seen_endpoints = set()
+
+    def init_app(self, app, loaders):
+        """
+        Register the loaders and the first-request timing hooks.
+
+        Args:
+            app: Flask app
+            loaders: (name, callable) pairs run in order by ensure_ready
+        """
+        from flask import g, request
+
+        self.mode = app.config.get("STARTUP_MODE", self.mode)
+        if self.mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown STARTUP_MODE: {self.mode}")
+        self._loaders = list(loaders)
+
+        @app.before_request
+        def _mark_request_start():
+            g.startup_request_start = time.perf_counter()
+
+        @app.after_request
+        def _record_first_request(response):
+            endpoint = request.endpoint or request.path
+            if endpoint not in self._seen_endpoints and 'startup_request_start' in g:
+                self._seen_endpoints.add(endpoint)
+                latency_ms = (time.perf_counter() - g.startup_request_start) * 1000
+                self.timings['first_requests'][endpoint] = {
+                    'since_start_ms': _since_start_ms(),
+                    'latency_ms': latency_ms,
+                }
+                print(f"First {endpoint} request ({self.mode} startup): {latency_ms:.0f} ms, "
+                      f"{_since_start_ms():.0f} ms after process start")
+            return response
+
+        # Hash workers started with spawn/forkserver import a main.py run as a script again;
+        # they need none of the analysis stack's loaders
+        if self.mode == 'warmup' and multiprocessing.current_process().name == 'MainProcess':
+            self.ensure_ready()
+
+        self.timings['app_ready_ms'] = _since_start_ms()
+        print(f"App ready in {self.timings['app_ready_ms']:.0f} ms ({self.mode} startup)")
+
+    def ensure_ready(self):
+        """Run every loader once. Cheap after the first call; safe to call from any request."""
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            start = time.perf_counter()
+            for name, loader in self._loaders:
+                loader_start = time.perf_counter()
+                try:
+                    loader()
+                except Exception as e:
+                    # The request path still works without a warm stack, just slower
+                    print(f"Startup loader {name} failed: {e}")
+                self.timings['loaders'][name] = (time.perf_counter() - loader_start) * 1000
+            self.timings['analysis_stack_ms'] = (time.perf_counter() - start) * 1000
+            self._ready = True
+        print(f"Analysis stack loaded in {self.timings['analysis_stack_ms']:.0f} ms: "
+              + ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings['loaders'].items()))
@@ -0,0 +1,214 @@
+import hashlib
+import threading
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# The first two components of a combined image hash are the 16x16 phash and
+# whash, each rendered as 64 hex characters (256 bits).
+PERCEPTUAL_COMPONENTS = 2
+COMPONENT_HEX_LENGTH = 64
+PERCEPTUAL_BITS = PERCEPTUAL_COMPONENTS * COMPONENT_HEX_LENGTH * 4
+# Most rows read from the database by one refresh
+REFRESH_BATCH = 1000
+
+
+def cache_key(image_hash: str) -> bytes:
+    """Fixed-width (32-byte) lookup key for a combined image hash."""
+    return hashlib.sha256(image_hash.encode('ascii')).digest()
+
+
+def perceptual_components(image_hash: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return the (phash, whash) hex components of a combined image hash, or (None, None)."""
+    components = (image_hash or '').split('_')
+    perceptual = components[:PERCEPTUAL_COMPONENTS]
+    if len(perceptual) < PERCEPTUAL_COMPONENTS or any(len(c) != COMPONENT_HEX_LENGTH for c in perceptual):
+        return None, None
+    return perceptual[0], perceptual[1]
+
+
+def perceptual_key(image_hash: str) -> Optional[int]:
+    """
+    Extract the phash and whash components of a combined image hash as one integer.
+
+    Args:
+        image_hash: Underscore-joined hash string produced by generate_image_hash
+
+    Returns:
+        int: 512-bit key, or None if the hash does not have the expected layout
+    """
+    phash, whash = perceptual_components(image_hash)
+    if phash is None:
+        return None
+
+    try:
+        return int(phash + whash, 16)
+    except ValueError:
+        return None
+
+
+class NearDuplicateIndex:
+    """
+    Multi-index hashing over the perceptual part of cached image hashes.
+
+    The 512-bit key is split into max_distance + 1 disjoint chunks, so any key
+    within max_distance bits of a query shares at least one chunk exactly with it
+    (pigeonhole principle). Lookups are therefore a handful of dict probes plus a
+    popcount per candidate instead of a scan over every cached result.
+
+    Each worker process keeps its own index. Results it stores are added directly;
+    results stored by other workers are picked up by refresh(), which reads rows by id
+    past the last ones indexed, at most every refresh_seconds.
+    """
+
+    def __init__(self, max_distance: int = 24, refresh_seconds: float = 5.0):
+        self._lock = threading.RLock()
+        self.refresh_seconds = refresh_seconds
+        self._indexed_through = 0  # Highest result id read from the database
+        self._reread_from = 0  # Where the next refresh starts reading
+        self._next_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._configure(max_distance)
+
+    def _configure(self, max_distance: int):
+        self.max_distance = max(0, int(max_distance))
+        num_chunks = min(self.max_distance + 1, PERCEPTUAL_BITS)
+
+        # Spread the bits as evenly as possible across the chunks
+        base_width, extra = divmod(PERCEPTUAL_BITS, num_chunks)
+        self._chunks = []
+        shift = 0
+        for i in range(num_chunks):
+            width = base_width + (1 if i < extra else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+
+        self._tables = [{} for _ in self._chunks]  # type: list[Dict[int, Set[int]]]
+        self._keys = {}  # type: Dict[int, int]
+
+    def init_app(self, app):
+        """Configure the index from app config. Cached results are loaded by load_from_database."""
+        with self._lock:
+            self._configure(app.config.get("NEAR_DUPLICATE_MAX_DISTANCE", self.max_distance))
+        self.refresh_seconds = app.config.get("NEAR_DUPLICATE_REFRESH_SECONDS", self.refresh_seconds)
+
+    def load_from_database(self, app):
+        """Index every cached result already in the database."""
+        with app.app_context():
+            try:
+                from core.models import BeautyResult
+                rows = BeautyResult.query.with_entities(BeautyResult.id, BeautyResult.image_hash).yield_per(1000)
+                loaded = self.load(rows, from_database=True)
+                self._reread_from = self._indexed_through
+                print(f"Loaded {loaded} cached image hashes into near-duplicate index")
+            except Exception as e:
+                # Table may not exist yet (fresh database or pending migration)
+                print(f"Near-duplicate index not loaded: {e}")
+                from core.extensions import db
+                db.session.rollback()
+
+    def load(self, rows: Iterable[Tuple[int, str]], from_database: bool = False) -> int:
+        """Bulk-add (result_id, image_hash) pairs. Returns the number indexed."""
+        loaded = 0
+        for result_id, image_hash in rows:
+            if from_database:
+                self._indexed_through = max(self._indexed_through, result_id)
+            if self.add(result_id, image_hash):
+                loaded += 1
+        return loaded
+
+    def refresh(self) -> int:
+        """
+        Index results other workers stored since the last refresh. Needs an app context.
+
+        Runs at most every refresh_seconds (0 disables it) and reads up to REFRESH_BATCH
+        rows in id order. The rows of the previous refresh are read again, so an id that
+        committed after a higher one is still picked up. Returns the number indexed.
+        """
+        if self.refresh_seconds <= 0 or time.monotonic() < self._next_refresh:
+            return 0
+        if not self._refresh_lock.acquire(blocking=False):
+            # Another request is refreshing; this one uses the index as it is
+            return 0
+        try:
+            self._next_refresh = time.monotonic() + self.refresh_seconds
+            from core.models import BeautyResult
+            reread_from, indexed_through = self._reread_from, self._indexed_through
+            rows = (BeautyResult.query
+                    .with_entities(BeautyResult.id, BeautyResult.image_hash)
+                    .filter(BeautyResult.id > reread_from)
+                    .order_by(BeautyResult.id)
+                    .limit(REFRESH_BATCH)
+                    .all())
+            loaded = self.load(rows, from_database=True)
+            # A full batch may not have reached indexed_through yet
+            self._reread_from = min(indexed_through, self._indexed_through)
+            return loaded
+        finally:
+            self._refresh_lock.release()
+
+    def add(self, result_id: int, image_hash: str) -> bool:
+        """Index a cached result. Returns False if the hash has no perceptual part."""
+        key = perceptual_key(image_hash)
+        if key is None:
+            return False
+
+        with self._lock:
+            if result_id in self._keys:
+                self._discard(result_id)
+            self._keys[result_id] = key
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((key >> shift) & mask, set()).add(result_id)
+        return True
+
+    def remove(self, result_id: int):
+        """Drop a cached result from the index."""
+        with self._lock:
+            self._discard(result_id)
+
+    def _discard(self, result_id: int):
+        key = self._keys.pop(result_id, None)
+        if key is None:
+            return
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            chunk = (key >> shift) & mask
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(result_id)
+                if not bucket:
+                    del table[chunk]
+
+    def find(self, image_hash: str, max_distance: int = None) -> Optional[Tuple[int, int]]:
+        """
+        Find the closest cached result within max_distance bits of image_hash.
+
+        Args:
+            image_hash: Combined hash of the image being looked up
+            max_distance: Search radius, capped at the radius the index was built for
+
+        Returns:
+            tuple: (result_id, distance) of the best match, or None if nothing is close enough
+        """
+        key = perceptual_key(image_hash)
+        if key is None:
+            return None
+
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        best = None
+        with self._lock:
+            candidates = set()
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                bucket = table.get((key >> shift) & mask)
+                if bucket:
+                    candidates.update(bucket)
+
+            for result_id in candidates:
+                distance = (self._keys[result_id] ^ key).bit_count()
+                if distance <= max_distance and (best is None or (distance, result_id) < best[::-1]):
+                    best = (result_id, distance)
+
+        return best
+
+    def __len__(self):
+        return len(self._keys)
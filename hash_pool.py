@@ -0,0 +1,192 @@
+"""
+Process pool for CPU-bound image hashing.
+
+OpenCV, the DCT/wavelet transforms and the crop-resistant segmentation hold the GIL
+for most of a hash, so running them in the request thread stalls every other request
+in the same worker. The pool moves them into pre-warmed worker processes; the calling
+thread only waits on a future, which releases the GIL.
+
+Workers are started with forkserver by default: the web worker runs the async runtime's
+loop and executor threads, and forking a process whose other threads may hold locks can
+deadlock the child. The fork server is a fresh single-threaded process that imports the
+hashing stack once and forks the workers from there. With HASH_POOL_START_METHOD=fork
+the pool must start before any thread does; once other threads run it falls back to
+forkserver. A broken pool is replaced from a background thread, never by forking from
+a request, and hashes run in-thread until it is back.
+"""
+import asyncio
+import atexit
+import importlib
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from image_ingest import DEFAULT_MAX_IMAGE_PIXELS
+
+
+# Imported by the fork server (and by each worker) instead of on a worker's first task
+HASHING_MODULES = ['cv2', 'numpy', 'imagehash', 'pywt', 'scipy.fftpack', 'scipy.ndimage']
+
+
+def _warm_worker():
+    """Import the hashing stack once per worker; a no-op when the fork server already has it."""
+    for module in HASHING_MODULES:
+        importlib.import_module(module)
+
+
+def warm_hashing_stack():
+    """Import the hashing stack in this process, for in-thread hashes and forked workers."""
+    _warm_worker()
+
+
+def _ping():
+    return True
+
+
+def _hash_bytes(image_bytes, profile=None, options=None):
+    # Imported here so processes that never hash (auth-only workers) never load numpy/imagehash
+    from image_hashing import generate_image_hash, DEFAULT_HASH_PROFILE
+    return generate_image_hash(io.BytesIO(image_bytes), profile or DEFAULT_HASH_PROFILE, **(options or {}))
+
+
+class HashPool:
+    """
+    Bounded, pre-warmed ProcessPoolExecutor for generate_image_hash.
+
+    At most max_pending hashes are queued or running in the pool; beyond that the
+    caller hashes in its own thread rather than queueing behind a burst. With zero
+    workers every hash runs in-thread.
+    """
+
+    def __init__(self, workers: int = 0, max_pending: int = 0, timeout: float = 10.0, start_method: str = "forkserver"):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.timeout = timeout
+        self.start_method = start_method
+        self.hash_options = {}  # decode_size / max_pixels passed to generate_image_hash
+        self._executor = None
+        self._slots = None
+        self._restarting = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure from app config. Workers start with start(), at warmup or on first use."""
+        self.workers = app.config.get("HASH_POOL_WORKERS", self.workers)
+        self.max_pending = app.config.get("HASH_POOL_MAX_PENDING") or self.workers * 2
+        self.timeout = app.config.get("HASH_TIMEOUT_SECONDS", self.timeout)
+        self.start_method = app.config.get("HASH_POOL_START_METHOD", self.start_method)
+        self.hash_options = {
+            "decode_size": app.config.get("HASH_DECODE_SIZE") or None,
+            "max_pixels": app.config.get("MAX_IMAGE_PIXELS", DEFAULT_MAX_IMAGE_PIXELS),
+        }
+        atexit.register(self.shutdown)
+
+    def start(self):
+        """Create the executor and spawn every worker so the first request does not pay for it."""
+        with self._lock:
+            if self._executor is not None or self.workers <= 0:
+                return
+            if multiprocessing.current_process().name != "MainProcess":
+                # A worker importing the main script again; workers hash in their own thread
+                return
+            start_method = self.start_method
+            if start_method == "fork" and threading.active_count() > 1:
+                print("Hash pool: other threads are running, starting workers with forkserver instead of fork")
+                start_method = "forkserver"
+            context = multiprocessing.get_context(start_method)
+            if start_method == "forkserver":
+                context.set_forkserver_preload(HASHING_MODULES)
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_warm_worker,
+            )
+            executor = self._executor
+
+        try:
+            warmups = [executor.submit(_ping) for _ in range(self.workers)]
+            for future in warmups:
+                future.result(timeout=60)
+            print(f"Hash pool started with {self.workers} workers")
+        except Exception as e:
+            print(f"Hash pool warmup failed, hashing in-thread: {e}")
+            self.shutdown()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, image_bytes: bytes, profile: str = None):
+        """
+        Queue a hash in the pool.
+
+        Returns:
+            Future resolving to the hash string, or None if the pool is disabled or saturated
+        """
+        executor, slots = self._executor, self._slots
+        if executor is None or not slots.acquire(blocking=False):
+            return None
+
+        try:
+            future = executor.submit(_hash_bytes, image_bytes, profile, self.hash_options)
+        except (BrokenProcessPool, RuntimeError) as e:
+            slots.release()
+            self._restart(e)
+            return None
+
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def hash_image(self, image_bytes: bytes, profile: str = None, timeout: float = None):
+        """Hash image bytes, blocking the caller without holding the GIL. Returns None on failure."""
+        future = self.submit(image_bytes, profile)
+        if future is None:
+            return _hash_bytes(image_bytes, profile, self.hash_options)
+
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            print(f"Image hashing timed out after {timeout or self.timeout}s")
+            return None
+        except BrokenProcessPool as e:
+            self._restart(e)
+            return _hash_bytes(image_bytes, profile, self.hash_options)
+
+    async def hash_image_async(self, image_bytes: bytes, profile: str = None, timeout: float = None):
+        """Awaitable variant of hash_image for use inside the rating pipeline's event loop."""
+        future = self.submit(image_bytes, profile)
+        if future is None:
+            return await asyncio.to_thread(_hash_bytes, image_bytes, profile, self.hash_options)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            print(f"Image hashing timed out after {timeout or self.timeout}s")
+            return None
+        except BrokenProcessPool as e:
+            self._restart(e)
+            return await asyncio.to_thread(_hash_bytes, image_bytes, profile, self.hash_options)
+
+    def _restart(self, error):
+        """Drop a broken pool and start a new one in the background; callers hash in-thread."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if self._restarting:
+                return
+            self._restarting = True
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        print(f"Hash pool broken, restarting in the background: {error}")
+        threading.Thread(target=self._start_again, name="hash-pool-restart", daemon=True).start()
+
+    def _start_again(self):
+        try:
+            self.start()
+        finally:
+            self._restarting = False
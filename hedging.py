@@ -0,0 +1,208 @@
+"""
+Deadlines and hedged requests for the category calls.
+
+The slowest category call sets the latency of a rating, and none of them had a time
+limit: the SDK's own timeout is ten minutes, so one stalled completion held the request
+that long. HedgedCalls.call() runs a call with
+
+    - a deadline (CATEGORY_DEADLINE_SECONDS, per label in CATEGORY_DEADLINES as
+      "head=45,combined=120"; 0 = none), after which every attempt is cancelled and
+      CallDeadlineError raised; like OpenAIUnavailableError it fails the whole rating
+      (504) rather than scoring the category 0, so no partial result is stored. The
+      deadline includes the scheduler's queueing and retries; by default it allows two
+      timed-out attempts (OPENAI_REQUEST_TIMEOUT) and every backoff,
+    - with HEDGE_ENABLED, a hedge: once the call has run longer than the rolling p90
+      latency of its model and label (at least HEDGE_MIN_DELAY_SECONDS, and only after
+      HEDGE_MIN_SAMPLES calls), an identical second attempt is sent and whichever
+      answers first is used; the other is cancelled.
+
+Hedges are paid in full, so they are capped by a budget: each call earns
+HEDGE_BUDGET_PERCENT of a hedge, and a hedge spends one (at most HEDGE_BUDGET_BURST are
+saved up). A call whose attempt fails waits for its other attempt, if any; errors are
+not hedged, the scheduler already retries them.
+
+The latency samples are what the requests saw, hedges included, so hedging lowers
+the p90 it triggers on; the budget keeps that from running away. Counters are per
+worker, like the scheduler's limits.
+"""
+import asyncio
+import collections
+import threading
+import time
+
+# Recent latencies kept per model and label for percentiles
+LATENCY_WINDOW = 500
+
+
+class CallDeadlineError(Exception):
+    """A call that had no answer by its deadline."""
+
+    def __init__(self, label: str, deadline: float):
+        super().__init__(f"{label} call exceeded its {deadline:g}s deadline")
+        self.label = label
+        self.deadline = deadline
+
+
+def parse_deadlines(value: str) -> dict:
+    """Parse CATEGORY_DEADLINES, e.g. "head=45,combined=120" (seconds)."""
+    deadlines = {}
+    for entry in filter(None, (part.strip() for part in (value or '').split(','))):
+        label, _, seconds = entry.partition('=')
+        deadlines[label.strip()] = float(seconds)
+    return deadlines
+
+
+def percentile(ordered: list, q: float):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+class CallLatency:
+    """Recent latencies and hedge counters of one model and label."""
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedges_denied = 0
+        self.deadline_exceeded = 0
+        self.failed = 0
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+        p50, p90, p99 = (percentile(ordered, q) for q in (0.5, 0.9, 0.99))
+        return {
+            'calls': self.calls,
+            'p50_ms': round(p50, 1) if p50 is not None else None,
+            'p90_ms': round(p90, 1) if p90 is not None else None,
+            'p99_ms': round(p99, 1) if p99 is not None else None,
+            'hedged': self.hedged,
+            'hedge_rate': round(self.hedged / self.calls, 3) if self.calls else 0.0,
+            'hedge_wins': self.hedge_wins,
+            'hedges_denied': self.hedges_denied,  # Over the budget
+            'deadline_exceeded': self.deadline_exceeded,
+            'failed': self.failed,
+        }
+
+
+class HedgedCalls:
+    """Per-call deadlines, and hedging of slow calls within a budget."""
+
+    def __init__(self, deadline_seconds: float = 0.0, deadlines: dict = None, hedge_enabled: bool = False,
+                 hedge_min_delay: float = 2.0, hedge_min_samples: int = 20, hedge_budget_percent: float = 10.0,
+                 hedge_budget_burst: float = 10.0):
+        self.deadline_seconds = deadline_seconds
+        self.deadlines = deadlines or {}
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_budget_percent = hedge_budget_percent
+        self.hedge_budget_burst = hedge_budget_burst
+        self._credit = 0.0  # Hedges the budget allows now
+        self._latency = collections.defaultdict(CallLatency)  # (model, label) -> latency
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.deadline_seconds = app.config.get("CATEGORY_DEADLINE_SECONDS", self.deadline_seconds)
+        self.deadlines = parse_deadlines(app.config.get("CATEGORY_DEADLINES", ""))
+        self.hedge_enabled = app.config.get("HEDGE_ENABLED", self.hedge_enabled)
+        self.hedge_min_delay = app.config.get("HEDGE_MIN_DELAY_SECONDS", self.hedge_min_delay)
+        self.hedge_min_samples = app.config.get("HEDGE_MIN_SAMPLES", self.hedge_min_samples)
+        self.hedge_budget_percent = app.config.get("HEDGE_BUDGET_PERCENT", self.hedge_budget_percent)
+        self.hedge_budget_burst = app.config.get("HEDGE_BUDGET_BURST", self.hedge_budget_burst)
+
+    def deadline(self, label: str) -> float:
+        return self.deadlines.get(label, self.deadline_seconds)
+
+    def hedge_delay(self, model: str, label: str):
+        """Seconds after which a call is hedged, or None while there are too few samples."""
+        if not self.hedge_enabled:
+            return None
+        with self._lock:
+            samples = self._latency[(model, label)].samples
+            if len(samples) < max(1, self.hedge_min_samples):
+                return None
+            p90 = percentile(sorted(samples), 0.9)
+        return max(self.hedge_min_delay, p90 / 1000)
+
+    def _spend_hedge(self, latency: CallLatency) -> bool:
+        with self._lock:
+            if self._credit < 1:
+                latency.hedges_denied += 1
+                return False
+            self._credit -= 1
+            latency.hedged += 1
+            return True
+
+    async def call(self, label: str, make_call, model: str = None):
+        """
+        Await make_call() with the label's deadline, hedging it if it runs slow.
+
+        Args:
+            label: What the call is for (the category), for its deadline and latency
+            make_call: Returns a new awaitable of the call; called again for a hedge
+            model: The call's model, which latencies are kept per
+
+        Returns:
+            The first attempt's result
+
+        Raises:
+            CallDeadlineError: No attempt answered by the deadline
+            Exception: What the call raised, once no attempt is left running
+        """
+        with self._lock:
+            latency = self._latency[(model, label)]
+            latency.calls += 1
+            self._credit = min(self.hedge_budget_burst, self._credit + self.hedge_budget_percent / 100)
+        start = time.monotonic()
+        deadline = self.deadline(label)
+        deadline_at = start + deadline if deadline > 0 else None
+        hedge_delay = self.hedge_delay(model, label)
+        hedge_at = start + hedge_delay if hedge_delay is not None else None
+        primary = asyncio.ensure_future(make_call())
+        attempts = [primary]
+        error = None
+        try:
+            while True:
+                wake_at = min((at for at in (deadline_at, hedge_at) if at is not None), default=None)
+                timeout = max(0.0, wake_at - time.monotonic()) if wake_at is not None else None
+                done, _ = await asyncio.wait([attempt for attempt in attempts if not attempt.done()],
+                                             timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        with self._lock:
+                            latency.samples.append((time.monotonic() - start) * 1000)
+                            latency.hedge_wins += attempt is not primary
+                        return attempt.result()
+                    error = error or attempt.exception()
+                if all(attempt.done() for attempt in attempts):
+                    with self._lock:
+                        latency.failed += 1
+                    raise error
+                now = time.monotonic()
+                if deadline_at is not None and now >= deadline_at:
+                    with self._lock:
+                        latency.deadline_exceeded += 1
+                        # A stall is a slow call: it counts toward the p90
+                        latency.samples.append(deadline * 1000)
+                    raise CallDeadlineError(label, deadline)
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if self._spend_hedge(latency):
+                        attempts.append(asyncio.ensure_future(make_call()))
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    def reset_stats(self):
+        with self._lock:
+            self._latency.clear()
+            self._credit = 0.0
+
+    def stats(self) -> dict:
+        """Per model, then per label: latency percentiles, hedge rate and deadlines exceeded."""
+        with self._lock:
+            models = collections.defaultdict(dict)
+            for (model, label), latency in sorted(self._latency.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+                models[model or 'default'][label] = latency.snapshot()
+            return dict(models)
@@ -0,0 +1,349 @@
+"""
+Process-wide pooled HTTP client for fetching images.
+
+One httpx client per process keeps connections to the image hosts (Cloudinary,
+ufs.sh) alive between requests, so a download costs a request round trip instead of
+a fresh TCP + TLS handshake. HTTP/2 is negotiated when the h2 package is installed.
+httpx only limits connections pool-wide, so per-host slots cap how many connections
+one host can hold. The slots are process-wide, shared by threads and by every event
+loop (the async runtime's and the ASGI server's). Redirects are followed here rather
+than by httpx, so each hop holds a slot of the host it goes to.
+
+AsyncClient connections belong to the event loop that opened them, so the async
+variant keeps one client per running loop.
+
+Connection reuse is measured with httpx's trace extension: every request counts,
+and so does every new TCP connection, so reused = requests - connections opened.
+"""
+import asyncio
+import atexit
+import collections
+import contextlib
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+# Recent request latencies kept for percentiles
+LATENCY_WINDOW = 1000
+# Redirect hops followed per request, as httpx's default
+MAX_REDIRECTS = 20
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _host(url) -> str:
+    return urlsplit(str(url)).netloc
+
+
+class _SlotWaiter:
+    """A thread (event) or a coroutine (loop, future) waiting for a host slot."""
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+    def wake(self) -> bool:
+        """Tell the waiter it holds the slot; False if its event loop has closed."""
+        if self.event is not None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(self._set, self.future)
+            return True
+        except RuntimeError:
+            return False
+
+    @staticmethod
+    def _set(future):
+        if not future.done():
+            future.set_result(None)
+
+
+class HostSlots:
+    """Connection slots of one host, shared by the threads and event loops of the process."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _take_or_queue(self, waiter):
+        """Take a free slot (True), or queue the waiter behind the others (False)."""
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _give_up(self, waiter) -> bool:
+        """Leave the queue; True if the slot was handed over meanwhile and is now the caller's."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for a slot."""
+        waiter = _SlotWaiter(event=threading.Event())
+        if self._take_or_queue(waiter):
+            return True
+        return waiter.event.wait(timeout) or self._give_up(waiter)
+
+    async def acquire_async(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for a slot without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        waiter = _SlotWaiter(loop=loop, future=loop.create_future())
+        if self._take_or_queue(waiter):
+            return True
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        """Hand the slot to the first waiter, or free it."""
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self.in_use -= 1
+                    return
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+            if waiter.wake():
+                return
+            # Its loop is gone: the slot goes to the next waiter
+
+
+class PooledHttpClient:
+    """Shared keep-alive HTTP client with per-host connection limits and reuse/latency stats."""
+
+    def __init__(self, max_connections: int = 100, max_per_host: int = 10, keepalive_expiry: float = 30.0,
+                 http2: bool = True):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncClient
+        self._host_slots = {}  # host -> HostSlots, for every thread and event loop
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        """Configure from app config and close the connections at worker shutdown."""
+        self.max_connections = app.config.get("HTTP_MAX_CONNECTIONS", self.max_connections)
+        self.max_per_host = app.config.get("HTTP_MAX_CONNECTIONS_PER_HOST", self.max_per_host)
+        self.keepalive_expiry = app.config.get("HTTP_KEEPALIVE_SECONDS", self.keepalive_expiry)
+        self.http2 = app.config.get("HTTP2_ENABLED", self.http2)
+        atexit.register(self.close)
+
+    def _client_options(self):
+        import httpx
+        return {
+            'limits': httpx.Limits(max_connections=self.max_connections,
+                                   max_keepalive_connections=self.max_connections,
+                                   keepalive_expiry=self.keepalive_expiry),
+            'http2': self.http2 and _http2_available(),
+            'follow_redirects': False,  # Followed by stream(), a host slot per hop
+        }
+
+    @property
+    def client(self):
+        """The process-wide httpx.Client, created on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    self._client = httpx.Client(**self._client_options())
+        return self._client
+
+    def async_client(self):
+        """The httpx.AsyncClient for the running event loop, created on first use."""
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = httpx.AsyncClient(**self._client_options())
+        return client
+
+    @contextlib.contextmanager
+    def stream(self, url: str, timeout, headers: dict = None):
+        """
+        GET url as a streamed response, holding one of the host's connection slots.
+
+        Args:
+            url: URL to fetch
+            timeout: httpx.Timeout (or seconds) for connect, read and pool waits
+            headers: Extra request headers (e.g. conditional request validators)
+
+        Yields:
+            httpx.Response with the body not yet read
+        """
+        import httpx
+        timeout = timeout if isinstance(timeout, httpx.Timeout) else httpx.Timeout(timeout)
+        request = self.client.build_request('GET', url, timeout=timeout, headers=headers,
+                                            extensions={'trace': self._trace})
+        start = time.perf_counter()
+        for _ in range(MAX_REDIRECTS + 1):
+            slots = self._slots_for(request.url)
+            if not slots.acquire(timeout.pool or timeout.connect):
+                raise httpx.PoolTimeout(f"No free connection slot for {request.url.host}")
+            try:
+                response = self.client.send(request, stream=True)
+            except BaseException as e:
+                slots.release()
+                if isinstance(e, httpx.HTTPError):
+                    self._record_error()
+                raise
+            if response.next_request is None:
+                break
+            # A redirect: the next hop waits for a slot of its own host
+            request = response.next_request
+            response.close()
+            slots.release()
+        else:
+            self._record_error()
+            raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.", request=request)
+        try:
+            self._record_response(start)
+            yield response
+        except httpx.HTTPError:
+            self._record_error()
+            raise
+        finally:
+            response.close()
+            slots.release()
+
+    @contextlib.asynccontextmanager
+    async def astream(self, url: str, timeout, headers: dict = None):
+        """Async variant of stream() for use inside the rating pipeline's event loop."""
+        import httpx
+        timeout = timeout if isinstance(timeout, httpx.Timeout) else httpx.Timeout(timeout)
+        client = self.async_client()
+        request = client.build_request('GET', url, timeout=timeout, headers=headers,
+                                       extensions={'trace': self._atrace})
+        start = time.perf_counter()
+        for _ in range(MAX_REDIRECTS + 1):
+            slots = self._slots_for(request.url)
+            if not await slots.acquire_async(timeout.pool or timeout.connect):
+                raise httpx.PoolTimeout(f"No free connection slot for {request.url.host}")
+            try:
+                response = await client.send(request, stream=True)
+            except BaseException as e:
+                slots.release()
+                if isinstance(e, httpx.HTTPError):
+                    self._record_error()
+                raise
+            if response.next_request is None:
+                break
+            request = response.next_request
+            await response.aclose()
+            slots.release()
+        else:
+            self._record_error()
+            raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.", request=request)
+        try:
+            self._record_response(start)
+            yield response
+        except httpx.HTTPError:
+            self._record_error()
+            raise
+        finally:
+            await response.aclose()
+            slots.release()
+
+    def _slots_for(self, url) -> HostSlots:
+        host = _host(url)
+        with self._lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = self._host_slots[host] = HostSlots(self.max_per_host)
+        return slots
+
+    def _trace(self, event, info):
+        if event == 'connection.connect_tcp.complete':
+            with self._stats_lock:
+                self._connections_opened += 1
+        elif event.endswith('.send_request_headers.started'):
+            with self._stats_lock:
+                self._requests += 1
+
+    async def _atrace(self, event, info):
+        self._trace(event, info)
+
+    def _record_response(self, start):
+        with self._stats_lock:
+            self._latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    def _record_error(self):
+        with self._stats_lock:
+            self._errors += 1
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._requests = 0
+            self._connections_opened = 0
+            self._errors = 0
+            self._latencies_ms = collections.deque(maxlen=LATENCY_WINDOW)
+
+    def reset_stats(self):
+        self._reset_stats()
+
+    def stats(self) -> dict:
+        """
+        Connection-reuse and latency counters since start (or the last reset_stats).
+
+        Latency is time to response headers over the last LATENCY_WINDOW requests.
+        """
+        with self._stats_lock:
+            latencies = sorted(self._latencies_ms)
+            requests_sent, opened = self._requests, self._connections_opened
+            errors = self._errors
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else None
+
+        return {
+            'requests': requests_sent,
+            'connections_opened': opened,
+            'connections_reused': max(0, requests_sent - opened),
+            'reuse_rate': (requests_sent - opened) / requests_sent if requests_sent else 0.0,
+            'errors': errors,
+            'http2': self.http2 and _http2_available(),
+            'latency_ms': {'p50': percentile(0.50), 'p95': percentile(0.95), 'max': latencies[-1] if latencies else None},
+        }
+
+    async def aclose(self):
+        """Close the running loop's AsyncClient (call before the loop itself closes)."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        """Close the sync client. Async clients whose loop is still running are closed by aclose."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+        for loop in list(self._async_clients):
+            if loop.is_closed():
+                # Its sockets went with the loop; just drop the client
+                self._async_clients.pop(loop, None)
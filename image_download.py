@@ -0,0 +1,277 @@
+"""
+Bounded, streaming download of user-supplied image URLs.
+
+Connections come from the shared PooledHttpClient. The body is read in chunks under a
+connect timeout, a per-read timeout and an overall deadline, and the download is
+abandoned as soon as it exceeds the byte budget (the Content-Length header is checked
+first when present). The first bytes are matched
+against known image signatures, so HTML error pages and other non-images are rejected
+before the rest of the body is read, whatever Content-Type the server claims.
+
+With a BlobCache, a fresh cached copy is returned without any request, and a stale one
+is revalidated with a conditional GET; only a 200 transfers and re-caches the body.
+"""
+import asyncio
+import threading
+import time
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+
+DEFAULT_MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10.0
+DEFAULT_TOTAL_TIMEOUT = 20.0
+CHUNK_SIZE = 64 * 1024
+
+# Bytes needed to recognise every signature below
+SNIFF_BYTES = 12
+
+
+class DownloadError(Exception):
+    """The image could not be fetched (network error, timeout or HTTP error status)."""
+
+
+class ImageRejectedError(DownloadError):
+    """The URL answered, but with something that must not be processed as an image."""
+
+
+class DownloadTooLargeError(ImageRejectedError):
+    """The body is larger than the download byte budget."""
+
+
+class UnsupportedContentError(ImageRejectedError):
+    """The body does not start with a supported image signature."""
+
+
+class DownloadedImage(NamedTuple):
+    content: bytes
+    image_type: str
+    elapsed_ms: float
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Identify an image format from its first bytes.
+
+    Returns:
+        str: "jpeg", "png", "gif", "webp", "bmp" or "tiff", or None if unrecognised
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    return None
+
+
+class DownloadMetrics:
+    """Process-wide download counters: requests, outcomes, bytes and time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.downloads = 0
+            self.failures = {}
+            self.total_bytes = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, size: int, error: str = None):
+        with self._lock:
+            self.downloads += 1
+            self.total_bytes += size
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if error:
+                self.failures[error] = self.failures.get(error, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'downloads': self.downloads,
+                'failures': dict(self.failures),
+                'total_bytes': self.total_bytes,
+                'mean_ms': self.total_ms / self.downloads if self.downloads else 0.0,
+                'max_ms': self.max_ms,
+            }
+
+
+download_metrics = DownloadMetrics()
+
+
+def download_image(url: str, client, max_bytes: int = DEFAULT_MAX_DOWNLOAD_BYTES,
+                   connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                   read_timeout: float = DEFAULT_READ_TIMEOUT,
+                   total_timeout: float = DEFAULT_TOTAL_TIMEOUT, cache=None) -> DownloadedImage:
+    """
+    Stream an image into memory, enforcing timeouts, a size cap and a format check.
+
+    Args:
+        url: http(s) URL of the image
+        client: PooledHttpClient the connection is taken from
+        max_bytes: Largest body accepted
+        connect_timeout: Seconds to establish the connection (or wait for a pooled one)
+        read_timeout: Seconds to wait for each chunk
+        total_timeout: Seconds for the whole download; bounds slow-drip servers that
+            never trip the per-read timeout
+        cache: Optional BlobCache to serve repeats from and store downloads in
+
+    Returns:
+        DownloadedImage: Body bytes, sniffed image type and download (or cache read) time
+
+    Raises:
+        DownloadTooLargeError: If the body exceeds max_bytes
+        UnsupportedContentError: If the body is not a supported image
+        DownloadError: On invalid URLs, network errors, timeouts and HTTP errors
+    """
+    import httpx
+
+    start = time.perf_counter()
+    entry, cached = _probe_cache(cache, url)
+    if entry is not None and entry.fresh:
+        return _from_cache(cache, entry, cached, start)
+
+    body = _BoundedBody(url, max_bytes, total_timeout)
+    try:
+        with client.stream(url, _timeout(connect_timeout, read_timeout),
+                           headers=entry.validators() if entry else None) as response:
+            if entry is not None and response.status_code == 304:
+                entry = cache.refresh(entry, response.headers)
+                return _from_cache(cache, entry, cached, start, revalidated=True)
+            body.check_response(response)
+            for chunk in response.iter_bytes():
+                body.feed(chunk)
+    except httpx.HTTPError as e:
+        body.fail(DownloadError(f"Error downloading image: {e}"), e)
+    except DownloadError as e:
+        body.fail(e)
+    result = body.finish()
+    _store(cache, url, result, response.headers)
+    return result
+
+
+async def download_image_async(url: str, client, max_bytes: int = DEFAULT_MAX_DOWNLOAD_BYTES,
+                               connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                               read_timeout: float = DEFAULT_READ_TIMEOUT,
+                               total_timeout: float = DEFAULT_TOTAL_TIMEOUT,
+                               cache=None) -> DownloadedImage:
+    """Awaitable variant of download_image for use inside the rating pipeline's event loop."""
+    import httpx
+
+    start = time.perf_counter()
+    entry, cached = await asyncio.to_thread(_probe_cache, cache, url) if cache is not None else (None, None)
+    if entry is not None and entry.fresh:
+        return _from_cache(cache, entry, cached, start)
+
+    body = _BoundedBody(url, max_bytes, total_timeout)
+    try:
+        async with client.astream(url, _timeout(connect_timeout, read_timeout),
+                                  headers=entry.validators() if entry else None) as response:
+            if entry is not None and response.status_code == 304:
+                entry = await asyncio.to_thread(cache.refresh, entry, response.headers)
+                return _from_cache(cache, entry, cached, start, revalidated=True)
+            body.check_response(response)
+            async for chunk in response.aiter_bytes():
+                body.feed(chunk)
+    except httpx.HTTPError as e:
+        body.fail(DownloadError(f"Error downloading image: {e}"), e)
+    except DownloadError as e:
+        body.fail(e)
+    result = body.finish()
+    if cache is not None:
+        await asyncio.to_thread(_store, cache, url, result, response.headers)
+    return result
+
+
+def _probe_cache(cache, url):
+    """(entry, bytes) of a readable cached copy of url, or (None, None)."""
+    entry = cache.lookup(url) if cache is not None else None
+    content = cache.read(entry) if entry is not None else None
+    return (entry, content) if content is not None else (None, None)
+
+
+def _from_cache(cache, entry, content, start, revalidated=False):
+    cache.record_hit(revalidated)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Served {entry.size} bytes ({entry.image_type}) from the image cache in {elapsed_ms:.0f} ms")
+    return DownloadedImage(content, entry.image_type, elapsed_ms)
+
+
+def _store(cache, url, result, headers):
+    if cache is not None:
+        cache.record_miss()
+        cache.store(url, result.content, result.image_type, headers)
+
+
+def _timeout(connect_timeout, read_timeout):
+    import httpx
+    return httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+
+
+class _BoundedBody:
+    """Accumulates a response body, enforcing the byte budget, deadline and image signature."""
+
+    def __init__(self, url, max_bytes, total_timeout):
+        if urlparse(url).scheme not in ('http', 'https'):
+            raise self._recorded(DownloadError(f"Unsupported image URL: {url[:100]}"), 0)
+        self.max_bytes = max_bytes
+        self.start = time.perf_counter()
+        self.deadline = self.start + total_timeout
+        self.buffer = bytearray()
+        self.image_type = None
+
+    def check_response(self, response):
+        if response.status_code != 200:
+            raise DownloadError(f"Image download failed with HTTP {response.status_code}")
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            raise DownloadTooLargeError(
+                f"Image too large: {int(declared):,} bytes exceeds the {self.max_bytes:,} byte limit")
+
+    def feed(self, chunk):
+        # Chunks are yielded as they arrive, so the deadline is checked even when a
+        # server drips a few bytes at a time
+        self.buffer += chunk
+        if len(self.buffer) > self.max_bytes:
+            raise DownloadTooLargeError(f"Image too large: exceeds the {self.max_bytes:,} byte limit")
+        if self.image_type is None and len(self.buffer) >= SNIFF_BYTES:
+            self.image_type = _require_image(self.buffer)
+        if time.perf_counter() > self.deadline:
+            raise DownloadError("Image download timed out")
+
+    def fail(self, error, cause=None):
+        raise self._recorded(error, len(self.buffer), self.start) from cause
+
+    @staticmethod
+    def _recorded(error, size, start=None):
+        elapsed_ms = (time.perf_counter() - start) * 1000 if start else 0.0
+        download_metrics.record(elapsed_ms, size, type(error).__name__)
+        return error
+
+    def finish(self):
+        try:
+            if self.image_type is None:
+                self.image_type = _require_image(self.buffer)
+        except DownloadError as e:
+            self.fail(e)
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        download_metrics.record(elapsed_ms, len(self.buffer))
+        print(f"Downloaded {len(self.buffer)} bytes ({self.image_type}) in {elapsed_ms:.0f} ms")
+        return DownloadedImage(bytes(self.buffer), self.image_type, elapsed_ms)
+
+
+def _require_image(buffer):
+    image_type = sniff_image_type(bytes(buffer[:SNIFF_BYTES]))
+    if image_type is None:
+        raise UnsupportedContentError("URL did not return a supported image (JPEG, PNG, GIF, WebP, BMP or TIFF)")
+    return image_type
@@ -0,0 +1,321 @@
+"""
+Perceptual hashing for camel images.
+
+The combined hash is the cache key for BeautyResult, so the output format must stay
+stable: any change to the bits invalidates every cached analysis.
+"""
+import imagehash
+import numpy as np
+from PIL import Image, ImageFilter
+
+from image_ingest import open_image, DEFAULT_MAX_IMAGE_PIXELS
+
+HASH_TARGET_SIZE = 512
+
+# "full" is the original six-component key; "fast" keeps only phash and whash, skipping
+# the colour, crop-resistant, edge and histogram components
+HASH_PROFILES = ('fast', 'full')
+DEFAULT_HASH_PROFILE = 'full'
+
+# crop_resistant_hash defaults (imagehash 4.3)
+SEGMENT_THRESHOLD = 128
+MIN_SEGMENT_SIZE = 500
+SEGMENTATION_IMAGE_SIZE = 300
+
+
+def generate_image_hash(image_file, profile=DEFAULT_HASH_PROFILE, decode_size=None,
+                        max_pixels=DEFAULT_MAX_IMAGE_PIXELS):
+    """
+    Generate a robust, subject-focused hash for camel images that remains consistent
+    across resizing, rotation, and minor modifications by focusing on structural features.
+
+    Args:
+        image_file: File object or file-like object containing image data
+        profile: "full" for the six-component key, "fast" for phash and whash only
+        decode_size: Decode JPEGs at reduced resolution with at least this long edge.
+            None decodes in full, which keeps keys bit-identical to older rows.
+        max_pixels: Reject images declaring more pixels than this
+
+    Returns:
+        str: Combined hash string optimized for subject recognition
+    """
+    if profile not in HASH_PROFILES:
+        raise ValueError(f"Unknown hash profile: {profile}")
+
+    try:
+        import cv2
+
+        image = open_image(image_file, decode_size, max_pixels)
+        return _combined_hash(image, cv2, profile)
+
+    except ImportError:
+        # Fallback to enhanced PIL-only approach if OpenCV is not available
+        print("OpenCV not available, using enhanced PIL-only hashing")
+        return _pil_only_hash(image_file, profile, decode_size, max_pixels)
+
+    except Exception as e:
+        print(f"Error generating enhanced image hash: {e}")
+        return None
+    finally:
+        # Reset file pointer for any subsequent use
+        image_file.seek(0)
+
+
+def _combined_hash(image, cv2, profile=DEFAULT_HASH_PROFILE):
+    """
+    Compute the profile's hash components from one shared downsample.
+
+    The image is decoded and resized to HASH_TARGET_SIZE once, converted to grayscale
+    once, and every component works from those buffers. Each component still applies
+    the same final resize imagehash would, so the output is bit-identical to calling
+    the imagehash functions one by one (see reference_image_hash).
+    """
+    # Resize the RGB pixels directly; resizing is per channel so the BGR round trip
+    # the original implementation did is unnecessary
+    pixels = np.asarray(image)
+    height, width = pixels.shape[:2]
+    new_width, new_height = _normalized_size(width, height)
+    normalized = cv2.resize(pixels, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+
+    rgb_image = Image.fromarray(normalized)
+    gray_image = rgb_image.convert('L')
+
+    # 1. Enhanced perceptual hash with larger size for more detail
+    enhanced_phash = _phash(gray_image, hash_size=16)
+
+    # 2. Wavelet hash (more robust to geometric transformations)
+    wavelet_hash = _whash(gray_image, hash_size=16)
+
+    if profile == 'fast':
+        return f"{enhanced_phash}_{wavelet_hash}"
+
+    # OpenCV grayscale (different rounding than PIL's) feeds the edge and histogram hashes
+    blurred = cv2.GaussianBlur(cv2.cvtColor(normalized, cv2.COLOR_RGB2GRAY), (5, 5), 0)
+
+    # 3. Color hash (captures color distribution)
+    color_hash = _colorhash(rgb_image, gray_image, binbits=8)
+
+    # 4. Crop-resistant hash (focuses on center content)
+    crop_resistant_hash = _crop_resistant_hash(gray_image)
+
+    # 5. Edge-based structural hash
+    edges = cv2.Canny(blurred, 50, 150)
+    edge_hash = _phash(Image.fromarray(edges), hash_size=12)
+
+    # 6. Histogram-based hash for lighting invariance
+    hist = cv2.calcHist([blurred], [0], None, [64], [0, 256])
+    hist_normalized = cv2.normalize(hist, hist).flatten()
+    hist_hash = ''.join([f'{int(x):02x}' for x in hist_normalized[::4]])  # Sample every 4th value
+
+    return f"{enhanced_phash}_{wavelet_hash}_{color_hash}_{crop_resistant_hash}_{edge_hash}_{hist_hash}"
+
+
+def _normalized_size(width, height, target_size=HASH_TARGET_SIZE):
+    """Scale the long edge to target_size, maintaining aspect ratio."""
+    if width > height:
+        return target_size, int(height * target_size / width)
+    return int(width * target_size / height), target_size
+
+
+def _phash(gray_image, hash_size, highfreq_factor=4):
+    """imagehash.phash on an already-grayscale image."""
+    import scipy.fftpack
+
+    img_size = hash_size * highfreq_factor
+    pixels = np.asarray(gray_image.resize((img_size, img_size), Image.Resampling.LANCZOS))
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=0), axis=1)
+    dctlowfreq = dct[:hash_size, :hash_size]
+    return imagehash.ImageHash(dctlowfreq > np.median(dctlowfreq))
+
+
+def _whash(gray_image, hash_size):
+    """imagehash.whash (haar, max LL removed) on an already-grayscale image."""
+    import pywt
+
+    image_scale = max(2 ** int(np.log2(min(gray_image.size))), hash_size)
+    ll_max_level = int(np.log2(image_scale))
+    dwt_level = ll_max_level - int(np.log2(hash_size))
+
+    pixels = np.asarray(gray_image.resize((image_scale, image_scale), Image.Resampling.LANCZOS)) / 255.
+
+    # Remove the lowest frequency LL(max_ll) component
+    coeffs = list(pywt.wavedec2(pixels, 'haar', level=ll_max_level))
+    coeffs[0] *= 0
+    pixels = pywt.waverec2(coeffs, 'haar')
+
+    dwt_low = pywt.wavedec2(pixels, 'haar', level=dwt_level)[0]
+    return imagehash.ImageHash(dwt_low > np.median(dwt_low))
+
+
+def _colorhash(rgb_image, gray_image, binbits):
+    """imagehash.colorhash, reusing the shared grayscale conversion for intensity."""
+    intensity = np.asarray(gray_image).ravel()
+    hsv = np.asarray(rgb_image.convert('HSV'))
+    h = hsv[..., 0].ravel()
+    s = hsv[..., 1].ravel()
+
+    mask_black = intensity < 256 // 8
+    mask_gray = s < 256 // 3
+    mask_colors = ~mask_black & ~mask_gray
+    mask_faint_colors = mask_colors & (s < 256 * 2 // 3)
+    mask_bright_colors = mask_colors & (s > 256 * 2 // 3)
+
+    hue_bins = np.linspace(0, 255, 6 + 1)
+    h_faint_counts = np.histogram(h[mask_faint_colors], bins=hue_bins)[0]
+    h_bright_counts = np.histogram(h[mask_bright_colors], bins=hue_bins)[0]
+    c = max(1, mask_colors.sum())
+
+    maxvalue = 2 ** binbits
+    values = [
+        min(maxvalue - 1, int(mask_black.mean() * maxvalue)),
+        min(maxvalue - 1, int((~mask_black & mask_gray).mean() * maxvalue)),
+    ]
+    for counts in list(h_faint_counts) + list(h_bright_counts):
+        values.append(min(maxvalue - 1, int(counts * maxvalue * 1. / c)))
+
+    bits = [v // (2 ** (binbits - i - 1)) % 2 ** (binbits - i) > 0 for v in values for i in range(binbits)]
+    return imagehash.ImageHash(np.asarray(bits).reshape((-1, binbits)))
+
+
+def _dhash(gray_image, hash_size=8):
+    """imagehash.dhash on an already-grayscale image."""
+    pixels = np.asarray(gray_image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS))
+    return imagehash.ImageHash(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _crop_resistant_hash(gray_image):
+    """
+    imagehash.crop_resistant_hash with dhash segments, using vectorized segmentation.
+
+    Cropping before or after the grayscale conversion gives the same pixels, so the
+    segment dhashes are taken straight from the shared grayscale image.
+    """
+    size = SEGMENTATION_IMAGE_SIZE
+    small = gray_image.resize((size, size), Image.Resampling.LANCZOS)
+    small = small.filter(ImageFilter.GaussianBlur()).filter(ImageFilter.MedianFilter())
+    pixels = np.array(small).astype(np.float32)
+
+    boxes = _find_segment_boxes(pixels, SEGMENT_THRESHOLD, MIN_SEGMENT_SIZE)
+
+    # If there are no segments, have 1 segment including the whole image
+    if not boxes:
+        boxes = [(0, 0, size - 1, size - 1)]
+
+    orig_w, orig_h = gray_image.size
+    scale_w = float(orig_w) / size
+    scale_h = float(orig_h) / size
+
+    hashes = []
+    for min_row, min_col, max_row, max_col in boxes:
+        bounding_box = gray_image.crop((
+            min_col * scale_w,
+            min_row * scale_h,
+            (max_col + 1) * scale_w,
+            (max_row + 1) * scale_h,
+        ))
+        hashes.append(_dhash(bounding_box))
+
+    return imagehash.ImageMultiHash(hashes)
+
+
+def _find_segment_boxes(pixels, segment_threshold, min_segment_size):
+    """
+    Bounding boxes (min_row, min_col, max_row, max_col) of the crop-resistant segments.
+
+    Equivalent to imagehash's flood-fill segmentation: 4-connected "hill" regions
+    followed by "valley" regions, each in raster order of their first pixel. It
+    reproduces two quirks of the original so the hashes stay bit-identical: a
+    single-pixel region is never counted as segmented, and the valley pass stops as
+    soon as the segmented count (seeded with the 2 * (w + h) out-of-image border
+    pixels) reaches the image size, dropping any regions left after that point.
+    """
+    from scipy import ndimage
+
+    rows, cols = pixels.shape
+    total_pixels = rows * cols
+    segmented = 2 * (rows + cols)
+    hills = pixels > segment_threshold
+
+    boxes = []
+    for is_valley, mask in ((False, hills), (True, ~hills)):
+        labels, count = ndimage.label(mask)
+        sizes = np.bincount(labels.ravel(), minlength=count + 1)[1:]
+        slices = ndimage.find_objects(labels)
+
+        for size, (row_slice, col_slice) in zip(sizes, slices):
+            if is_valley and segmented >= total_pixels:
+                break
+            if size > min_segment_size:
+                boxes.append((row_slice.start, col_slice.start, row_slice.stop - 1, col_slice.stop - 1))
+            if size > 1:
+                segmented += size
+        else:
+            if is_valley and segmented < total_pixels:
+                # The original indexes into an empty pixel list here
+                raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+
+    return boxes
+
+
+def _pil_only_hash(image_file, profile=DEFAULT_HASH_PROFILE, decode_size=None,
+                   max_pixels=DEFAULT_MAX_IMAGE_PIXELS):
+    """Enhanced PIL-only hash used when OpenCV is not installed."""
+    image = open_image(image_file, decode_size, max_pixels)
+
+    # Normalize size
+    image.thumbnail((512, 512), Image.Resampling.LANCZOS)
+
+    # Generate enhanced hashes
+    enhanced_phash = imagehash.phash(image, hash_size=16)
+    wavelet_hash = imagehash.whash(image, hash_size=16)
+
+    if profile == 'fast':
+        return f"{enhanced_phash}_{wavelet_hash}"
+
+    color_hash = imagehash.colorhash(image, binbits=8)
+    crop_resistant_hash = imagehash.crop_resistant_hash(image)
+
+    # Convert to grayscale for additional structural hash
+    gray_image = image.convert('L')
+    structural_hash = imagehash.dhash(gray_image, hash_size=12)
+
+    return f"{enhanced_phash}_{wavelet_hash}_{color_hash}_{crop_resistant_hash}_{structural_hash}"
+
+
+def reference_image_hash(image_file):
+    """
+    The original one-imagehash-call-per-component implementation.
+
+    Kept as the oracle for the bit-exactness tests and the hashing benchmark; not
+    used on the request path.
+    """
+    import cv2
+
+    image_file.seek(0)
+    image = Image.open(image_file)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    height, width = cv_image.shape[:2]
+    new_width, new_height = _normalized_size(width, height)
+    normalized_image = cv2.resize(cv_image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+
+    gray = cv2.cvtColor(normalized_image, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+
+    pil_normalized = Image.fromarray(cv2.cvtColor(normalized_image, cv2.COLOR_BGR2RGB))
+    enhanced_phash = imagehash.phash(pil_normalized, hash_size=16)
+    wavelet_hash = imagehash.whash(pil_normalized, hash_size=16)
+    color_hash = imagehash.colorhash(pil_normalized, binbits=8)
+    crop_resistant_hash = imagehash.crop_resistant_hash(pil_normalized)
+
+    edges = cv2.Canny(blurred, 50, 150)
+    edge_hash = imagehash.phash(Image.fromarray(edges), hash_size=12)
+
+    hist = cv2.calcHist([blurred], [0], None, [64], [0, 256])
+    hist_normalized = cv2.normalize(hist, hist).flatten()
+    hist_hash = ''.join([f'{int(x):02x}' for x in hist_normalized[::4]])
+
+    image_file.seek(0)
+    return f"{enhanced_phash}_{wavelet_hash}_{color_hash}_{crop_resistant_hash}_{edge_hash}_{hist_hash}"
@@ -0,0 +1,75 @@
+"""
+Decoding of downloaded images.
+
+Hashing works at 512px, so fully decoding a 12-48 MP phone photo only to shrink it
+wastes hundreds of MB and tens of milliseconds. JPEGs are instead decoded straight to
+the smallest DCT scale (1/2, 1/4 or 1/8) that still covers the working resolution,
+and the declared dimensions are checked against a pixel budget from the header alone,
+before any pixel data is decoded.
+"""
+import math
+
+DEFAULT_MAX_IMAGE_PIXELS = 64_000_000
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image declares more pixels than the configured budget."""
+
+
+def check_image_size(image_file, max_pixels=DEFAULT_MAX_IMAGE_PIXELS):
+    """
+    Read an image header and enforce the pixel budget.
+
+    Args:
+        image_file: File-like object containing image data
+        max_pixels: Largest width * height accepted
+
+    Returns:
+        PIL.Image.Image: The opened, not yet decoded, image
+
+    Raises:
+        ImageTooLargeError: If the declared dimensions exceed max_pixels
+        PIL.UnidentifiedImageError: If the data is not a readable image
+    """
+    from PIL import Image
+
+    image_file.seek(0)
+    try:
+        image = Image.open(image_file)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Image too large: {e}") from e
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image too large: {width}x{height} exceeds the {max_pixels:,} pixel limit"
+        )
+    return image
+
+
+def open_image(image_file, decode_size=None, max_pixels=DEFAULT_MAX_IMAGE_PIXELS):
+    """
+    Decode an image to RGB, at reduced resolution when the format allows it.
+
+    Args:
+        image_file: File-like object containing image data
+        decode_size: Long edge the caller needs; JPEGs are decoded at the smallest
+            DCT scale whose long edge is still at least this. None decodes in full.
+        max_pixels: Largest width * height accepted
+
+    Returns:
+        PIL.Image.Image: Decoded RGB image
+    """
+    image = check_image_size(image_file, max_pixels)
+
+    if decode_size and image.format == 'JPEG':
+        width, height = image.size
+        scale = decode_size / max(width, height)
+        if scale < 1:
+            image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    else:
+        image.load()
+    return image
@@ -0,0 +1,111 @@
+"""
+Model-ready image derivatives for the vision model.
+
+In "url" mode every chat completion receives the public image URL, and OpenAI
+fetches it again for each call (validation plus one per beauty category). In
+"inline" mode the bytes rate_image has already downloaded are turned into one
+derivative per request, which is sent to every call as a base64 data URL:
+- EXIF orientation is applied, so the model sees the photo upright.
+- The image is converted to RGB.
+- It is shrunk to the resolution the model actually uses.
+- It is re-encoded as JPEG.
+
+In high detail OpenAI fits an image inside 2048x2048 and then scales its short side
+down to 768px before cutting it into 512px tiles, so any pixels beyond that only
+cost upload bandwidth. Low detail sees a single 512px thumbnail of the same image.
+"""
+import base64
+import io
+import math
+
+from image_ingest import check_image_size, open_image, DEFAULT_MAX_IMAGE_PIXELS
+
+IMAGE_INPUT_MODES = ('url', 'inline')
+IMAGE_DETAILS = ('low', 'high', 'auto')
+
+MODEL_IMAGE_LONG_EDGE = 2048
+MODEL_IMAGE_SHORT_EDGE = 768
+MODEL_IMAGE_JPEG_QUALITY = 85
+
+
+def model_image_size(width: int, height: int, long_edge: int = MODEL_IMAGE_LONG_EDGE,
+                     short_edge: int = MODEL_IMAGE_SHORT_EDGE):
+    """Size the model works at for a width x height image in high detail (never upscaled)."""
+    scale = min(1.0, long_edge / max(width, height), short_edge / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def prepare_model_image(image_bytes: bytes, long_edge: int = MODEL_IMAGE_LONG_EDGE,
+                        short_edge: int = MODEL_IMAGE_SHORT_EDGE, quality: int = MODEL_IMAGE_JPEG_QUALITY,
+                        max_pixels: int = DEFAULT_MAX_IMAGE_PIXELS) -> bytes:
+    """
+    Build the JPEG derivative sent to the vision model.
+
+    Args:
+        image_bytes: Raw downloaded image
+        long_edge: Cap on the longer side
+        short_edge: Cap on the shorter side
+        quality: JPEG quality of the derivative
+        max_pixels: Reject images declaring more pixels than this
+
+    Returns:
+        bytes: Upright RGB JPEG no larger than the model's effective resolution
+    """
+    from PIL import Image, ImageOps
+
+    width, height = check_image_size(io.BytesIO(image_bytes), max_pixels).size
+    target_long = max(model_image_size(width, height, long_edge, short_edge))
+
+    # Let the JPEG decoder do most of the shrinking (DCT scaling), then finish with a
+    # single antialiased bicubic resample (well under 3x by then, where Lanczos buys
+    # nothing visible). EXIF rotation only swaps the axes, so the target long edge holds.
+    image = open_image(io.BytesIO(image_bytes), decode_size=target_long, max_pixels=max_pixels)
+    image = ImageOps.exif_transpose(image)
+    target = model_image_size(image.width, image.height, long_edge, short_edge)
+    if image.size != target:
+        image = image.resize(target, Image.Resampling.BICUBIC)
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def to_data_url(image_bytes: bytes, **options) -> str:
+    """Model-ready derivative of image_bytes as a "data:image/jpeg;base64,..." URL."""
+    return "data:image/jpeg;base64," + base64.b64encode(prepare_model_image(image_bytes, **options)).decode('ascii')
+
+
+def model_image_url(image_url: str, image_bytes: bytes, mode: str, **options) -> str:
+    """
+    Choose what to send the vision model for one request.
+
+    Falls back to the public URL in "url" mode, when the download failed, or when the
+    bytes cannot be decoded.
+    """
+    if mode != 'inline' or not image_bytes:
+        return image_url
+    try:
+        return to_data_url(image_bytes, **options)
+    except Exception as e:
+        print(f"Error inlining image, sending URL instead: {e}")
+        return image_url
+
+
+def image_content(url: str, detail: str = None) -> dict:
+    """Chat-completions image part for url, with an explicit detail level when given."""
+    image_url = {"url": url}
+    if detail:
+        image_url["detail"] = detail
+    return {"type": "image_url", "image_url": image_url}
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = 'high') -> int:
+    """
+    Input tokens billed for one image on the GPT-4o family (85 base + 170 per 512px tile).
+
+    "auto" is treated as high, which is what OpenAI picks for photos of this size.
+    """
+    if detail == 'low':
+        return 85
+    width, height = model_image_size(width, height)
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
@@ -0,0 +1,237 @@
+"""
+Per-call telemetry for the LLM requests of the rating and comparison pipelines.
+
+rate_image reported a single processing_time, so nobody could tell which of the
+validation and category calls was slow or expensive. OpenAIScheduler.create() records
+one event for every call it makes:
+
+    model, label (the category, "validation", "combined"), outcome (ok, error,
+    unavailable, cancelled), retries, queue_wait_ms (slots and pacing, summed over
+    attempts), response_ms (the last attempt, from send to response), total_ms (from
+    create() to its return, backoff included), prompt/cached/completion/reasoning tokens
+    from response.usage, and cost_usd at the model's price
+
+Each event is logged as one JSON line (LLM_TELEMETRY_LOG), kept in a ring of recent
+calls, and added to histograms per model and label for /api/metrics. The events of the
+current request are also collected in a context variable (tasks and threads started
+by the request inherit it), so the views can return them in a "debug" block.
+
+Prices are USD per million input, cached input and output tokens; list prices at the
+time of writing, overridden per model by LLM_PRICES ("model=in/cached/out,...").
+Reasoning tokens are billed as output and already counted in completion_tokens.
+"""
+import bisect
+import collections
+import contextvars
+import json
+import threading
+import time
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Recent events kept for /api/metrics/llm-calls
+EVENT_WINDOW = 200
+DEFAULT_PRICES = {
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-5': (1.25, 0.125, 10.00),
+    'gpt-5.1': (1.25, 0.125, 10.00),
+}
+
+_request_calls = contextvars.ContextVar('llm_request_calls', default=None)
+
+
+def parse_prices(value: str) -> dict:
+    """Parse LLM_PRICES, e.g. "gpt-5.1=1.25/0.125/10,gpt-4o=2.5/1.25/10"."""
+    prices = {}
+    for entry in filter(None, (part.strip() for part in (value or '').split(','))):
+        model, _, fields = entry.partition('=')
+        prices[model.strip()] = tuple(float(field) for field in fields.split('/'))
+    return prices
+
+
+class Histogram:
+    """Counts per bucket, with the sum and max, of one measurement."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-quantile (the max for the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        # Cumulative, as Prometheus expects
+        buckets = {str(bound): sum(self.counts[:i + 1]) for i, bound in enumerate(self.bounds)}
+        buckets['+Inf'] = self.count
+        return {
+            'count': self.count,
+            'sum': round(self.total, 1),
+            'mean': round(self.total / self.count, 1) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 1),
+            'buckets': buckets,
+        }
+
+
+class CallStats:
+    """Outcomes, retries, tokens, cost and latency histograms of one model and label."""
+
+    def __init__(self):
+        self.outcomes = collections.Counter()
+        self.retries = 0
+        self.cost_usd = 0.0
+        self.histograms = {
+            'queue_wait_ms': Histogram(LATENCY_BUCKETS_MS),
+            'response_ms': Histogram(LATENCY_BUCKETS_MS),
+            'total_ms': Histogram(LATENCY_BUCKETS_MS),
+            'prompt_tokens': Histogram(TOKEN_BUCKETS),
+            'cached_tokens': Histogram(TOKEN_BUCKETS),
+            'completion_tokens': Histogram(TOKEN_BUCKETS),
+        }
+
+    def record(self, event: dict):
+        self.outcomes[event['outcome']] += 1
+        self.retries += event['retries']
+        self.cost_usd += event['cost_usd'] or 0.0
+        for name, histogram in self.histograms.items():
+            if event.get(name) is not None:
+                histogram.observe(event[name])
+
+    def snapshot(self) -> dict:
+        return {
+            'calls': sum(self.outcomes.values()),
+            'outcomes': dict(self.outcomes),
+            'retries': self.retries,
+            'cost_usd': round(self.cost_usd, 6),
+            **{name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+
+class LLMTelemetry:
+    """Process-wide sink for the scheduler's per-call events."""
+
+    def __init__(self, log: bool = True, prices: dict = None):
+        self.log = log
+        self.prices = {**DEFAULT_PRICES, **(prices or {})}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def init_app(self, app):
+        self.log = app.config.get("LLM_TELEMETRY_LOG", self.log)
+        self.prices = {**DEFAULT_PRICES, **parse_prices(app.config.get("LLM_PRICES", ""))}
+
+    def reset(self):
+        with self._lock:
+            self._stats = collections.defaultdict(CallStats)  # (model, label) -> stats
+            self._events = collections.deque(maxlen=EVENT_WINDOW)
+
+    def collect(self) -> list:
+        """Start collecting the current request's events; returns the list they go to."""
+        calls = []
+        _request_calls.set(calls)
+        return calls
+
+    def cost(self, model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int):
+        """USD billed for a call, or None for a model without a price."""
+        price = self.prices.get(model)
+        if price is None:
+            # Dated snapshots ("gpt-4o-2024-08-06") are billed as their family
+            family = max((name for name in self.prices if model.startswith(name + '-')), key=len, default=None)
+            price = self.prices.get(family)
+        if price is None:
+            return None
+        per_input, per_cached, per_output = price
+        return ((prompt_tokens - cached_tokens) * per_input + cached_tokens * per_cached
+                + completion_tokens * per_output) / 1_000_000
+
+    def record(self, model: str, label: str, outcome: str, retries: int, queue_wait_ms: float,
+               response_ms: float, total_ms: float, usage=None) -> dict:
+        """Record one call (after its last attempt); returns the event."""
+        prompt_details = getattr(usage, 'prompt_tokens_details', None)
+        completion_details = getattr(usage, 'completion_tokens_details', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        cached_tokens = None
+        if usage is not None:
+            cached_tokens = getattr(prompt_details, 'cached_tokens', None) or 0
+        event = {
+            'event': 'llm_call',
+            'at': round(time.time(), 3),
+            'model': model,
+            'label': label,
+            'outcome': outcome,
+            'retries': retries,
+            'queue_wait_ms': round(queue_wait_ms, 1),
+            'response_ms': round(response_ms, 1) if response_ms is not None else None,
+            'total_ms': round(total_ms, 1),
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'completion_tokens': completion_tokens,
+            'reasoning_tokens': getattr(completion_details, 'reasoning_tokens', None),
+            'cost_usd': None,
+        }
+        if prompt_tokens is not None and completion_tokens is not None:
+            cost = self.cost(model, prompt_tokens, cached_tokens, completion_tokens)
+            event['cost_usd'] = round(cost, 6) if cost is not None else None
+        with self._lock:
+            self._stats[(model, label)].record(event)
+            self._events.append(event)
+        calls = _request_calls.get()
+        if calls is not None:
+            calls.append(event)
+        if self.log:
+            print(f"LLM call {json.dumps(event)}")
+        return event
+
+    @staticmethod
+    def summary(calls: list) -> dict:
+        """The debug block of a response: its calls and their totals."""
+        def total(name):
+            return sum(call[name] or 0 for call in calls)
+
+        return {
+            'llm_calls': calls,
+            'totals': {
+                'calls': len(calls),
+                'retries': total('retries'),
+                'prompt_tokens': total('prompt_tokens'),
+                'cached_tokens': total('cached_tokens'),
+                'completion_tokens': total('completion_tokens'),
+                'cost_usd': round(total('cost_usd'), 6),
+                # Calls overlap, so this is more than the request's wall time
+                'response_ms': round(total('response_ms'), 1),
+            },
+        }
+
+    def recent(self, limit: int = 50) -> list:
+        with self._lock:
+            return list(self._events)[-limit:] if limit > 0 else []
+
+    def snapshot(self) -> dict:
+        """Per model, then per label: outcomes, retries, cost and histograms of latency and tokens."""
+        with self._lock:
+            models = collections.defaultdict(dict)
+            for (model, label), stats in sorted(self._stats.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                models[model][label or 'unlabelled'] = stats.snapshot()
+            return dict(models)
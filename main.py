@@ -1,13 +1,25 @@
+import core.startup  # noqa: F401  First import, so cold-start timings start here
 from core.imports import Flask, load_dotenv, request, jsonify, cloudinary, random, datetime, timedelta, render_template, Message, create_access_token, requests, get_jwt_identity, jwt_required, base64, re
 from prompt_loader import PromptLoader
-from core.config import Config
-from core.extensions import db, jwt, mail, swagger, cors, bcrypt, migrate
+from core.config import Config, get_openai_client
+from core.extensions import db, jwt, mail, swagger, cors, bcrypt, migrate, near_duplicate_index, hash_pool, http_client, image_cache, async_runtime, openai_scheduler, llm_telemetry, hedged_calls, analysis_flights, startup
 from core.models import TempUser, User, Conversation, BeautyResult, RatingFeedback
 from routes.auth import auth_bp
 from attribute_weights import calculate_weighted_score, get_all_weights
-import imagehash
-from PIL import Image
+from image_ingest import check_image_size, ImageTooLargeError
+from image_download import download_image_async, download_metrics, DownloadError, ImageRejectedError
+from image_inline import model_image_url, image_content
+from hash_index import cache_key
+from hash_pool import warm_hashing_stack
+from stage_timing import StageTimer, rate_image_metrics
+from quality_gate import QualityThresholds, check_image_quality, rejection_payload, quality_gate_metrics
+from openai_scheduler import OpenAIUnavailableError
+from hedging import CallDeadlineError
+import click
+import contextlib
+import hashlib
 import io
+import math
 
 def create_app():
     app = Flask(__name__)
@@ -27,8 +39,26 @@ def create_app():
     
     bcrypt.init_app(app)
     migrate.init_app(app, db)
+    near_duplicate_index.init_app(app)
+    hash_pool.init_app(app)
+    http_client.init_app(app)
+    image_cache.init_app(app)
+    # After http_client, so at exit the loop drains before the HTTP clients close
+    async_runtime.init_app(app, http_client)
+    openai_scheduler.init_app(app)
+    llm_telemetry.init_app(app)
+    hedged_calls.init_app(app)
+    analysis_flights.init_app(app)
 
     app.register_blueprint(auth_bp)
+
+    @app.cli.command("backfill-hash-keys")
+    @click.option("--batch-size", default=1000, show_default=True, help="Rows per committed batch")
+    def backfill_hash_keys_command(batch_size):
+        """Fill hash_key/phash/whash for cached results created before they existed."""
+        from core.backfill import backfill_hash_keys
+        updated = backfill_hash_keys(batch_size)
+        print(f"Backfill complete: {updated} rows updated")
     
     # Add OPTIONS handler for all routes to handle CORS preflight requests
     @app.before_request
@@ -40,11 +70,21 @@ def create_app():
             response.headers.add('Access-Control-Allow-Methods', "*")
             return response
     
+
+    # The hash pool starts before the async runtime's threads, so a fork start method
+    # never forks a multi-threaded process
+    startup.init_app(app, loaders=[
+        ("openai", get_openai_client),
+        ("hashing_stack", warm_hashing_stack),
+        ("hash_pool", hash_pool.start),
+        ("async_runtime", async_runtime.start),
+        ("near_duplicate_index", lambda: near_duplicate_index.load_from_database(app)),
+    ])
+
     return app
 
 app = create_app()
 load_dotenv()
-client = Config.client
 
 
 def send_email(to, subject, body):
@@ -85,126 +125,36 @@ def send_sms_otp(phone, otp):
     print(f"[DEV MODE] SMS sending disabled. OTP {otp} would be sent to {phone}")
     return True
 
-def generate_image_hash(image_file):
-    """
-    Generate a robust, subject-focused hash for camel images that remains consistent
-    across resizing, rotation, and minor modifications by focusing on structural features.
-    
-    Args:
-        image_file: File object or file-like object containing image data
-    
-    Returns:
-        str: Combined hash string optimized for subject recognition
-    """
-    try:
-        import cv2
-        import numpy as np
-        from scipy.spatial.distance import hamming
-        
-        # Reset file pointer to beginning
-        image_file.seek(0)
-        
-        # Open image with PIL and convert to OpenCV format
-        image = Image.open(image_file)
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert PIL to OpenCV format
-        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        
-        # Normalize image size to reduce size-dependency (maintain aspect ratio)
-        height, width = cv_image.shape[:2]
-        target_size = 512
-        if width > height:
-            new_width = target_size
-            new_height = int(height * target_size / width)
-        else:
-            new_height = target_size
-            new_width = int(width * target_size / height)
-        
-        normalized_image = cv2.resize(cv_image, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
-        
-        # Convert to grayscale for feature detection
-        gray = cv2.cvtColor(normalized_image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Generate multiple robust hashes
-        
-        # 1. Enhanced perceptual hash with larger size for more detail
-        pil_normalized = Image.fromarray(cv2.cvtColor(normalized_image, cv2.COLOR_BGR2RGB))
-        enhanced_phash = imagehash.phash(pil_normalized, hash_size=16)  # Larger hash for more precision
-        
-        # 2. Wavelet hash (more robust to geometric transformations)
-        wavelet_hash = imagehash.whash(pil_normalized, hash_size=16)
-        
-        # 3. Color hash (captures color distribution)
-        color_hash = imagehash.colorhash(pil_normalized, binbits=8)
-        
-        # 4. Crop-resistant hash (focuses on center content)
-        crop_resistant_hash = imagehash.crop_resistant_hash(pil_normalized)
-        
-        # 5. Edge-based structural hash
-        edges = cv2.Canny(blurred, 50, 150)
-        edge_pil = Image.fromarray(edges)
-        edge_hash = imagehash.phash(edge_pil, hash_size=12)
-        
-        # 6. Histogram-based hash for lighting invariance
-        hist = cv2.calcHist([blurred], [0], None, [64], [0, 256])
-        hist_normalized = cv2.normalize(hist, hist).flatten()
-        hist_hash = ''.join([f'{int(x):02x}' for x in hist_normalized[::4]])  # Sample every 4th value
-        
-        # Combine all hashes with weights (more emphasis on structural features)
-        combined_hash = f"{enhanced_phash}_{wavelet_hash}_{color_hash}_{crop_resistant_hash}_{edge_hash}_{hist_hash}"
-        
-        return combined_hash
-        
-    except ImportError:
-        # Fallback to enhanced PIL-only approach if OpenCV is not available
-        print("OpenCV not available, using enhanced PIL-only hashing")
-        
-        # Reset file pointer
-        image_file.seek(0)
-        image = Image.open(image_file)
-        
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Normalize size
-        image.thumbnail((512, 512), Image.Resampling.LANCZOS)
-        
-        # Generate enhanced hashes
-        enhanced_phash = imagehash.phash(image, hash_size=16)
-        wavelet_hash = imagehash.whash(image, hash_size=16)
-        color_hash = imagehash.colorhash(image, binbits=8)
-        crop_resistant_hash = imagehash.crop_resistant_hash(image)
-        
-        # Convert to grayscale for additional structural hash
-        gray_image = image.convert('L')
-        structural_hash = imagehash.dhash(gray_image, hash_size=12)
-        
-        combined_hash = f"{enhanced_phash}_{wavelet_hash}_{color_hash}_{crop_resistant_hash}_{structural_hash}"
-        
-        return combined_hash
-        
-    except Exception as e:
-        print(f"Error generating enhanced image hash: {e}")
-        return None
-    finally:
-        # Reset file pointer for any subsequent use
-        image_file.seek(0)
+def quality_thresholds():
+    """Quality gate limits from config."""
+    return QualityThresholds(
+        min_short_edge=Config.QUALITY_MIN_SHORT_EDGE,
+        max_aspect_ratio=Config.QUALITY_MAX_ASPECT_RATIO,
+        min_contrast=Config.QUALITY_MIN_CONTRAST,
+        max_clipped_fraction=Config.QUALITY_MAX_CLIPPED_FRACTION,
+        min_sharpness=Config.QUALITY_MIN_SHARPNESS,
+        max_flat_fraction=Config.QUALITY_MAX_FLAT_FRACTION,
+    )
+
+
+def model_image_options():
+    """Derivative settings for image_inline.model_image_url from config."""
+    return {
+        "long_edge": Config.MODEL_IMAGE_LONG_EDGE,
+        "short_edge": Config.MODEL_IMAGE_SHORT_EDGE,
+        "quality": Config.MODEL_IMAGE_JPEG_QUALITY,
+        "max_pixels": Config.MAX_IMAGE_PIXELS,
+    }
 
 
-async def validate_camel_image(image_url, async_client):
+async def validate_camel_image(image_url, async_client, detail=None):
     """
     Validate if an image contains a camel and if camel parts are clearly visible.
     
     Args:
         image_url: URL of the image to validate
         async_client: AsyncOpenAI client instance
+        detail: Vision detail level ("low", "high" or "auto"); None leaves it to the API
         
     Returns:
         dict: Validation result with success status and detailed feedback
@@ -238,7 +188,9 @@ Be strict in your assessment - the image should clearly show a camel with most b
 """
     
     try:
-        response = await async_client.chat.completions.create(
+        response = await openai_scheduler.create(
+            async_client,
+            label="validation",
             model="gpt-4o",
             messages=[
                 {
@@ -248,12 +200,7 @@ Be strict in your assessment - the image should clearly show a camel with most b
                             "type": "text",
                             "text": validation_prompt
                         },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": image_url
-                            }
-                        }
+                        image_content(image_url, detail)
                     ]
                 }
             ],
@@ -267,6 +214,9 @@ Be strict in your assessment - the image should clearly show a camel with most b
             "validation": validation_result
         }
         
+    except OpenAIUnavailableError:
+        # Not a verdict on the image: must not be cached as a failed validation
+        raise
     except Exception as e:
         print(f"Error in camel validation: {e}")
         return {
@@ -279,11 +229,117 @@ Be strict in your assessment - the image should clearly show a camel with most b
             }
         }
 
+def prompt_cache_options(label):
+    """
+    Extra request options for the prefix layout: a prompt_cache_key per category.
+
+    Calls with the same key are routed to the same cache, which raises the hit rate of
+    prefixes shared across many requests.
+    """
+    if Config.PROMPT_LAYOUT != 'prefix':
+        return {}
+    # Sent as a body field so older SDK versions pass it through too
+    return {"extra_body": {"prompt_cache_key": f"camel-{label}"}}
+
+
+def category_result(category_name, parsed_response):
+    """One category's rating as returned to clients, normalizing the model's error object."""
+    # Check if this is an error response from the AI
+    if isinstance(parsed_response, dict) and parsed_response.get('error') is True:
+        # Handle error response - camel not found or partially visible
+        return {
+            "error": True,
+            "message": parsed_response.get('message', 'Unknown error'),
+            "category": parsed_response.get('category', category_name),
+            "category_score": None
+        }
+    return parsed_response
+
+
+async def rate_categories_combined(async_client, prompt_loader, categories, image_url, gender=None, model="gpt-5.1"):
+    """
+    Rate every beauty category with a single structured-output call.
+
+    The alternative to one call per category (CATEGORY_ENGINE=fanout): the image is sent
+    and billed once, and the whole rating is one request against the rate limit, at the
+    cost of one longer generation instead of several parallel ones.
+
+    Args:
+        async_client: AsyncOpenAI client instance
+        prompt_loader: PromptLoader providing the prompts and schemas
+        categories: Categories to rate
+        image_url: URL (or data URL) of the image to rate
+        gender: Camel gender for the system prompts, or None
+        model: Model to call
+
+    Returns:
+        dict: category -> rating, in the same shape as the per-category calls
+    """
+    import json
+    messages = prompt_loader.build_combined_request_messages(
+        categories, image_url, gender=gender, detail=Config.CATEGORY_IMAGE_DETAIL, layout=Config.PROMPT_LAYOUT)
+    try:
+        # Within the "combined" deadline, hedged if slow (hedging.py)
+        response = await hedged_calls.call("combined", lambda: openai_scheduler.create(
+            async_client,
+            label="combined",
+            model=model,
+            messages=messages,
+            response_format=prompt_loader.get_combined_response_format(categories),
+            **prompt_cache_options("combined")
+        ), model=model)
+    except (OpenAIUnavailableError, CallDeadlineError):
+        raise
+    except Exception as e:
+        print(f"Error rating categories {', '.join(categories)}: {e}")
+        return {category: {"score": 0, "analysis": f"Error: {str(e)}"} for category in categories}
+
+    raw_response = response.choices[0].message.content
+    try:
+        parsed_response = json.loads(raw_response)
+    except (TypeError, json.JSONDecodeError):
+        # Fallback if JSON parsing fails (or the model refused)
+        return {category: {"score": 0, "analysis": raw_response} for category in categories}
+
+    return {
+        category: category_result(category, parsed_response[category])
+        if isinstance(parsed_response, dict) and category in parsed_response
+        else {"score": 0, "analysis": f"Error: no rating returned for {category}"}
+        for category in categories
+    }
+
 @app.route('/ping')
 def ping():
     return "Pong", 200
 
 
+@app.route('/api/metrics', methods=['GET'])
+@jwt_required()
+def metrics():
+    """Process-level counters for the image download path and the rate_image pipeline stages."""
+    return jsonify({
+        "http_client": http_client.stats(),
+        "downloads": download_metrics.snapshot(),
+        "image_cache": image_cache.stats(),
+        "rate_image": rate_image_metrics.snapshot(),
+        "quality_gate": quality_gate_metrics.snapshot(),
+        "async_runtime": async_runtime.stats(),
+        "openai": openai_scheduler.stats(),
+        "prompt_cache": openai_scheduler.prompt_cache_stats(),
+        "llm": llm_telemetry.snapshot(),
+        "category_latency": hedged_calls.stats(),
+        "coalescing": analysis_flights.stats(),
+    }), 200
+
+
+@app.route('/api/metrics/llm-calls', methods=['GET'])
+@jwt_required()
+def llm_call_events():
+    """The most recent LLM calls of this worker, one telemetry event each (?limit=, default 50)."""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({"calls": llm_telemetry.recent(limit)}), 200
+
+
 @app.route('/api/auth', methods=["POST"])
 def auth():
     """
@@ -570,6 +626,42 @@ def update_user_settings():
         return jsonify({"error": "Failed to update settings"}), 500
 
 
+def unavailable_response(error):
+    """503 for a rating the OpenAI scheduler gave up on, telling the client when to retry."""
+    retry_after = max(5, math.ceil(error.retry_after or 0))
+    return jsonify({"error": "The rating service is busy, please retry shortly"}), 503, {"Retry-After": str(retry_after)}
+
+
+def deadline_response(error):
+    """504 for a rating whose category call ran out of time (hedging.py); nothing was stored."""
+    return jsonify({"error": "The rating took too long, please retry shortly"}), 504, {"Retry-After": "5"}
+
+
+def cached_result_response(cached_result, match_distance=0):
+    """Build the rate-image response for a cached BeautyResult."""
+    # Check if this is a cached validation failure
+    if cached_result.validation_error:
+        print(f"Returning cached validation error for image hash: {cached_result.image_hash[:16]}...")
+        return jsonify({
+            "error": cached_result.validation_error,
+            "validation": cached_result.validation_result,
+            "cached": True,
+            "cached_at": cached_result.created_at.isoformat(),
+            "match_distance": match_distance
+        }), 400
+
+    # Return cached successful results
+    return jsonify({
+        "beauty_ratings": cached_result.beauty_ratings,
+        "overall_score": cached_result.overall_score,
+        "category_scores": cached_result.category_scores,
+        "validation": cached_result.validation_result,
+        "cached": True,
+        "cached_at": cached_result.created_at.isoformat(),
+        "match_distance": match_distance
+    }), 200
+
+
 @app.route('/api/rate-image', methods=["POST"])
 @jwt_required(optional=True)
 def rate_image():
@@ -601,6 +693,10 @@ def rate_image():
               enum: ["male", "female", "unknown"]
               example: "male"
               description: "Gender of the camel (optional)"
+            debug:
+              type: boolean
+              example: false
+              description: "Include per-call LLM telemetry in the response (needs LLM_DEBUG_RESPONSE)"
     responses:
       200:
         description: Beauty ratings returned successfully
@@ -634,7 +730,34 @@ def rate_image():
           properties:
             error:
               type: string
+      503:
+        description: OpenAI rate limited or unavailable after retries; retry after the Retry-After header
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      504:
+        description: A category call exceeded CATEGORY_DEADLINE_SECONDS; nothing was stored
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    return async_runtime.run(rate_image_async())
+
+
+async def rate_image_async():
     """
+    The rate_image pipeline as a coroutine, run inside the request's Flask context.
+
+    The Flask view runs it on the worker's async runtime; under ASGI (asgi.py) it is
+    awaited on the server's event loop, so one worker holds many in-flight ratings.
+    Blocking database writes go through asyncio.to_thread to keep the loop free.
+    """
+    import asyncio
+
     # TODO: Implement video processing support for beauty rating analysis
     
     data = request.get_json()
@@ -645,162 +768,415 @@ def rate_image():
     gender = data.get('gender', 'unknown')  # Default to 'unknown' if not provided
     user_id = get_jwt_identity()
 
-    # Generate image hash for caching
-    image_hash = None
-    try:
-        import requests
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            image_file = io.BytesIO(response.content)
-            image_hash = generate_image_hash(image_file)
-    except Exception as e:
-        print(f"Error downloading or hashing image: {e}")
-        # Continue without hash if there's an error
-
-    # Check cache for existing results
-    if image_hash:
-        cached_result = BeautyResult.query.filter_by(image_hash=image_hash).first()
-        if cached_result:
-            print(f"Cache hit for image hash: {image_hash[:16]}...")
-            
-            # Check if this is a cached validation failure
-            if cached_result.validation_error:
-                print(f"Returning cached validation error for image hash: {image_hash[:16]}...")
-                return jsonify({
-                    "error": cached_result.validation_error,
-                    "validation": cached_result.validation_result,
-                    "cached": True,
-                    "cached_at": cached_result.created_at.isoformat()
-                }), 400
-            
-            # Return cached successful results
-            return jsonify({
-                "beauty_ratings": cached_result.beauty_ratings,
-                "overall_score": cached_result.overall_score,
-                "category_scores": cached_result.category_scores,
-                "validation": cached_result.validation_result,
-                "cached": True,
-                "cached_at": cached_result.created_at.isoformat()
-            }), 200
-        else:
-            print(f"Cache miss for image hash: {image_hash[:16]}...")
+    # No-op after warmup; in deferred startup the first rating request loads the analysis stack
+    await asyncio.to_thread(startup.ensure_ready)
+
+    # Claim on this image's analysis, released once its result is stored (single_flight.py)
+    claim = None
+    # Telemetry events of this request's LLM calls, returned when it asks for debug
+    llm_calls = llm_telemetry.collect()
+    debug = Config.LLM_DEBUG_RESPONSE and data.get('debug') is True
 
     # Initialize async OpenAI client for validation and analysis
     try:
-        import asyncio
-        from openai import AsyncOpenAI
         import json
         import time
         
         # Track processing start time
         processing_start_time = time.time()
-        
-        # Initialize async OpenAI client
-        async_client = AsyncOpenAI(api_key=client.api_key)
+        stages = StageTimer()
+        
+        # The worker's pooled AsyncOpenAI client, set once running on the async runtime
+        async_client = None
+
+        image_bytes = None
+        image_hash = None
+        content_digest = None
+        hash_profile = Config.HASH_PROFILE
+        # What the vision model sees: the public URL, or in inline mode the downloaded
+        # bytes normalized once and shared by the validation and every category call
+        model_url = image_url
+
+        async def fetch_image():
+            """Download the image for caching, bounded in time and size. Returns (outcome, response) to stop early."""
+            nonlocal image_bytes
+            try:
+                with stages.stage('download'):
+                    image_bytes = (await download_image_async(
+                        image_url,
+                        http_client,
+                        max_bytes=Config.IMAGE_DOWNLOAD_MAX_BYTES,
+                        connect_timeout=Config.IMAGE_DOWNLOAD_CONNECT_TIMEOUT,
+                        read_timeout=Config.IMAGE_DOWNLOAD_READ_TIMEOUT,
+                        total_timeout=Config.IMAGE_DOWNLOAD_TOTAL_TIMEOUT,
+                        cache=image_cache,
+                    )).content
+            except ImageRejectedError as e:
+                # Too large or not an image: the vision model would fail on it too
+                return "rejected", (jsonify({"error": str(e)}), 400)
+            except DownloadError as e:
+                print(f"Error downloading image: {e}")
+                # Continue without hash if there's an error
+                return None
+            return None
+
+        async def prepare_model_image():
+            """In inline mode, decode and re-encode the image for the model; only on a cache miss."""
+            nonlocal model_url
+            if Config.IMAGE_INPUT_MODE != 'inline' or not image_bytes:
+                return
+            with stages.stage('prepare'):
+                model_url = await asyncio.to_thread(model_image_url, image_url, image_bytes, 'inline',
+                                                    **model_image_options())
+
+        async def check_quality():
+            """Reject unusable images on the CPU before any model call. Returns (outcome, response) to stop early."""
+            if not image_bytes or not Config.QUALITY_GATE_ENABLED:
+                return None
+            try:
+                with stages.stage('quality'):
+                    report = await asyncio.to_thread(check_image_quality, image_bytes, quality_thresholds(),
+                                                     Config.MAX_IMAGE_PIXELS)
+            except Exception as e:
+                # Undecodable here does not mean the model cannot see it; let validation decide
+                print(f"Error checking image quality: {e}")
+                return None
+            quality_gate_metrics.record(report)
+            if report.passed:
+                return None
+            # Not cached: thresholds may be tuned, and the check costs milliseconds
+            return "quality_rejected", (jsonify(rejection_payload(report)), 400)
+
+        async def find_cached_result():
+            """Digest, hash and look up the downloaded image. Returns (outcome, response) on a cache hit."""
+            nonlocal image_hash, content_digest
+            if not image_bytes:
+                return None
+
+            # Queries block: they run on a worker thread so the event loop keeps serving
+            def lookup_digest():
+                cached_result = BeautyResult.query.filter_by(content_digest=content_digest).first()
+                if cached_result:
+                    print(f"Cache hit for content digest: {content_digest[:16]}...")
+                    return cached_result_response(cached_result)
+                # Do not hold a pooled connection while the image hashes
+                db.session.close()
+                return None
+
+            def lookup_hash():
+                # Exact lookup on the fixed-width binary key. Fast and full hashes have different
+                # component counts, so their keys never collide across profiles. The near-duplicate
+                # index works on the phash/whash prefix every profile shares, so it also matches rows
+                # from other profiles and rows the hash_key backfill has not reached yet.
+                cached_result = BeautyResult.query.filter_by(hash_key=cache_key(image_hash)).first()
+                match_distance = 0
+                if not cached_result:
+                    # Fall back to a near-duplicate match (re-encoded, resized or lightly edited re-upload),
+                    # including rows other workers stored since this one loaded its index
+                    try:
+                        near_duplicate_index.refresh()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error refreshing near-duplicate index: {e}")
+                    near_match = near_duplicate_index.find(image_hash)
+                    if near_match:
+                        cached_result = db.session.get(BeautyResult, near_match[0])
+                        match_distance = near_match[1]
+                        if cached_result is None:
+                            # Row was deleted since the index was loaded
+                            near_duplicate_index.remove(near_match[0])
+                if not cached_result:
+                    print(f"Cache miss for image hash: {image_hash[:16]}...")
+                    return None
+
+                print(f"Cache hit for image hash: {image_hash[:16]}... (distance {match_distance})")
+                if cached_result.content_digest is None:
+                    # Let retries of these exact bytes take the digest fast path next time
+                    try:
+                        cached_result.content_digest = content_digest
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error storing content digest: {e}")
+                return cached_result_response(cached_result, match_distance)
+
+            # Identical bytes (client retries, re-submitted URLs) skip decoding and perceptual hashing
+            with stages.stage('lookup'):
+                content_digest = hashlib.sha256(image_bytes).hexdigest()
+                response = await asyncio.to_thread(lookup_digest)
+            if response:
+                return "digest_hit", response
+
+            try:
+                with stages.stage('hash'):
+                    # Reject decompression bombs from the header before any pixels are decoded
+                    check_image_size(io.BytesIO(image_bytes), Config.MAX_IMAGE_PIXELS)
+                    # Hash in the process pool so the GIL-bound work does not stall other requests
+                    image_hash = await hash_pool.hash_image_async(image_bytes, profile=hash_profile)
+            except ImageTooLargeError as e:
+                return "rejected", (jsonify({"error": str(e)}), 400)
+            except Exception as e:
+                print(f"Error hashing image: {e}")
+                # Continue without hash if there's an error
+                return None
+            if not image_hash:
+                return None
+
+            with stages.stage('lookup'):
+                response = await asyncio.to_thread(lookup_hash)
+            if response:
+                return "hash_hit", response
+            return None
+
+        async def coalesce(stop_speculation):
+            """
+            Lead the analysis of this image, or wait for the request already running it.
+
+            Returns (outcome, response) with the leader's stored result, or None to run the
+            analysis here: as the leader, after the leader stored nothing, or after waiting
+            COALESCE_WAIT_SECONDS.
+            """
+            nonlocal claim
+            key = cache_key(image_hash)
+            deadline = time.monotonic() + analysis_flights.wait_seconds
+
+            def stored_result():
+                cached_result = BeautyResult.query.filter_by(hash_key=key).first()
+                if cached_result:
+                    return cached_result_response(cached_result)
+                db.session.close()
+                return None
+
+            # Followers may wait a minute: not on a pooled connection
+            await asyncio.to_thread(db.session.close)
+            while True:
+                claim = await analysis_flights.claim(key)
+                if claim.leading:
+                    # The previous leader may have stored and released between this request's
+                    # lookup miss and its claim: look once more before paying for the analysis
+                    with stages.stage('lookup'):
+                        response = await asyncio.to_thread(stored_result)
+                    if response is None:
+                        return None
+                    await claim.release()
+                    claim = None
+                    analysis_flights.count('stored_before_claim')
+                    return "coalesced", response
+                # The leader's result will answer this request
+                await stop_speculation()
+                with stages.stage('coalesce'):
+                    finished = await claim.wait(deadline - time.monotonic())
+                # Lets this worker's other followers look too when the leader is elsewhere
+                await claim.release()
+                claim = None
+                with stages.stage('lookup'):
+                    response = await asyncio.to_thread(stored_result)
+                if response:
+                    analysis_flights.count('coalesced')
+                    return "coalesced", response
+                if not finished:
+                    analysis_flights.count('follower_timeouts')
+                    return None
+                # The leader stored nothing (failed or gave up): claim it again
+                analysis_flights.count('leader_failed')
+
+        # Initialize prompt loader
+        prompt_loader = PromptLoader()
+        available_categories = prompt_loader.get_available_categories()
+        category_calls = 1 if Config.CATEGORY_ENGINE == 'combined' else len(available_categories)
+        completed_category_calls = 0
+        
+        async def rate_beauty_category(category_name):
+            """Rate a specific beauty category asynchronously using external prompts"""
+            nonlocal completed_category_calls
+            try:
+                # System prompt, predefined samples, golden examples and the image, in PROMPT_LAYOUT order
+                messages = prompt_loader.build_category_messages(
+                    category_name, model_url, gender=gender if gender != 'unknown' else None,
+                    detail=Config.CATEGORY_IMAGE_DETAIL, layout=Config.PROMPT_LAYOUT)
+                
+                # Within the category's deadline, hedged if slow (hedging.py)
+                response = await hedged_calls.call(category_name, lambda: openai_scheduler.create(
+                    async_client,
+                    label=category_name,
+                    model="gpt-5.1",
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    **prompt_cache_options(category_name)
+                ), model="gpt-5.1")
+                completed_category_calls += 1
+                
+                raw_response = response.choices[0].message.content
+                try:
+                    return category_name, category_result(category_name, json.loads(raw_response))
+                except json.JSONDecodeError:
+                    # Fallback if JSON parsing fails
+                    return category_name, {"score": 0, "analysis": raw_response}
+                    
+            except (OpenAIUnavailableError, CallDeadlineError):
+                # Out of retries or time: fail the rating rather than score the category 0
+                raise
+            except Exception as e:
+                print(f"Error rating {category_name}: {e}")
+                return category_name, {"score": 0, "analysis": f"Error: {str(e)}"}
+        
+        async def process_all_categories():
+            """Process all beauty categories concurrently"""
+            nonlocal completed_category_calls
+            # Off the event loop, before the message lists are built
+            await asyncio.to_thread(prompt_loader.load_golden_examples, available_categories)
+            if Config.CATEGORY_ENGINE == 'combined':
+                beauty_ratings = await rate_categories_combined(
+                    async_client, prompt_loader, available_categories, model_url,
+                    gender=gender if gender != 'unknown' else None, model="gpt-5.1")
+                completed_category_calls += 1
+                return beauty_ratings
+            tasks = [
+                asyncio.create_task(rate_beauty_category(category))
+                for category in available_categories
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                # One category out of retries fails the rating: stop the other calls
+                for task in tasks:
+                    task.cancel()
+            return dict(results)
+        
+        async def discard_categories(categories_task):
+            """Cancel category scoring whose result will not be used, counting the calls it wasted."""
+            if not categories_task.done():
+                categories_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await categories_task
+            # Completed calls were paid for in full; cancelled ones may still bill their input
+            rate_image_metrics.count("category_calls_wasted", completed_category_calls)
+            rate_image_metrics.count("category_calls_cancelled", category_calls - completed_category_calls)
+        
+        async def validate_speculatively():
+            """
+            Validate while the image is still being downloaded, checked and hashed.
+
+            The camel check only needs what the model sees, so in URL mode it starts
+            straight away. In inline mode what the model sees is the re-encoded image,
+            which is prepared only on a cache miss, so the check starts after the lookups.
+            The quality gate decodes the whole image, so it runs only when both the digest
+            and the hash lookup miss; repeat uploads keep the one-SHA-256 fast path. If the
+            gate rejects the image or the hash finds a stored result, the in-flight call is
+            cancelled. With SPECULATIVE_CATEGORIES the category calls start alongside it.
+
+            Returns:
+                (validation result, category task or None, None), or (None, None, early response)
+            """
+            validation_task = None
+            categories_task = None
+
+            async def stop_speculation():
+                """Cancel the speculative calls; they start again if still needed."""
+                nonlocal validation_task, categories_task
+                if validation_task is not None and not validation_task.done():
+                    validation_task.cancel()
+                    rate_image_metrics.count("validation_cancelled")
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await validation_task
+                if categories_task is not None:
+                    await discard_categories(categories_task)
+                validation_task = categories_task = None
+
+            def start_validation():
+                nonlocal validation_task, categories_task
+                validation_task = asyncio.create_task(stages.timed(
+                    'validation', validate_camel_image(model_url, async_client, Config.VALIDATION_IMAGE_DETAIL)))
+                if Config.SPECULATIVE_CATEGORIES:
+                    categories_task = asyncio.create_task(stages.timed('categories', process_all_categories()))
+                    rate_image_metrics.count("category_calls_speculative", category_calls)
+
+            try:
+                if Config.SPECULATIVE_VALIDATION and Config.IMAGE_INPUT_MODE != 'inline':
+                    start_validation()
+                early_response = await fetch_image()
+                if early_response is None:
+                    early_response = await find_cached_result()
+                if early_response is None:
+                    # A miss: only images that would be analyzed pay for the full decode
+                    early_response = await check_quality()
+                if early_response is None and image_hash:
+                    early_response = await coalesce(stop_speculation)
+                if early_response is not None:
+                    return None, None, early_response
+                # Lookups done: free the pooled database connection for the model calls' duration
+                await asyncio.to_thread(db.session.close)
+                await prepare_model_image()
+                if validation_task is None:
+                    start_validation()
+                validation_result = await validation_task
+                # The caller owns the category task from here
+                categories_task, speculative_categories = None, categories_task
+                return validation_result, speculative_categories, None
+            finally:
+                await stop_speculation()
         
         # Validate image contains camel before proceeding with analysis
         async def run_validation_and_analysis():
-            # Step 1: Validate the image
-            validation_result = await validate_camel_image(image_url, async_client)
-            
-            if not validation_result["success"]:
-                return {
-                    "error": "Image validation failed",
-                    "details": validation_result["error"],
-                    "validation": validation_result["validation"]
-                }
+            # Step 1: Validate the image (overlapped with download, hash and cache lookup,
+            # and with the category calls in speculative mode)
+            validation_result, categories_task, early_response = await validate_speculatively()
+            if early_response is not None:
+                return {"response": early_response}
+
+            categories_used = False
+            try:
+                if not validation_result["success"]:
+                    return {
+                        "error": "Image validation failed",
+                        "details": validation_result["error"],
+                        "validation": validation_result["validation"]
+                    }
             
-            validation_data = validation_result["validation"]
+                validation_data = validation_result["validation"]
             
-            # Check if image is suitable for analysis
-            if not validation_data.get("contains_camel", False):
-                return {
-                    "error": "No camel detected in image",
-                    "validation": validation_data,
-                    "feedback": validation_data.get("feedback", "The image does not contain a camel."),
-                    "suggestions": [
-                        "Please upload an image that clearly shows a camel",
-                        "Ensure the camel is the main subject of the image",
-                        "Make sure the image quality is good and not blurry"
-                    ]
-                }
+                # Check if image is suitable for analysis
+                if not validation_data.get("contains_camel", False):
+                    return {
+                        "error": "No camel detected in image",
+                        "validation": validation_data,
+                        "feedback": validation_data.get("feedback", "The image does not contain a camel."),
+                        "suggestions": [
+                            "Please upload an image that clearly shows a camel",
+                            "Ensure the camel is the main subject of the image",
+                            "Make sure the image quality is good and not blurry"
+                        ]
+                    }
             
-            if not validation_data.get("overall_suitability", False):
-                missing_parts = validation_data.get("missing_parts", [])
-                quality_issues = validation_data.get("quality_issues", [])
+                if not validation_data.get("overall_suitability", False):
+                    missing_parts = validation_data.get("missing_parts", [])
+                    quality_issues = validation_data.get("quality_issues", [])
                 
-                return {
-                    "error": "Image not suitable for comprehensive beauty analysis",
-                    "validation": validation_data,
-                    "feedback": validation_data.get("feedback", "The camel in the image is not suitable for detailed analysis."),
-                    "missing_parts": missing_parts,
-                    "quality_issues": quality_issues,
-                    "suggestions": [
-                        "Upload an image where the camel's body parts are clearly visible",
-                        "Ensure good lighting and image quality",
-                        "The camel should be positioned to show head, neck, body, and legs"
-                    ]
-                }
-            
-            # Image passed validation, proceed with beauty analysis
-            print(f"Image validation passed - proceeding with beauty analysis")
+                    return {
+                        "error": "Image not suitable for comprehensive beauty analysis",
+                        "validation": validation_data,
+                        "feedback": validation_data.get("feedback", "The camel in the image is not suitable for detailed analysis."),
+                        "missing_parts": missing_parts,
+                        "quality_issues": quality_issues,
+                        "suggestions": [
+                            "Upload an image where the camel's body parts are clearly visible",
+                            "Ensure good lighting and image quality",
+                            "The camel should be positioned to show head, neck, body, and legs"
+                        ]
+                    }
             
-            # Initialize prompt loader
-            prompt_loader = PromptLoader()
-            available_categories = prompt_loader.get_available_categories()
-            
-            async def rate_beauty_category(category_name):
-                """Rate a specific beauty category asynchronously using external prompts"""
-                try:
-                    # Get system prompt and build messages with predefined samples
-                    system_prompt = prompt_loader.get_system_prompt(category_name, gender=gender if gender != 'unknown' else None)
-                    messages = prompt_loader.build_messages(category_name, image_url)
-                    
-                    response = await async_client.chat.completions.create(
-                        model="gpt-5.1",
-                        messages=[
-                            {"role": "system", "content": system_prompt}
-                        ] + messages,
-                        response_format={"type": "json_object"}
-                    )
-                    
-                    raw_response = response.choices[0].message.content
-                    try:
-                        parsed_response = json.loads(raw_response)
-                        
-                        # Check if this is an error response from the AI
-                        if isinstance(parsed_response, dict) and parsed_response.get('error') is True:
-                            # Handle error response - camel not found or partially visible
-                            error_message = parsed_response.get('message', 'Unknown error')
-                            category = parsed_response.get('category', category_name)
-                            
-                            return category_name, {
-                                "error": True,
-                                "message": error_message,
-                                "category": category,
-                                "category_score": None
-                            }
-                        
-                        return category_name, parsed_response
-                    except json.JSONDecodeError:
-                        # Fallback if JSON parsing fails
-                        return category_name, {"score": 0, "analysis": raw_response}
-                        
-                except Exception as e:
-                    print(f"Error rating {category_name}: {e}")
-                    return category_name, {"score": 0, "analysis": f"Error: {str(e)}"}
-            
-            async def process_all_categories():
-                """Process all beauty categories concurrently"""
-                tasks = [
-                    rate_beauty_category(category) 
-                    for category in available_categories
-                ]
-                results = await asyncio.gather(*tasks)
-                return dict(results)
-            
-            # Run async processing
-            beauty_ratings = await process_all_categories()
+                # Image passed validation, proceed with beauty analysis
+                print(f"Image validation passed - proceeding with beauty analysis")
+
+                # Run async processing (already running in speculative mode)
+                if categories_task is None:
+                    categories_task = asyncio.create_task(stages.timed('categories', process_all_categories()))
+                beauty_ratings = await categories_task
+                categories_used = True
+            finally:
+                # A rejected image makes any category calls already made wasted spend
+                if categories_task is not None and not categories_used:
+                    await discard_categories(categories_task)
             
             # Calculate overall score using attribute-based weighted scoring
             all_attributes = []
@@ -861,26 +1237,33 @@ def rate_image():
                 "category_scores": category_scores
             }
         
-        # Run the validation and analysis with proper cleanup
-        async def run_with_cleanup():
-            try:
-                return await run_validation_and_analysis()
-            finally:
-                # Properly close the async client before the event loop closes
-                await async_client.close()
+        # Run the validation and analysis on the worker's event loop
+        async def run_with_client():
+            nonlocal async_client
+            async_client = async_runtime.openai_client()
+            return await run_validation_and_analysis()
         
-        result = asyncio.run(run_with_cleanup())
+        result = await run_with_client()
+
+        # Rejected image or stored result found while validation was in flight
+        if "response" in result:
+            outcome, response = result["response"]
+            rate_image_metrics.record(stages, outcome)
+            return response
         
         # Handle validation errors
         if "error" in result:
+            rate_image_metrics.record(stages, "invalid")
             # Cache validation failures to avoid repeated validation calls
-            if image_hash:
+            def store_validation_failure():
                 try:
                     validation_error = result.get("error", "Unknown validation error")
                     validation_data = result.get("validation", {})
                     
                     beauty_result = BeautyResult(
                         image_hash=image_hash,
+                        hash_profile=hash_profile,
+                        content_digest=content_digest,
                         image_url=image_url,
                         beauty_ratings=None,  # No beauty analysis for failed validation
                         overall_score=None,
@@ -892,15 +1275,21 @@ def rate_image():
                     )
                     db.session.add(beauty_result)
                     db.session.commit()
+                    near_duplicate_index.add(beauty_result.id, image_hash)
                     print(f"Cached validation failure for image hash: {image_hash[:16]}...")
                 except Exception as cache_error:
+                    db.session.rollback()
                     print(f"Error caching validation failure: {cache_error}")
                     # Continue without caching if there's an error
             
+            if image_hash:
+                await asyncio.to_thread(store_validation_failure)
             return jsonify(result), 400
         
         # Process successful results
+        timings = rate_image_metrics.record(stages, "rated")
         beauty_ratings = result["beauty_ratings"]
+        validation_data = result["validation"]
         overall_score = result["overall_score"]
         category_scores = result["category_scores"]
         processing_time = result["processing_time"]
@@ -923,9 +1312,11 @@ def rate_image():
             "processing_time": processing_time,
             "validation": result["validation"]
         }
+        if debug:
+            final_response["debug"] = {**llm_telemetry.summary(llm_calls), "timings": timings}
         
         # Save to cache if we have a valid image hash
-        if image_hash:
+        def store_result():
             try:
                 # Prepare cache-friendly category scores (also hiding leg)
                 cache_category_scores = category_scores.copy()
@@ -934,6 +1325,8 @@ def rate_image():
 
                 beauty_result = BeautyResult(
                     image_hash=image_hash,
+                    hash_profile=hash_profile,
+                    content_digest=content_digest,
                     image_url=image_url,
                     # Save the sanitized version to DB as requested ("cache result dosnt have leg too")
                     beauty_ratings=client_beauty_ratings,
@@ -946,13 +1339,15 @@ def rate_image():
                 )
                 db.session.add(beauty_result)
                 db.session.commit()
+                near_duplicate_index.add(beauty_result.id, image_hash)
                 print(f"Cached results for image hash: {image_hash[:16]}...")
             except Exception as cache_error:
+                db.session.rollback()
                 print(f"Error caching results: {cache_error}")
                 # Continue without caching if there's an error
         
         # Save conversation if logged in
-        if user_id:
+        def save_conversation():
             convo = Conversation(
                 user_id=user_id,
                 prompt="Multi-category beauty rating analysis",
@@ -962,11 +1357,29 @@ def rate_image():
             db.session.add(convo)
             db.session.commit()
 
+        if image_hash:
+            await asyncio.to_thread(store_result)
+        if user_id:
+            await asyncio.to_thread(save_conversation)
+
         return jsonify(final_response), 200
 
+    except OpenAIUnavailableError as e:
+        print(f"OpenAI unavailable: {e}")
+        rate_image_metrics.count("unavailable")
+        return unavailable_response(e)
+    except CallDeadlineError as e:
+        print(f"Rating deadline exceeded: {e}")
+        rate_image_metrics.count("deadline_exceeded")
+        return deadline_response(e)
     except Exception as e:
         print(f"OpenAI API error: {e}")
+        rate_image_metrics.count("failed")
         return jsonify({"error": "Failed to process image"}), 500
+    finally:
+        # Result stored (or not): the requests waiting on this image look it up now
+        if claim is not None:
+            await claim.release()
 
 
 @app.route('/api/compare-beauty', methods=["POST"])
@@ -1009,6 +1422,10 @@ def compare_beauty():
               enum: ["male", "female", "unknown"]
               example: "male"
               description: "Gender of the camels (optional)"
+            debug:
+              type: boolean
+              example: false
+              description: "Include per-call LLM telemetry in the response (needs LLM_DEBUG_RESPONSE)"
     responses:
       200:
         description: Beauty comparison returned successfully
@@ -1040,8 +1457,29 @@ def compare_beauty():
           properties:
             error:
               type: string
+      503:
+        description: OpenAI rate limited or unavailable after retries; retry after the Retry-After header
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      504:
+        description: A category call exceeded CATEGORY_DEADLINE_SECONDS; nothing was stored
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
     """
     
+    return async_runtime.run(compare_beauty_async())
+
+
+async def compare_beauty_async():
+    """The compare_beauty analysis as a coroutine; see rate_image_async."""
+    import asyncio
+
     data = request.get_json()
     if not data or 'image_url_1' not in data or 'image_url_2' not in data:
         return jsonify({"error": "Both image URLs are required (image_url_1 and image_url_2)"}), 400
@@ -1051,26 +1489,50 @@ def compare_beauty():
     gender = data.get('gender', 'unknown')  # Default to 'unknown' if not provided
     user_id = get_jwt_identity()
 
+    await asyncio.to_thread(startup.ensure_ready)
+
     # Validate gender parameter
     if gender not in ['male', 'female', 'unknown']:
         return jsonify({"error": "Gender must be 'male', 'female', or 'unknown'"}), 400
 
+    llm_calls = llm_telemetry.collect()
+    debug = Config.LLM_DEBUG_RESPONSE and data.get('debug') is True
+
     try:
-        import asyncio
-        from openai import AsyncOpenAI
         import json
         import time
         
         # Track processing start time
         processing_start_time = time.time()
         
-        # Initialize async OpenAI client
-        async_client = AsyncOpenAI(api_key=client.api_key)
+        # The worker's pooled AsyncOpenAI client, set once running on the async runtime
+        async_client = None
         
+        async def inline_image_url(image_url):
+            """Download and normalize one image for inline mode, falling back to its URL."""
+            try:
+                downloaded = await download_image_async(
+                    image_url,
+                    http_client,
+                    max_bytes=Config.IMAGE_DOWNLOAD_MAX_BYTES,
+                    connect_timeout=Config.IMAGE_DOWNLOAD_CONNECT_TIMEOUT,
+                    read_timeout=Config.IMAGE_DOWNLOAD_READ_TIMEOUT,
+                    total_timeout=Config.IMAGE_DOWNLOAD_TOTAL_TIMEOUT,
+                    cache=image_cache,
+                )
+            except DownloadError as e:
+                print(f"Error downloading image, sending URL instead: {e}")
+                return image_url
+            return await asyncio.to_thread(model_image_url, image_url, downloaded.content, 'inline',
+                                           **model_image_options())
+
         async def analyze_single_camel(image_url, camel_name):
             """Analyze a single camel image and return beauty ratings"""
+            if Config.IMAGE_INPUT_MODE == 'inline':
+                image_url = await inline_image_url(image_url)
+
             # Step 1: Validate the image
-            validation_result = await validate_camel_image(image_url, async_client)
+            validation_result = await validate_camel_image(image_url, async_client, Config.VALIDATION_IMAGE_DETAIL)
             
             if not validation_result["success"]:
                 return {
@@ -1106,51 +1568,49 @@ def compare_beauty():
             async def rate_beauty_category(category_name):
                 """Rate a specific beauty category asynchronously using external prompts"""
                 try:
-                    # Get system prompt and build messages with predefined samples
-                    system_prompt = prompt_loader.get_system_prompt(category_name, gender=gender if gender != 'unknown' else None)
-                    messages = prompt_loader.build_messages(category_name, image_url)
+                    # System prompt, predefined samples, golden examples and the image, in PROMPT_LAYOUT order
+                    messages = prompt_loader.build_category_messages(
+                        category_name, image_url, gender=gender if gender != 'unknown' else None,
+                        detail=Config.CATEGORY_IMAGE_DETAIL, layout=Config.PROMPT_LAYOUT)
                     
-                    response = await async_client.chat.completions.create(
+                    response = await hedged_calls.call(category_name, lambda: openai_scheduler.create(
+                        async_client,
+                        label=category_name,
                         model="gpt-5",
-                        messages=[
-                            {"role": "system", "content": system_prompt}
-                        ] + messages,
-                        response_format={"type": "json_object"}
-                    )
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        **prompt_cache_options(category_name)
+                    ), model="gpt-5")
                     
                     raw_response = response.choices[0].message.content
                     try:
-                        parsed_response = json.loads(raw_response)
-                        
-                        # Check if this is an error response from the AI
-                        if isinstance(parsed_response, dict) and parsed_response.get('error') is True:
-                            # Handle error response - camel not found or partially visible
-                            error_message = parsed_response.get('message', 'Unknown error')
-                            category = parsed_response.get('category', category_name)
-                            
-                            return category_name, {
-                                "error": True,
-                                "message": error_message,
-                                "category": category,
-                                "category_score": None
-                            }
-                        
-                        return category_name, parsed_response
+                        return category_name, category_result(category_name, json.loads(raw_response))
                     except json.JSONDecodeError:
                         # Fallback if JSON parsing fails
                         return category_name, {"score": 0, "analysis": raw_response}
                         
+                except (OpenAIUnavailableError, CallDeadlineError):
+                    raise
                 except Exception as e:
                     print(f"Error rating {category_name} for {camel_name}: {e}")
                     return category_name, {"score": 0, "analysis": f"Error: {str(e)}"}
             
             async def process_all_categories():
                 """Process all beauty categories concurrently"""
+                await asyncio.to_thread(prompt_loader.load_golden_examples, available_categories)
+                if Config.CATEGORY_ENGINE == 'combined':
+                    return await rate_categories_combined(
+                        async_client, prompt_loader, available_categories, image_url,
+                        gender=gender if gender != 'unknown' else None, model="gpt-5")
                 tasks = [
-                    rate_beauty_category(category) 
+                    asyncio.create_task(rate_beauty_category(category))
                     for category in available_categories
                 ]
-                results = await asyncio.gather(*tasks)
+                try:
+                    results = await asyncio.gather(*tasks)
+                finally:
+                    for task in tasks:
+                        task.cancel()
                 return dict(results)
             
             # Run async processing
@@ -1209,22 +1669,24 @@ def compare_beauty():
         
         # Analyze both camels concurrently
         async def run_comparison_analysis():
-            camel_1_task = analyze_single_camel(image_url_1, "Camel 1")
-            camel_2_task = analyze_single_camel(image_url_2, "Camel 2")
+            camel_1_task = asyncio.create_task(analyze_single_camel(image_url_1, "Camel 1"))
+            camel_2_task = asyncio.create_task(analyze_single_camel(image_url_2, "Camel 2"))
             
-            camel_1_result, camel_2_result = await asyncio.gather(camel_1_task, camel_2_task)
+            try:
+                camel_1_result, camel_2_result = await asyncio.gather(camel_1_task, camel_2_task)
+            finally:
+                camel_1_task.cancel()
+                camel_2_task.cancel()
             
             return camel_1_result, camel_2_result
         
-        # Run the comparison analysis with proper cleanup
-        async def run_with_cleanup():
-            try:
-                return await run_comparison_analysis()
-            finally:
-                # Properly close the async client before the event loop closes
-                await async_client.close()
+        # Run the comparison analysis on the worker's event loop
+        async def run_with_client():
+            nonlocal async_client
+            async_client = async_runtime.openai_client()
+            return await run_comparison_analysis()
         
-        camel_1_result, camel_2_result = asyncio.run(run_with_cleanup())
+        camel_1_result, camel_2_result = await run_with_client()
         
         # Handle validation errors for either camel
         if "error" in camel_1_result:
@@ -1291,9 +1753,11 @@ def compare_beauty():
             "categories_analyzed": camel_1_result["categories_analyzed"],
             "processing_time": round(processing_time, 3)
         }
+        if debug:
+            final_response["debug"] = llm_telemetry.summary(llm_calls)
         
         # Save conversation if logged in
-        if user_id:
+        def save_conversation():
             convo = Conversation(
                 user_id=user_id,
                 prompt=f"Beauty comparison analysis (Gender: {gender})",
@@ -1303,8 +1767,17 @@ def compare_beauty():
             db.session.add(convo)
             db.session.commit()
 
+        if user_id:
+            await asyncio.to_thread(save_conversation)
+
         return jsonify(final_response), 200
 
+    except OpenAIUnavailableError as e:
+        print(f"OpenAI unavailable in comparison: {e}")
+        return unavailable_response(e)
+    except CallDeadlineError as e:
+        print(f"Comparison deadline exceeded: {e}")
+        return deadline_response(e)
     except Exception as e:
         print(f"OpenAI API error in comparison: {e}")
         return jsonify({"error": "Failed to process comparison"}), 500
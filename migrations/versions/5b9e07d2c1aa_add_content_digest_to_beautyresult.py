@@ -0,0 +1,28 @@
+"""Add content_digest to BeautyResult
+
+Revision ID: 5b9e07d2c1aa
+Revises: c3f1a8e2d4b7
+Create Date: 2026-10-18 11:47:05.602913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e07d2c1aa'
+down_revision = 'c3f1a8e2d4b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('beauty_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_digest', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_beauty_results_content_digest'), ['content_digest'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('beauty_results', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_beauty_results_content_digest'))
+        batch_op.drop_column('content_digest')
@@ -0,0 +1,36 @@
+"""Add binary hash_key and component columns to BeautyResult
+
+Revision ID: 8f4c2a6e91d3
+Revises: 5b9e07d2c1aa
+Create Date: 2026-10-18 13:02:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4c2a6e91d3'
+down_revision = '5b9e07d2c1aa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # hash_key stays nullable until `flask backfill-hash-keys` has filled existing rows;
+    # the unique index tolerates NULLs, so new and old rows coexist in the meantime.
+    with op.batch_alter_table('beauty_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hash_key', sa.LargeBinary(length=32), nullable=True))
+        batch_op.add_column(sa.Column('phash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('whash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_beauty_results_hash_key'), ['hash_key'], unique=True)
+        batch_op.drop_index('ix_beauty_results_image_hash')
+
+
+def downgrade():
+    with op.batch_alter_table('beauty_results', schema=None) as batch_op:
+        batch_op.create_index('ix_beauty_results_image_hash', ['image_hash'], unique=True)
+        batch_op.drop_index(batch_op.f('ix_beauty_results_hash_key'))
+        batch_op.drop_column('whash')
+        batch_op.drop_column('phash')
+        batch_op.drop_column('hash_key')
@@ -0,0 +1,29 @@
+"""Add analysis_leases for cross-worker coalescing of image analyses
+
+Revision ID: b7e4d2f9a613
+Revises: 8f4c2a6e91d3
+Create Date: 2026-10-18 16:24:09.310742
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2f9a613'
+down_revision = '8f4c2a6e91d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('analysis_leases',
+    sa.Column('hash_key', sa.LargeBinary(length=32), nullable=False),
+    sa.Column('owner', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('hash_key')
+    )
+
+
+def downgrade():
+    op.drop_table('analysis_leases')
@@ -0,0 +1,27 @@
+"""Add hash_profile to BeautyResult
+
+Revision ID: c3f1a8e2d4b7
+Revises: 41d7b292a085
+Create Date: 2026-10-18 09:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a8e2d4b7'
+down_revision = '41d7b292a085'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows were all hashed with the six-component ("full") key
+    with op.batch_alter_table('beauty_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hash_profile', sa.String(length=20), server_default='full', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('beauty_results', schema=None) as batch_op:
+        batch_op.drop_column('hash_profile')
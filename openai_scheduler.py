@@ -0,0 +1,429 @@
+"""
+Per-worker scheduler for OpenAI calls.
+
+A rating fans out five concurrent completions and a comparison ten, and nothing
+coordinated them across requests: a burst of ratings went straight into the API's
+rate limits, and a 429 on a category call was turned into a score of 0.
+
+Every async completion goes through OpenAIScheduler.create(), which per model
+    - caps the calls in flight (OPENAI_MAX_CONCURRENCY),
+    - paces calls with token buckets for requests and tokens per minute (OPENAI_RPM,
+      OPENAI_TPM; 0 disables), charged up front from an estimate of the call's tokens
+      and corrected from the response's usage,
+    - retries rate limits, timeouts, connection errors and 5xx responses with
+      exponential backoff and full jitter, waiting at least as long as the response's
+      retry-after; a 429 also holds back the model's other calls for that long.
+
+Calls can carry a label (the category, "validation"). Each label's upstream prompt-cache
+use is recorded from usage.prompt_tokens_details.cached_tokens: the share of calls and
+of prompt tokens served from the cache, and the median latency of calls with and
+without a cache hit (see PROMPT_LAYOUT in prompt_loader.py). With a telemetry sink,
+every call also reports its queue wait, latency, tokens, retries and outcome
+(llm_telemetry.py).
+
+A call that still fails after OPENAI_MAX_RETRIES retries, or whose retry-after is longer
+than OPENAI_RETRY_MAX_SECONDS, raises OpenAIUnavailableError, which the views answer
+with 503. Other API errors (bad request, authentication) are raised unchanged and
+without retrying.
+
+Limits are per worker process, so set them to the organization's limits divided by
+the number of workers. The state is guarded by a thread lock instead of asyncio
+primitives, so the limits also hold across event loops (with
+ASYNC_RUNTIME_ENABLED=false every request runs its own).
+"""
+import asyncio
+import collections
+import random
+import statistics
+import threading
+import time
+
+# Billed for a vision input at detail "low", and for a typical photo at "high"/"auto"
+LOW_DETAIL_IMAGE_TOKENS = 85
+HIGH_DETAIL_IMAGE_TOKENS = 765
+# Output charged up front when the call sets no max_completion_tokens
+DEFAULT_COMPLETION_TOKENS = 600
+# Recent queue waits kept per model for percentiles
+WAIT_WINDOW = 500
+
+
+class OpenAIUnavailableError(Exception):
+    """An OpenAI call that still failed after the scheduler's retries."""
+
+    def __init__(self, model: str, attempts: int, retry_after: float = None, error: Exception = None):
+        super().__init__(f"{model} unavailable after {attempts} attempts: {error}")
+        self.model = model
+        self.attempts = attempts
+        self.retry_after = retry_after
+
+
+def parse_model_limits(value: str) -> dict:
+    """
+    Parse OPENAI_MODEL_LIMITS, e.g. "gpt-4o=64/5000/800000,gpt-5.1=32/500/500000".
+
+    Each entry is model=concurrency/rpm/tpm; trailing fields may be left out to keep
+    the defaults.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (value or '').split(','))):
+        model, _, fields = entry.partition('=')
+        names = ('max_concurrency', 'rpm', 'tpm')
+        limits[model.strip()] = {name: int(field) for name, field in zip(names, fields.split('/')) if field}
+    return limits
+
+
+def estimate_tokens(params: dict) -> int:
+    """Tokens a chat completion will be billed, estimated before sending it."""
+    tokens = 0
+    for message in params.get('messages', []):
+        content = message.get('content')
+        parts = [{'type': 'text', 'text': content}] if isinstance(content, str) else content or []
+        tokens += 4
+        for part in parts:
+            if part.get('type') == 'text':
+                tokens += len(part['text']) // 4
+            elif part.get('type') == 'image_url':
+                # Data URLs are billed by pixels, not by their length
+                low = part['image_url'].get('detail') == 'low'
+                tokens += LOW_DETAIL_IMAGE_TOKENS if low else HIGH_DETAIL_IMAGE_TOKENS
+    return tokens + (params.get('max_completion_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+
+def retry_after_seconds(error: Exception):
+    """The wait an error response asked for (retry-after-ms or retry-after), or None."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        # An HTTP date: fall back to backoff
+        pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, timeouts, connection errors and server errors; the SDK retries the same set."""
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        if getattr(error, 'code', None) == 'insufficient_quota':
+            # Billing, not load: retrying cannot help
+            return False
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+class TokenBucket:
+    """Requests or tokens per minute, refilled continuously and holding a second's worth."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount, going into debt if needed; returns the seconds until the debt is repaid."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float):
+        """Charge (or refund, if negative) the difference between an estimate and the actual use."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class Slots:
+    """
+    A counting semaphore that works from any thread and event loop.
+
+    A released slot passes straight to the longest waiter, which is woken on its own loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._waiters = collections.deque()  # (loop, future)
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        with self._lock:
+            if self.in_use < self.limit and not self._waiters:
+                self.in_use += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, waiter))
+                    granted = False
+                except ValueError:
+                    granted = True
+            # Granted and woken, but cancelled before it ran: hand the slot on. If the
+            # wakeup is still pending, _wake sees the cancelled waiter and does it.
+            if granted and waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._wake, waiter)
+                    return
+                except RuntimeError:
+                    # Its loop has closed; try the next waiter
+                    continue
+            self.in_use -= 1
+
+    def _wake(self, waiter):
+        if waiter.done():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+
+class ModelLimits:
+    """Concurrency, pacing and counters for one model."""
+
+    def __init__(self, max_concurrency: int, rpm: int, tpm: int):
+        self.slots = Slots(max_concurrency)
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.held_until = 0.0  # monotonic time before which no call starts, after a 429
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.unavailable = 0
+        self.waits = collections.deque(maxlen=WAIT_WINDOW)
+
+
+class PromptCacheStats:
+    """Upstream prompt-cache use by one label's calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.latency_ms = {'hit': collections.deque(maxlen=WAIT_WINDOW), 'miss': collections.deque(maxlen=WAIT_WINDOW)}
+
+    def record(self, usage, latency_ms: float):
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None) or 0
+        self.calls += 1
+        self.hits += cached > 0
+        self.prompt_tokens += getattr(usage, 'prompt_tokens', None) or 0
+        self.cached_tokens += cached
+        self.latency_ms['hit' if cached else 'miss'].append(latency_ms)
+
+    def snapshot(self) -> dict:
+        hit, miss = (round(statistics.median(self.latency_ms[kind]), 1) if self.latency_ms[kind] else None
+                     for kind in ('hit', 'miss'))
+        return {
+            'calls': self.calls,
+            'hit_rate': round(self.hits / self.calls, 3) if self.calls else 0.0,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cached_share': round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            'latency_ms_p50': {'hit': hit, 'miss': miss},
+            # Confounded by prompt size and load, but the trend is what matters
+            'latency_saving_ms': round(miss - hit, 1) if hit is not None and miss is not None else None,
+        }
+
+
+class OpenAIScheduler:
+    """Per-model concurrency caps, rate-limit pacing and retries for async OpenAI calls."""
+
+    def __init__(self, max_concurrency: int = 32, rpm: int = 0, tpm: int = 0, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 20.0, model_limits: dict = None,
+                 telemetry=None):
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.model_limits = model_limits or {}
+        self.telemetry = telemetry  # LLMTelemetry, sent an event per call
+        self._models = {}
+        self._prompt_cache = collections.defaultdict(PromptCacheStats)  # label -> stats
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_concurrency = app.config.get("OPENAI_MAX_CONCURRENCY", self.max_concurrency)
+        self.rpm = app.config.get("OPENAI_RPM", self.rpm)
+        self.tpm = app.config.get("OPENAI_TPM", self.tpm)
+        self.max_retries = app.config.get("OPENAI_MAX_RETRIES", self.max_retries)
+        self.backoff_base = app.config.get("OPENAI_RETRY_BASE_SECONDS", self.backoff_base)
+        self.backoff_max = app.config.get("OPENAI_RETRY_MAX_SECONDS", self.backoff_max)
+        self.model_limits = parse_model_limits(app.config.get("OPENAI_MODEL_LIMITS", ""))
+        with self._lock:
+            self._models = {}
+
+    def _limits(self, model: str) -> ModelLimits:
+        with self._lock:
+            limits = self._models.get(model)
+            if limits is None:
+                settings = {'max_concurrency': self.max_concurrency, 'rpm': self.rpm, 'tpm': self.tpm}
+                settings.update(self.model_limits.get(model, {}))
+                limits = self._models[model] = ModelLimits(**settings)
+            return limits
+
+    async def create(self, client, label: str = None, **params):
+        """
+        client.chat.completions.create(**params), scheduled and retried.
+
+        Args:
+            client: AsyncOpenAI client (its own retries should be off: max_retries=0)
+            label: What the call is for (category name, "validation"), for the prompt-cache
+                stats and the call's telemetry event
+            **params: Chat completion parameters; model is required
+
+        Returns:
+            The ChatCompletion
+
+        Raises:
+            OpenAIUnavailableError: Still rate limited or failing after the retries
+        """
+        trace = {'attempts': 0, 'queue_wait_ms': 0.0, 'response_ms': None}
+        start = time.monotonic()
+        outcome, response = 'error', None
+        try:
+            response = await self._create(client, label, params, trace)
+            outcome = 'ok'
+            return response
+        except OpenAIUnavailableError:
+            outcome = 'unavailable'
+            raise
+        except asyncio.CancelledError:
+            # A speculative call stopped, or a request abandoned
+            outcome = 'cancelled'
+            raise
+        finally:
+            if self.telemetry is not None:
+                try:
+                    self.telemetry.record(
+                        params.get('model'), label, outcome, retries=max(0, trace['attempts'] - 1),
+                        queue_wait_ms=trace['queue_wait_ms'], response_ms=trace['response_ms'],
+                        total_ms=(time.monotonic() - start) * 1000, usage=getattr(response, 'usage', None))
+                except Exception as e:
+                    print(f"Error recording LLM call telemetry: {e}")
+
+    async def _create(self, client, label: str, params: dict, trace: dict):
+        model = params['model']
+        limits = self._limits(model)
+        estimate = estimate_tokens(params)
+        attempt = 0
+        while True:
+            trace['queue_wait_ms'] += await self._acquire(limits, estimate)
+            trace['attempts'] += 1
+            start = time.monotonic()
+            try:
+                response = await client.chat.completions.create(**params)
+            except Exception as e:
+                error = e
+            else:
+                trace['response_ms'] = (time.monotonic() - start) * 1000
+                usage = getattr(response, 'usage', None)
+                if usage is not None:
+                    with self._lock:
+                        if limits.tokens is not None:
+                            limits.tokens.adjust(usage.total_tokens - estimate)
+                        if label is not None:
+                            self._prompt_cache[label].record(usage, trace['response_ms'])
+                return response
+            finally:
+                limits.slots.release()
+
+            if not is_retryable(error):
+                raise error
+            retry_after = retry_after_seconds(error)
+            with self._lock:
+                if getattr(error, 'status_code', None) == 429:
+                    limits.rate_limited += 1
+                    if retry_after:
+                        # The limit is shared: every queued call for the model waits it out
+                        limits.held_until = max(limits.held_until, time.monotonic() + retry_after)
+                if attempt >= self.max_retries or (retry_after or 0) > self.backoff_max:
+                    limits.unavailable += 1
+                    raise OpenAIUnavailableError(model, attempt + 1, retry_after, error) from error
+                limits.retries += 1
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            print(f"OpenAI {model} call failed ({error}), retry {attempt + 1} in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, limits: ModelLimits, estimate: int) -> float:
+        """Take a slot, then wait out the pacing; records and returns the milliseconds queued."""
+        start = time.monotonic()
+        await limits.slots.acquire()
+        try:
+            with self._lock:
+                now = time.monotonic()
+                delay = max(0.0, limits.held_until - now)
+                if limits.requests is not None:
+                    delay = max(delay, limits.requests.reserve(1, now))
+                if limits.tokens is not None:
+                    delay = max(delay, limits.tokens.reserve(estimate, now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            limits.slots.release()
+            raise
+        waited_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            limits.calls += 1
+            limits.waits.append(waited_ms)
+        return waited_ms
+
+    def reset_stats(self):
+        with self._lock:
+            for limits in self._models.values():
+                limits.calls = limits.retries = limits.rate_limited = limits.unavailable = 0
+                limits.waits.clear()
+            self._prompt_cache.clear()
+
+    def stats(self) -> dict:
+        """Per model: calls started, retries, 429s, calls given up on, slots in use, and queue wait."""
+        with self._lock:
+            models = {}
+            for model, limits in self._models.items():
+                waits = sorted(limits.waits)
+                models[model] = {
+                    'calls': limits.calls,
+                    'retries': limits.retries,
+                    'rate_limited': limits.rate_limited,
+                    'unavailable': limits.unavailable,
+                    'in_flight': limits.slots.in_use,
+                    'queued': limits.slots.waiting,
+                    'limit': limits.slots.limit,
+                    'queue_wait_ms': {
+                        'p50': round(waits[len(waits) // 2], 1) if waits else 0.0,
+                        'p95': round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 1) if waits else 0.0,
+                        'max': round(waits[-1], 1) if waits else 0.0,
+                    },
+                }
+            return models
+
+    def prompt_cache_stats(self) -> dict:
+        """Per label: share of calls and prompt tokens served from the upstream prompt cache."""
+        with self._lock:
+            return {label: stats.snapshot() for label, stats in sorted(self._prompt_cache.items())}
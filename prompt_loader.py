@@ -1,13 +1,32 @@
 import json
 import os
+import re
 from typing import Dict, List, Any
 
+from image_inline import image_content
+
+COMBINED_SYSTEM_PROMPT = """# Role and Objective
+You are an expert camel beauty judge. Evaluate each region of the camel listed below ({regions}) in the same target image. Each region has its own judging guide and reference images; apply each guide only to its own region and score the regions independently.
+
+# Output Format
+Return one JSON object with one key per region ({keys}). Each value is what that region's guide asks for: its error object if the region cannot be evaluated, otherwise its scored object with the attributes in the required order.
+"""
+
+AGE_CLASSES = ["BABY", "YOUNG", "ADULT"]
+
+# How a category call's messages are laid out (Config.PROMPT_LAYOUT): "inline" splices the
+# gender into the system prompt; "prefix" keeps the most static content first so calls
+# share the longest byte-identical prefix, which is what upstream prompt caching matches
+PROMPT_LAYOUTS = ("inline", "prefix")
+
+
 class PromptLoader:
     """Utility class for loading and managing beauty category prompts."""
     
     def __init__(self, prompts_dir: str = "prompts"):
         self.prompts_dir = prompts_dir
         self._prompts_cache = {}
+        self._golden_cache = {}  # category -> messages, from load_golden_examples
     
     def load_prompt(self, category: str) -> Dict[str, Any]:
         """Load prompt configuration for a specific beauty category."""
@@ -25,11 +44,108 @@ class PromptLoader:
         self._prompts_cache[category] = prompt_data
         return prompt_data
     
-    def build_messages(self, category: str, user_image_url: str, user_text: str = None) -> List[Dict[str, Any]]:
+    def build_messages(self, category: str, user_image_url: str, user_text: str = None,
+                       detail: str = None) -> List[Dict[str, Any]]:
         """
         Build the full message list including dynamic Golden Examples (Few-Shot Learning).
+
+        detail sets the vision detail level of the user's image ("low", "high" or "auto").
         """
-        # 1. Fetch "Golden Examples" (Approved corrections)
+        prompt_data = self.load_prompt(category)
+        messages = []
+
+        # 1. Add Predefined/Static Messages (Reference Images)
+        # Strategy: usage static examples as baseline, but if we have golden examples, we might mix them
+        # For now, let's KEEP static examples but append golden ones as "User Corrections"
+        # OR: specific override strategy.
+        # Let's use: Static Examples -> Golden Examples -> Target Image
+        
+        static_messages = prompt_data.get("predefined_messages", [])
+        messages.extend(static_messages)
+        
+        # 2. Inject Golden Examples (Approved corrections)
+        messages.extend(self.golden_example_messages(category))
+
+        # 3. Add the User's Target Image
+        messages.append(self.target_message(category, user_image_url, user_text=user_text, detail=detail))
+        
+        return messages
+    
+    def target_message(self, category: str, user_image_url: str, user_text: str = None,
+                       detail: str = None) -> Dict[str, Any]:
+        """The final user message: the image to rate."""
+        user_content = []
+        if user_text:
+            user_content.append({"type": "text", "text": user_text})
+        
+        user_content.extend([
+            {
+                "type": "text",
+                "text": f"Now please analyze this {category} and provide a detailed beauty rating from 1-10:"
+            },
+            image_content(user_image_url, detail)
+        ])
+        return {
+            "role": "user",
+            "content": user_content
+        }
+    
+    def build_category_messages(self, category: str, user_image_url: str, gender: str = None,
+                                detail: str = None, layout: str = "inline") -> List[Dict[str, Any]]:
+        """
+        The complete message list for one category's call, system prompt included.
+
+        With layout "prefix" the content runs from most to least static: the system prompt
+        (the same for every gender), the reference images, then the gender context and the
+        golden examples, then the target image. Calls for a category then share everything
+        up to the gender, whatever the gender or the latest approved corrections.
+        """
+        if layout != "prefix":
+            system_prompt = self.get_system_prompt(category, gender=gender)
+            return [{"role": "system", "content": system_prompt}] + self.build_messages(category, user_image_url, detail=detail)
+        messages = [{"role": "system", "content": self.get_system_prompt(category)}]
+        messages.extend(self.load_prompt(category).get("predefined_messages", []))
+        messages.extend(self.gender_messages(gender))
+        messages.extend(self.golden_example_messages(category))
+        messages.append(self.target_message(category, user_image_url, detail=detail))
+        return messages
+    
+    def gender_messages(self, gender: str = None) -> List[Dict[str, Any]]:
+        """The gender context as its own system message, for the prefix layout."""
+        context = self.gender_context(gender)
+        return [{"role": "system", "content": context.strip()}] if context else []
+    
+    def load_golden_examples(self, categories: List[str]):
+        """
+        Fetch the golden examples of categories once, for the messages built afterwards.
+
+        Blocking: async callers run it with asyncio.to_thread. It queries on a session of
+        its own, so it neither shares nor closes the caller's session, which may be in use
+        on another thread at the same time (speculative category calls).
+        """
+        from sqlalchemy.orm import Session
+        from core.extensions import db
+        from core.models import RatingFeedback
+
+        try:
+            with Session(db.engine) as session:
+                for category in categories:
+                    golden_examples = RatingFeedback.query.with_session(session).filter_by(
+                        category=category,
+                        status='approved'
+                    ).order_by(RatingFeedback.created_at.desc()).limit(3).all()
+                    self._golden_cache[category] = self.golden_messages(golden_examples)
+        except Exception as e:
+            # Fallback if DB is not ready: no golden examples rather than a query per message list
+            print(f"Error fetching golden examples: {e}")
+            for category in categories:
+                self._golden_cache.setdefault(category, [])
+
+    def golden_example_messages(self, category: str) -> List[Dict[str, Any]]:
+        """Few-shot messages for the most recent expert-approved corrections in a category."""
+        if category in self._golden_cache:
+            return self._golden_cache[category]
+        # Fetch "Golden Examples" (Approved corrections)
         try:
             from core.models import RatingFeedback
             # Get up to 3 most recent approved feedback items for this category
@@ -43,20 +159,11 @@ class PromptLoader:
             from core.extensions import db
             db.session.rollback()
             golden_examples = []
+        return self.golden_messages(golden_examples)
 
-        prompt_data = self.load_prompt(category)
+    def golden_messages(self, golden_examples) -> List[Dict[str, Any]]:
+        """Approved RatingFeedback rows as few-shot messages."""
         messages = []
-
-        # 2. Add Predefined/Static Messages (Reference Images)
-        # Strategy: usage static examples as baseline, but if we have golden examples, we might mix them
-        # For now, let's KEEP static examples but append golden ones as "User Corrections"
-        # OR: specific override strategy.
-        # Let's use: Static Examples -> Golden Examples -> Target Image
-        
-        static_messages = prompt_data.get("predefined_messages", [])
-        messages.extend(static_messages)
-        
-        # 3. Inject Golden Examples
         if golden_examples:
             messages.append({
                 "role": "user",
@@ -68,7 +175,6 @@ class PromptLoader:
             
             for example in golden_examples:
                 # We need to format the corrected score into a clear example
-                import json
                 corrected_json_str = json.dumps(example.corrected_score, indent=2)
                 reasoning = example.reasoning if example.reasoning else "Expert correction."
                 
@@ -83,28 +189,6 @@ class PromptLoader:
                     "role": "assistant",
                     "content": f"Based on expert feedback, here is the correct rating:\n{corrected_json_str}\n\nKey Reasoning: {reasoning}"
                 })
-
-        # 4. Add the User's Target Image
-        user_content = []
-        if user_text:
-            user_content.append({"type": "text", "text": user_text})
-        
-        user_content.extend([
-            {
-                "type": "text",
-                "text": f"Now please analyze this {category} and provide a detailed beauty rating from 1-10:"
-            },
-            {
-                "type": "image_url",
-                "image_url": {"url": user_image_url}
-            }
-        ])
-        
-        messages.append({
-            "role": "user",
-            "content": user_content
-        })
-        
         return messages
     
     def get_system_prompt(self, category: str, gender: str = None) -> str:
@@ -119,8 +203,8 @@ class PromptLoader:
             prompt_text = system_prompt
         
         # Inject gender context if provided
-        if gender and gender.lower() in ["male", "female"]:
-            gender_context = f"\n\n# Gender Context (Provided)\nThe camel's gender has been identified as **{gender.upper()}**. Please apply the {gender.upper()}-specific rules strictly when evaluating attributes. If the visual characteristics do not match the provided gender, note this in your analysis but still apply the gender-specific scoring guidelines.\n"
+        gender_context = self.gender_context(gender)
+        if gender_context:
             # Insert gender context after the Instructions section (before Workflow Checklist)
             if "# Workflow Checklist" in prompt_text:
                 # Insert right before Workflow Checklist
@@ -154,6 +238,12 @@ class PromptLoader:
         
         return prompt_text
     
+    def gender_context(self, gender: str = None) -> str:
+        """The gender section added to the judging guide, or "" when the gender is unknown."""
+        if gender and gender.lower() in ["male", "female"]:
+            return f"\n\n# Gender Context (Provided)\nThe camel's gender has been identified as **{gender.upper()}**. Please apply the {gender.upper()}-specific rules strictly when evaluating attributes. If the visual characteristics do not match the provided gender, note this in your analysis but still apply the gender-specific scoring guidelines.\n"
+        return ""
+    
     def get_available_categories(self) -> List[str]:
         """Get list of available beauty categories."""
         categories = []
@@ -162,4 +252,141 @@ class PromptLoader:
                 if filename.endswith('_beauty.json'):
                     category = filename.replace('_beauty.json', '')
                     categories.append(category)
-        return categories
\ No newline at end of file
+        return categories
+    
+    def get_scored_attributes(self, category: str) -> List[str]:
+        """Attribute names from the "# Scored Attributes" section of a category's system prompt."""
+        prompt_text = self.get_system_prompt(category)
+        start = prompt_text.find("# Scored Attributes")
+        if start == -1:
+            return []
+        end = prompt_text.find("\n# ", start + 1)
+        section = prompt_text[start:end if end != -1 else len(prompt_text)]
+        return re.findall(r"^- \*\*(.+?):\*\*", section, re.MULTILINE)
+    
+    def get_category_schema(self, category: str) -> Dict[str, Any]:
+        """JSON schema of one category's result: its error object or its scored object."""
+        attributes = self.get_scored_attributes(category)
+        attribute_name = {"type": "string", "enum": attributes} if attributes else {"type": "string"}
+        return {
+            "anyOf": [
+                {
+                    "type": "object",
+                    "properties": {
+                        "error": {"type": "boolean", "enum": [True]},
+                        "error_type": {"type": ["string", "null"]},
+                        "message": {"type": "string"},
+                    },
+                    "required": ["error", "error_type", "message"],
+                    "additionalProperties": False,
+                },
+                {
+                    "type": "object",
+                    "properties": {
+                        "error": {"type": "boolean", "enum": [False]},
+                        "age_class": {"type": ["string", "null"], "enum": AGE_CLASSES + [None]},
+                        "attributes": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "name": attribute_name,
+                                    "score": {"type": ["number", "null"]},
+                                    "reason": {"type": "string"},
+                                },
+                                "required": ["name", "score", "reason"],
+                                "additionalProperties": False,
+                            },
+                        },
+                        "summary": {"type": "string"},
+                    },
+                    "required": ["error", "age_class", "attributes", "summary"],
+                    "additionalProperties": False,
+                },
+            ]
+        }
+    
+    def get_combined_response_format(self, categories: List[str]) -> Dict[str, Any]:
+        """Structured-output response_format rating every category in one request."""
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "camel_beauty_ratings",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {category: self.get_category_schema(category) for category in categories},
+                    "required": list(categories),
+                    "additionalProperties": False,
+                },
+            },
+        }
+    
+    def get_combined_system_prompt(self, categories: List[str], gender: str = None) -> str:
+        """One system prompt holding every category's judging guide as its own section."""
+        sections = [COMBINED_SYSTEM_PROMPT.format(
+            regions=", ".join(categories), keys=", ".join(f'"{category}"' for category in categories))]
+        for category in categories:
+            # Demote the guide's headings so each region nests under its own
+            guide = re.sub(r"^#", "##", self.get_system_prompt(category, gender=gender), flags=re.MULTILINE)
+            sections.append(f"# Region: {category}\n{guide}")
+        return "\n\n".join(sections)
+    
+    def build_combined_messages(self, categories: List[str], user_image_url: str,
+                                detail: str = None) -> List[Dict[str, Any]]:
+        """Every category's reference images and golden examples, then the target image once."""
+        messages = []
+        for category in categories:
+            messages.append({
+                "role": "user",
+                "content": [{"type": "text", "text": f"The following examples are for the {category} region only."}]
+            })
+            messages.extend(self.load_prompt(category).get("predefined_messages", []))
+            messages.extend(self.golden_example_messages(category))
+        
+        messages.append(self.combined_target_message(categories, user_image_url, detail))
+        return messages
+    
+    def combined_target_message(self, categories: List[str], user_image_url: str,
+                                detail: str = None) -> Dict[str, Any]:
+        return {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": f"Now please analyze the {', '.join(categories)} of this camel and provide a detailed beauty rating from 1-10 for each:"
+                },
+                image_content(user_image_url, detail)
+            ]
+        }
+    
+    def build_combined_request_messages(self, categories: List[str], user_image_url: str, gender: str = None,
+                                        detail: str = None, layout: str = "inline") -> List[Dict[str, Any]]:
+        """
+        The complete message list for the combined call, system prompt included.
+
+        With layout "prefix", every region's reference images come before the gender
+        context and before any region's golden examples (see build_category_messages).
+        """
+        if layout != "prefix":
+            system_prompt = self.get_combined_system_prompt(categories, gender=gender)
+            messages = self.build_combined_messages(categories, user_image_url, detail=detail)
+            return [{"role": "system", "content": system_prompt}] + messages
+        messages = [{"role": "system", "content": self.get_combined_system_prompt(categories)}]
+        for category in categories:
+            messages.append({
+                "role": "user",
+                "content": [{"type": "text", "text": f"The following examples are for the {category} region only."}]
+            })
+            messages.extend(self.load_prompt(category).get("predefined_messages", []))
+        messages.extend(self.gender_messages(gender))
+        for category in categories:
+            golden_examples = self.golden_example_messages(category)
+            if golden_examples:
+                messages.append({
+                    "role": "user",
+                    "content": [{"type": "text", "text": f"The following corrections are for the {category} region only."}]
+                })
+                messages.extend(golden_examples)
+        messages.append(self.combined_target_message(categories, user_image_url, detail))
+        return messages
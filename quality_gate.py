@@ -0,0 +1,170 @@
+"""
+CPU quality gate run before any vision-model call.
+
+Blank, tiny, badly blurred, blown-out and screenshot-like uploads can never pass the
+camel validation, yet each one costs a GPT-4o vision call to find that out. These
+checks reject them locally in a few milliseconds:
+
+    resolution   short side below min_short_edge (from the header, before decoding)
+    aspect       long/short side ratio above max_aspect_ratio (banners, strips)
+    uniform      grayscale standard deviation below min_contrast (blank or solid)
+    exposure     more than max_clipped_fraction of pixels near black or near white
+    blur         variance of the Laplacian below min_sharpness
+    screenshot   more than max_flat_fraction of neighbouring pixels exactly equal; sensor
+                 noise keeps photos well below that, rendered UIs are mostly flat fills
+
+The pixel checks run on a grayscale copy whose long edge is ANALYSIS_SIZE (JPEGs are
+DCT-decoded straight to about that size), so the blur and flatness figures do not
+depend on the upload's resolution. Thresholds are deliberately lenient: a wrongly
+rejected camel is worse than a wasted call.
+"""
+import io
+import threading
+from typing import NamedTuple
+
+from image_ingest import check_image_size, open_image, DEFAULT_MAX_IMAGE_PIXELS
+
+ANALYSIS_SIZE = 512
+
+# Grayscale levels counted as clipped shadows / highlights
+DARK_LEVEL = 16
+BRIGHT_LEVEL = 240
+
+
+class QualityThresholds(NamedTuple):
+    min_short_edge: int = 200
+    max_aspect_ratio: float = 4.0
+    min_contrast: float = 8.0
+    max_clipped_fraction: float = 0.9
+    min_sharpness: float = 15.0
+    max_flat_fraction: float = 0.85
+
+
+class QualityReport(NamedTuple):
+    passed: bool
+    issues: list  # (check, message) pairs for every failed check
+    metrics: dict
+
+
+def check_image_quality(image_bytes: bytes, thresholds: QualityThresholds = QualityThresholds(),
+                        max_pixels: int = DEFAULT_MAX_IMAGE_PIXELS) -> QualityReport:
+    """
+    Run every quality check on an image.
+
+    Args:
+        image_bytes: Raw downloaded image
+        thresholds: Limits for each check
+        max_pixels: Reject images declaring more pixels than this
+
+    Returns:
+        QualityReport: Whether the image passed, the failed checks and the measured values
+    """
+    import numpy as np
+    from PIL import ImageOps
+
+    width, height = check_image_size(io.BytesIO(image_bytes), max_pixels).size
+    short_edge, long_edge = min(width, height), max(width, height)
+    metrics = {'width': width, 'height': height, 'aspect_ratio': round(long_edge / short_edge, 2)}
+    issues = []
+    if short_edge < thresholds.min_short_edge:
+        issues.append(('resolution', f"Image resolution is too low ({width}x{height})"))
+    if metrics['aspect_ratio'] > thresholds.max_aspect_ratio:
+        issues.append(('aspect', f"Image is too narrow or too wide (aspect ratio {metrics['aspect_ratio']}:1)"))
+
+    image = open_image(io.BytesIO(image_bytes), decode_size=ANALYSIS_SIZE, max_pixels=max_pixels)
+    gray = ImageOps.grayscale(image)
+    gray.thumbnail((ANALYSIS_SIZE, ANALYSIS_SIZE))
+    pixels = np.asarray(gray, dtype=np.int32)
+
+    # 4-neighbour Laplacian over the interior (cv2.Laplacian with ksize=1)
+    laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                 - 4 * pixels[1:-1, 1:-1])
+    metrics.update({
+        'contrast': round(float(pixels.std()), 2),
+        'dark_fraction': round(float((pixels <= DARK_LEVEL).mean()), 3),
+        'bright_fraction': round(float((pixels >= BRIGHT_LEVEL).mean()), 3),
+        'sharpness': round(float(laplacian.var()), 2) if laplacian.size else 0.0,
+        'flat_fraction': round(float((pixels[:, 1:] == pixels[:, :-1]).mean()), 3) if width > 1 else 1.0,
+    })
+
+    if metrics['contrast'] < thresholds.min_contrast:
+        # A uniform image also fails blur and flatness; one reason is enough
+        issues.append(('uniform', "Image is blank or almost a single colour"))
+    else:
+        if metrics['dark_fraction'] > thresholds.max_clipped_fraction:
+            issues.append(('exposure', "Image is too dark"))
+        elif metrics['bright_fraction'] > thresholds.max_clipped_fraction:
+            issues.append(('exposure', "Image is overexposed"))
+        if metrics['sharpness'] < thresholds.min_sharpness:
+            issues.append(('blur', "Image is too blurry"))
+        if metrics['flat_fraction'] > thresholds.max_flat_fraction:
+            issues.append(('screenshot', "Image looks like a screenshot or graphic rather than a photo"))
+
+    return QualityReport(not issues, issues, metrics)
+
+
+def rejection_payload(report: QualityReport) -> dict:
+    """The error response for a rejected image, in the shape of a failed camel validation."""
+    quality_issues = [message for _, message in report.issues]
+    feedback = "The image was rejected before analysis: " + "; ".join(quality_issues) + "."
+    return {
+        "error": "Image not suitable for comprehensive beauty analysis",
+        "validation": {
+            # Unknown: the image was rejected before the model saw it, so clients must not
+            # report "no camel"; overall_suitability carries the verdict
+            "contains_camel": None,
+            "rejected_by": "quality_gate",
+            "overall_suitability": False,
+            "feedback": feedback,
+            "missing_parts": [],
+            "quality_issues": quality_issues,
+            "quality_gate": report.metrics,
+        },
+        "feedback": feedback,
+        "missing_parts": [],
+        "quality_issues": quality_issues,
+        "suggestions": [
+            "Upload a sharp, well-lit photo taken with a camera rather than a screenshot",
+            "Make sure the camel fills a good part of a normally proportioned frame",
+            "Use an image at least a few hundred pixels on each side"
+        ]
+    }
+
+
+class QualityGateMetrics:
+    """Process-wide counts of checked and rejected images, by failed check."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked = 0
+            self.rejected = 0
+            self.by_check = {}
+
+    def record(self, report: QualityReport):
+        with self._lock:
+            self.checked += 1
+            if not report.passed:
+                self.rejected += 1
+                for check, _ in report.issues:
+                    self.by_check[check] = self.by_check.get(check, 0) + 1
+            rejected, checked = self.rejected, self.checked
+        if not report.passed:
+            checks = ', '.join(check for check, _ in report.issues)
+            print(f"Quality gate rejected image ({checks}): {rejected}/{checked} rejected "
+                  f"({rejected / checked:.1%}) {report.metrics}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'rejected': self.rejected,
+                'reject_rate': self.rejected / self.checked if self.checked else 0.0,
+                'by_check': dict(self.by_check),
+            }
+
+
+quality_gate_metrics = QualityGateMetrics()
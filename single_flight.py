@@ -0,0 +1,271 @@
+"""
+Single-flight coalescing of concurrent analyses of the same image.
+
+When the same photo is posted several times at once (a double tap, several users
+sharing a listing), every request misses the BeautyResult cache because nothing is
+committed until the first one finishes. Each one ran the full set of model calls, and
+all but one then failed on the unique hash_key insert.
+
+After a cache miss, rate_image claims the image's hash key. The first claimant leads
+and runs the analysis. Later ones follow: they cancel their speculative calls and wait
+for the leader to release the key, then look up the result it stored. If the leader
+stored nothing (the API was unavailable, or it failed), a follower claims the key and
+runs the analysis itself. A follower that has waited COALESCE_WAIT_SECONDS runs it
+without a claim.
+
+Within a worker, claims live in a table shared by every event loop and thread. With
+COALESCE_CROSS_PROCESS the leader also inserts a row into analysis_leases, whose
+primary key makes the claim exclusive across workers. The first request in a worker
+whose key is leased elsewhere polls until the row is gone, and the worker's other
+requests for the key wait on it. A lease expires after COALESCE_LEASE_SECONDS, so a
+worker that dies mid-analysis holds the image up for that long only. While the
+leader runs, a heartbeat task pushes expires_at out every third of that, so an
+analysis slowed by retries keeps its lease however long it takes.
+"""
+import asyncio
+import collections
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class Flight:
+    """A key claimed in this process; the other requests for it wait here until release."""
+
+    def __init__(self, key: bytes):
+        self.key = key
+        self.released = False
+        self._waiters = []  # (loop, future)
+        self._lock = threading.Lock()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for release; False if timeout passed first."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        with self._lock:
+            if self.released:
+                return True
+            self._waiters.append((loop, waiter))
+        try:
+            await asyncio.wait_for(waiter, max(0.0, timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def release(self):
+        with self._lock:
+            self.released = True
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake, waiter)
+            except RuntimeError:
+                # Its loop has closed
+                pass
+
+    @staticmethod
+    def _wake(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+class Claim:
+    """
+    The outcome of SingleFlight.claim for one request.
+
+    leading: run the analysis, then release() once its result is stored. Otherwise
+    wait() for the request that is running it, then release() (so this worker's other
+    followers can look too) and look up the stored result.
+    """
+
+    def __init__(self, flights, key: bytes, flight: Flight = None, owner: bool = False,
+                 leading: bool = False, leased: bool = False):
+        self._flights = flights
+        self.key = key
+        self.flight = flight
+        self.owner = owner  # Holds this worker's flight for the key
+        self.leading = leading
+        self.leased = leased  # Holds the analysis_leases row
+        self.heartbeat = None  # Task renewing the lease row while the leader runs
+        self._released = False
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until the analysis of the key finishes elsewhere; False on timeout."""
+        if self.owner:
+            # Leased by another worker: poll the lease for this worker's requests
+            return await self._flights.wait_for_lease(self.key, timeout)
+        return await self.flight.wait(timeout)
+
+    async def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self.heartbeat is not None:
+            self.heartbeat.cancel()
+        if self.leased:
+            await asyncio.to_thread(self._flights.release_lease, self.key)
+        if self.owner:
+            self._flights.release(self)
+
+
+class SingleFlight:
+    """In-process (and optionally cross-process) claims on image hash keys."""
+
+    def __init__(self, enabled: bool = True, cross_process: bool = True, wait_seconds: float = 90.0,
+                 lease_seconds: float = 120.0, poll_seconds: float = 0.5):
+        self.enabled = enabled
+        self.cross_process = cross_process
+        self.wait_seconds = wait_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._flights = {}  # key -> Flight
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+
+    def init_app(self, app):
+        self.enabled = app.config.get("COALESCE_ENABLED", self.enabled)
+        self.cross_process = app.config.get("COALESCE_CROSS_PROCESS", self.cross_process)
+        self.wait_seconds = app.config.get("COALESCE_WAIT_SECONDS", self.wait_seconds)
+        self.lease_seconds = app.config.get("COALESCE_LEASE_SECONDS", self.lease_seconds)
+        self.poll_seconds = app.config.get("COALESCE_POLL_SECONDS", self.poll_seconds)
+
+    @property
+    def owner_id(self) -> str:
+        # Per call: a forked worker is a different owner from its parent
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counts[name] += amount
+
+    async def claim(self, key: bytes) -> Claim:
+        """Lead the analysis of key, or follow the request already running it."""
+        if not self.enabled:
+            return Claim(self, key, leading=True)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counts['followers'] += 1
+                return Claim(self, key, flight)
+            flight = self._flights[key] = Flight(key)
+        if not self.cross_process:
+            self.count('leaders')
+            return Claim(self, key, flight, owner=True, leading=True)
+        try:
+            leased = await asyncio.to_thread(self.acquire_lease, key)
+        except Exception as e:
+            # No lease table yet (pending migration) or the database is down: lead locally
+            print(f"Analysis lease not taken: {e}")
+            self.count('lease_errors')
+            self.count('leaders')
+            return Claim(self, key, flight, owner=True, leading=True)
+        if not leased:
+            self.count('remote_followers')
+            return Claim(self, key, flight, owner=True)
+        self.count('leaders')
+        claim = Claim(self, key, flight, owner=True, leading=True, leased=True)
+        claim.heartbeat = asyncio.ensure_future(self.keep_lease(key))
+        return claim
+
+    def release(self, claim: Claim):
+        with self._lock:
+            if self._flights.get(claim.key) is claim.flight:
+                del self._flights[claim.key]
+        claim.flight.release()
+
+    def _leases(self):
+        from core.extensions import db
+        from core.models import AnalysisLease
+        return db.engine, AnalysisLease.__table__
+
+    def acquire_lease(self, key: bytes) -> bool:
+        """Insert the key's lease row, taking over an expired one; False if another worker holds it."""
+        from sqlalchemy.exc import IntegrityError
+
+        engine, leases = self._leases()
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            # Its worker died mid-analysis
+            expired = connection.execute(
+                leases.delete().where(leases.c.hash_key == key, leases.c.expires_at < now)).rowcount
+        if expired:
+            self.count('leases_expired')
+        try:
+            with engine.begin() as connection:
+                connection.execute(leases.insert().values(
+                    hash_key=key, owner=self.owner_id, expires_at=now + timedelta(seconds=self.lease_seconds)))
+            return True
+        except IntegrityError:
+            return False
+
+    def renew_lease(self, key: bytes) -> bool:
+        """Push this worker's lease on key out by lease_seconds; False if it no longer holds it."""
+        engine, leases = self._leases()
+        with engine.begin() as connection:
+            renewed = connection.execute(leases.update().where(
+                leases.c.hash_key == key, leases.c.owner == self.owner_id,
+            ).values(expires_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds))).rowcount
+        return renewed > 0
+
+    async def keep_lease(self, key: bytes):
+        """Renew the lease every third of lease_seconds until cancelled by the leader's release."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self.renew_lease, key):
+                    # Taken over after a missed renewal; the analysis goes on unleased
+                    print("Analysis lease lost before the result was stored")
+                    self.count('leases_lost')
+                    return
+            except Exception as e:
+                # Tried again next time; the row lasts two more intervals
+                print(f"Error renewing analysis lease: {e}")
+
+    def lease_held(self, key: bytes) -> bool:
+        engine, leases = self._leases()
+        with engine.connect() as connection:
+            row = connection.execute(leases.select().with_only_columns(leases.c.owner).where(
+                leases.c.hash_key == key, leases.c.expires_at >= datetime.utcnow())).first()
+        return row is not None
+
+    def release_lease(self, key: bytes):
+        try:
+            engine, leases = self._leases()
+            with engine.begin() as connection:
+                connection.execute(leases.delete().where(leases.c.hash_key == key, leases.c.owner == self.owner_id))
+        except Exception as e:
+            # Expires on its own; followers elsewhere wait until then
+            print(f"Error releasing analysis lease: {e}")
+
+    async def wait_for_lease(self, key: bytes, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if not await asyncio.to_thread(self.lease_held, key):
+                    return True
+            except Exception as e:
+                print(f"Error checking analysis lease: {e}")
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(self.poll_seconds, remaining))
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts.clear()
+
+    def stats(self) -> dict:
+        """Claims led and followed, coalesced results, and keys being analyzed in this worker."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'cross_process': self.cross_process,
+                'in_flight': len(self._flights),
+                **{name: self._counts[name] for name in (
+                    'leaders', 'followers', 'remote_followers', 'coalesced', 'stored_before_claim',
+                    'follower_timeouts', 'leader_failed', 'leases_expired', 'leases_lost',
+                    'lease_errors')},
+            }
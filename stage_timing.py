@@ -0,0 +1,106 @@
+"""
+Per-stage timings for the rating pipeline.
+
+rate_image overlaps its stages (the speculative validation call runs while the image
+is downloaded and hashed), so the stage durations add up to more than the request's
+wall time. The difference is the latency the overlap saved:
+
+    overlap_ms = sum(stage durations) - wall_ms
+
+A speculative stage that was cancelled is reported as "<stage>_cancelled" and left out
+of the sum.
+
+Every request logs one line with its stages, and PipelineMetrics keeps recent samples
+per stage for /api/metrics.
+"""
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+
+# Recent samples kept per stage for percentiles
+TIMING_WINDOW = 500
+
+
+class StageTimer:
+    """Wall-clock durations of the named stages of one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Accumulates, so a stage entered twice (e.g. two lookups) reports its total
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    async def timed(self, name: str, awaitable):
+        """Await awaitable as stage name; if cancelled it is recorded as "<name>_cancelled"."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        except asyncio.CancelledError:
+            name += '_cancelled'
+            raise
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def summary(self) -> dict:
+        wall_ms = (time.perf_counter() - self.start) * 1000
+        # Cancelled work ran in parallel but saved nothing
+        useful_ms = sum(ms for name, ms in self.stages.items() if not name.endswith('_cancelled'))
+        return {
+            'wall_ms': round(wall_ms, 1),
+            'stages': {name: round(ms, 1) for name, ms in self.stages.items()},
+            'overlap_ms': round(max(0.0, useful_ms - wall_ms), 1),
+        }
+
+
+class PipelineMetrics:
+    """Process-wide outcome counts and stage latency percentiles for a pipeline."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.outcomes = collections.Counter()
+            self.samples = collections.defaultdict(lambda: collections.deque(maxlen=TIMING_WINDOW))
+
+    def record(self, timer: StageTimer, outcome: str) -> dict:
+        """Record one finished request and log its timings; returns the summary."""
+        summary = timer.summary()
+        with self._lock:
+            self.outcomes[outcome] += 1
+            for name, ms in summary['stages'].items():
+                self.samples[name].append(ms)
+            self.samples['wall'].append(summary['wall_ms'])
+            self.samples['overlap'].append(summary['overlap_ms'])
+        stages = ' '.join(f"{name}={ms:.0f}" for name, ms in summary['stages'].items())
+        print(f"Pipeline {outcome}: wall={summary['wall_ms']:.0f} ms overlap={summary['overlap_ms']:.0f} ms [{stages}]")
+        return summary
+
+    def count(self, outcome: str, n: int = 1):
+        with self._lock:
+            self.outcomes[outcome] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {}
+            for name, samples in self.samples.items():
+                ordered = sorted(samples)
+                stages[name] = {
+                    'count': len(ordered),
+                    'p50_ms': ordered[len(ordered) // 2],
+                    'p95_ms': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                }
+            return {'outcomes': dict(self.outcomes), 'stages': stages}
+
+
+rate_image_metrics = PipelineMetrics()
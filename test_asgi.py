@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('STARTUP_MODE', 'deferred')
+
+from flask import request  # noqa: E402
+
+import asgi  # noqa: E402
+from core.config import Config  # noqa: E402
+from core.extensions import async_runtime  # noqa: E402
+
+
+async def call(method, path, body=None, headers=()):
+    """Send one request through the ASGI app; returns (status, headers, body)."""
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+        + [(name.encode(), value.encode()) for name, value in headers],
+    }
+    messages = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    start, response_body = sent
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, response_body['body']
+
+
+class TestAsgi(unittest.TestCase):
+    def test_other_routes_go_to_flask(self):
+        status, _, body = asyncio.run(call('GET', '/ping'))
+        self.assertEqual((status, body), (200, b'Pong'))
+
+    def test_analysis_route_runs_natively(self):
+        status, headers, body = asyncio.run(call('POST', '/api/rate-image', {}))
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body), {'error': 'image_url is required'})
+        self.assertEqual(headers['content-type'], 'application/json')
+
+    def test_invalid_token_uses_jwt_error_handler(self):
+        status, _, _ = asyncio.run(call('POST', '/api/compare-beauty', {},
+                                        headers=[('authorization', 'Bearer not-a-token')]))
+        self.assertEqual(status, 422)
+
+    def test_preflight(self):
+        status, headers, _ = asyncio.run(call('OPTIONS', '/api/rate-image', headers=[('origin', 'http://x')]))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['access-control-allow-origin'], '*')
+
+    def test_many_requests_in_flight_on_one_loop(self):
+        async def slow_handler():
+            image_url = request.get_json()['image_url']
+            await asyncio.sleep(0.2)
+            return {'image_url': image_url}, 200
+
+        async def burst():
+            return await asyncio.gather(*(call('POST', '/api/rate-image', {'image_url': f'u{i}'}) for i in range(50)))
+
+        async_runtime.reset_stats()
+        with mock.patch.dict(asgi.ASYNC_ROUTES, {('POST', '/api/rate-image'): slow_handler}):
+            start = time.perf_counter()
+            responses = asyncio.run(burst())
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertEqual([json.loads(body)['image_url'] for _, _, body in responses], [f'u{i}' for i in range(50)])
+        self.assertEqual(async_runtime.stats()['peak_serving'], 50)
+        self.assertEqual(async_runtime.serving, 0)
+
+    def test_busy_worker_answers_503(self):
+        with mock.patch.object(Config, 'ASGI_MAX_IN_FLIGHT', 0):
+            status, headers, _ = asyncio.run(call('POST', '/api/rate-image', {'image_url': 'u'}))
+        self.assertEqual((status, headers['retry-after']), (503, '5'))
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import json
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from async_runtime import AsyncRuntime
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode()
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+
+class StalledHandler(CompletionHandler):
+    def do_POST(self):
+        time.sleep(2)
+        super().do_POST()
+
+
+class TestAsyncRuntime(unittest.TestCase):
+    def setUp(self):
+        self.runtime = AsyncRuntime(threads=4, shutdown_timeout=1)
+        self.runtime.api_key = 'test'
+
+    def tearDown(self):
+        self.runtime.shutdown()
+
+    def test_run_returns_result_and_raises_errors(self):
+        async def double(x):
+            await asyncio.sleep(0)
+            return x * 2
+
+        async def fail():
+            raise ValueError("boom")
+
+        self.assertEqual(self.runtime.run(double(21)), 42)
+        with self.assertRaises(ValueError):
+            self.runtime.run(fail())
+        stats = self.runtime.stats()
+        self.assertEqual((stats['submitted'], stats['failed'], stats['in_flight']), (2, 1, 0))
+
+    def test_caller_context_is_carried(self):
+        async def read_context():
+            return request_id.get()
+
+        request_id.set('abc')
+        self.assertEqual(self.runtime.run(read_context()), 'abc')
+
+    def test_concurrent_callers_share_one_loop(self):
+        async def current_loop():
+            await asyncio.sleep(0.05)
+            return id(asyncio.get_running_loop())
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            loops = set(executor.map(lambda _: self.runtime.run(current_loop()), range(8)))
+        self.assertEqual(len(loops), 1)
+        self.assertLess(time.perf_counter() - start, 0.3)
+        self.assertEqual(self.runtime.stats()['loops_started'], 1)
+
+    def test_timeout_cancels_the_coroutine(self):
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            self.runtime.run(slow(), timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+
+    def test_shutdown_drains_in_flight_work(self):
+        async def short():
+            await asyncio.sleep(0.1)
+            return 'done'
+
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            future = executor.submit(self.runtime.run, short())
+            time.sleep(0.02)
+            self.runtime.shutdown()
+            self.assertEqual(future.result(), 'done')
+        with self.assertRaises(RuntimeError):
+            self.runtime.run(short())
+
+    def test_openai_connections_are_reused(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), CompletionHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        async def complete():
+            client = self.runtime.openai_client()
+            response = await client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+            return response.choices[0].message.content
+
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        try:
+            with mock.patch.dict(os.environ, {'OPENAI_BASE_URL': base_url}):
+                for _ in range(3):
+                    self.assertEqual(self.runtime.run(complete()), '{}')
+            stats = self.runtime.stats()
+            self.assertEqual((stats['openai_requests'], stats['openai_connections_opened']), (3, 1))
+            self.assertEqual(stats['openai_clients_created'], 1)
+        finally:
+            self.runtime.shutdown()
+            server.shutdown()
+
+    def test_openai_attempt_times_out(self):
+        import openai
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StalledHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.runtime.request_timeout = 0.2
+
+        async def complete():
+            client = self.runtime.openai_client()
+            await client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        try:
+            start = time.perf_counter()
+            with mock.patch.dict(os.environ, {'OPENAI_BASE_URL': base_url}):
+                with self.assertRaises(openai.APITimeoutError):
+                    self.runtime.run(complete())
+            self.assertLess(time.perf_counter() - start, 1.5)
+        finally:
+            self.runtime.shutdown()
+            server.shutdown()
+
+    def test_disabled_runs_a_loop_per_call(self):
+        self.runtime.enabled = False
+
+        async def current_loop():
+            self.runtime.openai_client()
+            return id(asyncio.get_running_loop())
+
+        self.runtime.run(current_loop())
+        self.runtime.run(current_loop())
+        stats = self.runtime.stats()
+        self.assertEqual((stats['loops_started'], stats['openai_clients_created']), (2, 2))
+        self.assertFalse(stats['running'])
+        self.assertEqual(len(self.runtime._clients), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import asyncio
+import collections
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from blob_cache import BlobCache, freshness_lifetime
+from http_client import PooledHttpClient
+from image_download import download_image, download_image_async
+
+
+def jpeg_bytes(color=(200, 150, 100)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+JPEG = jpeg_bytes()
+HITS = collections.Counter()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        HITS[self.path] += 1
+        if self.path == '/fresh.jpg':
+            self._send({'Cache-Control': 'public, max-age=60'})
+        elif self.path == '/etag.jpg':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                self._send({'Cache-Control': 'no-cache', 'ETag': '"v1"'})
+        elif self.path == '/private.jpg':
+            self._send({'Cache-Control': 'no-store'})
+
+    def _send(self, headers):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(JPEG)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(JPEG)
+
+
+class TestBlobCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = BlobCache(self.tmp.name, max_bytes=1024 * 1024)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_store_and_read(self):
+        entry = self.cache.store('https://a/x.jpg', JPEG, 'jpeg', {'ETag': '"e"'})
+        found = self.cache.lookup('https://a/x.jpg')
+        self.assertEqual(found, entry)
+        self.assertTrue(found.fresh)
+        self.assertEqual(found.validators(), {'If-None-Match': '"e"'})
+        self.assertEqual(self.cache.read(found), JPEG)
+        self.assertIsNone(self.cache.lookup('https://a/other.jpg'))
+
+    def test_identical_content_is_stored_once(self):
+        self.cache.store('https://a/1.jpg', JPEG, 'jpeg', {})
+        self.cache.store('https://a/2.jpg?v=2', JPEG, 'jpeg', {})
+        blobs = [name for _, _, names in os.walk(os.path.join(self.tmp.name, 'blobs')) for name in names]
+        self.assertEqual(len(blobs), 1)
+
+    def test_shared_between_instances(self):
+        # Another worker process sees what this one stored
+        self.cache.store('https://a/x.jpg', JPEG, 'jpeg', {})
+        other = BlobCache(self.tmp.name)
+        self.assertEqual(other.read(other.lookup('https://a/x.jpg')), JPEG)
+
+    def test_corrupt_blob_reads_as_miss(self):
+        entry = self.cache.store('https://a/x.jpg', JPEG, 'jpeg', {})
+        with open(self.cache._blob_path(entry.digest), 'wb') as f:
+            f.write(JPEG[:100])
+        self.assertIsNone(self.cache.read(entry))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_bytes = 3 * len(JPEG) + 10
+        images = {f'https://a/{i}.jpg': jpeg_bytes((i * 40, 0, 0)) for i in range(3)}
+        for i, (url, content) in enumerate(images.items()):
+            entry = self.cache.store(url, content, 'jpeg', {})
+            past = time.time() - 100 + i
+            os.utime(self.cache._blob_path(entry.digest), (past, past))
+            os.utime(self.cache._entry_path(url), (past, past))
+        # Using the oldest makes the second the least recently used
+        self.cache.read(self.cache.lookup('https://a/0.jpg'))
+        self.cache.store('https://a/3.jpg', jpeg_bytes((0, 0, 200)), 'jpeg', {})
+
+        self.assertGreaterEqual(self.cache.stats()['evictions'], 1)
+        self.assertIsNone(self.cache.lookup('https://a/1.jpg'))
+        self.assertIsNotNone(self.cache.read(self.cache.lookup('https://a/0.jpg')))
+        self.assertIsNotNone(self.cache.read(self.cache.lookup('https://a/3.jpg')))
+
+    def test_disabled(self):
+        cache = BlobCache('', max_bytes=1024)
+        self.assertIsNone(cache.store('https://a/x.jpg', JPEG, 'jpeg', {}))
+        self.assertIsNone(cache.lookup('https://a/x.jpg'))
+
+    def test_freshness_lifetime(self):
+        self.assertEqual(freshness_lifetime({'Cache-Control': 'public, max-age=600'}, 5), 600)
+        self.assertEqual(freshness_lifetime({'Cache-Control': 'no-cache'}, 5), 0)
+        self.assertIsNone(freshness_lifetime({'Cache-Control': 'private, no-store'}, 5))
+        self.assertEqual(freshness_lifetime({}, 5), 5)
+
+
+class TestCachedDownload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        HITS.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = BlobCache(self.tmp.name)
+        self.client = PooledHttpClient()
+
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+
+    def test_fresh_repeat_is_a_local_read(self):
+        for _ in range(3):
+            result = download_image(f"{self.base}/fresh.jpg", self.client, cache=self.cache)
+            self.assertEqual(result.content, JPEG)
+            self.assertEqual(result.image_type, 'jpeg')
+        self.assertEqual(HITS['/fresh.jpg'], 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['hits']), (1, 2))
+
+    def test_stale_entry_is_revalidated(self):
+        for _ in range(3):
+            self.assertEqual(download_image(f"{self.base}/etag.jpg", self.client, cache=self.cache).content, JPEG)
+        self.assertEqual(HITS['/etag.jpg'], 3)
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['revalidated']), (1, 2))
+
+    def test_no_store_is_not_cached(self):
+        for _ in range(2):
+            download_image(f"{self.base}/private.jpg", self.client, cache=self.cache)
+        self.assertEqual(HITS['/private.jpg'], 2)
+
+    def test_async_download_uses_cache(self):
+        async def fetch():
+            try:
+                for path in ('/fresh.jpg', '/fresh.jpg', '/etag.jpg', '/etag.jpg'):
+                    self.assertEqual((await download_image_async(f"{self.base}{path}", self.client,
+                                                                 cache=self.cache)).content, JPEG)
+            finally:
+                await self.client.aclose()
+
+        asyncio.run(fetch())
+        self.assertEqual((HITS['/fresh.jpg'], HITS['/etag.jpg']), (1, 2))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['revalidated'], stats['misses']), (1, 1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
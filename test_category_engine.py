@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import MagicMock
+
+import jsonschema
+
+from prompt_loader import PromptLoader
+
+CATEGORIES = ['head', 'neck', 'body', 'leg']
+
+
+def scored(attributes):
+    return {"error": False, "age_class": "ADULT", "summary": "Good",
+            "attributes": [{"name": name, "score": 7, "reason": "Fine"} for name in attributes]}
+
+
+class TestCombinedCategories(unittest.TestCase):
+    def setUp(self):
+        self.loader = PromptLoader()
+        # No database here: no golden examples
+        self.loader.golden_example_messages = MagicMock(return_value=[])
+
+    def test_scored_attributes(self):
+        self.assertEqual(self.loader.get_scored_attributes('head')[:2], ['HEAD SIZE', 'SNOUT CURVE SCORE'])
+        self.assertEqual(len(self.loader.get_scored_attributes('head')), 8)
+        self.assertEqual(len(self.loader.get_scored_attributes('leg')), 4)
+
+    def test_response_format_is_strict(self):
+        response_format = self.loader.get_combined_response_format(CATEGORIES)
+        schema = response_format['json_schema']['schema']
+        self.assertTrue(response_format['json_schema']['strict'])
+        self.assertEqual(schema['required'], CATEGORIES)
+        self.assertFalse(schema['additionalProperties'])
+        for option in schema['properties']['head']['anyOf']:
+            self.assertFalse(option['additionalProperties'])
+            self.assertEqual(set(option['required']), set(option['properties']))
+
+    def test_schema_accepts_ratings_and_errors(self):
+        schema = self.loader.get_combined_response_format(CATEGORIES)['json_schema']['schema']
+        response = {category: scored(self.loader.get_scored_attributes(category)) for category in CATEGORIES}
+        response['leg'] = {"error": True, "error_type": "CAMEL_BARELY_VISIBLE", "message": "Legs hidden"}
+        jsonschema.validate(response, schema)
+
+        response['head']['attributes'][0]['name'] = 'NECK LENGTH'
+        with self.assertRaises(jsonschema.ValidationError):
+            jsonschema.validate(response, schema)
+        del response['body']
+        with self.assertRaises(jsonschema.ValidationError):
+            jsonschema.validate(response, schema)
+
+    def test_combined_system_prompt(self):
+        prompt = self.loader.get_combined_system_prompt(CATEGORIES, gender='female')
+        for category in CATEGORIES:
+            self.assertIn(f"# Region: {category}\n## Role and Objective", prompt)
+        self.assertIn('"head", "neck", "body", "leg"', prompt)
+
+    def test_combined_messages_send_the_image_once(self):
+        messages = self.loader.build_combined_messages(CATEGORIES, "http://example.com/target.jpg", detail="high")
+        target = [part for message in messages if isinstance(message['content'], list)
+                  for part in message['content'] if part.get('type') == 'image_url'
+                  and part['image_url']['url'] == "http://example.com/target.jpg"]
+        self.assertEqual(len(target), 1)
+        self.assertEqual(target[0]['image_url']['detail'], "high")
+        self.assertIs(messages[-1]['content'][1], target[0])
+        reference_count = sum(len(self.loader.load_prompt(category)['predefined_messages']) for category in CATEGORIES)
+        self.assertEqual(len(messages), reference_count + len(CATEGORIES) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
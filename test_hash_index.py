@@ -0,0 +1,153 @@
+import os
+import random
+import time
+import sys
+import unittest
+from unittest import mock
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('STARTUP_MODE', 'deferred')
+
+from hash_index import NearDuplicateIndex, cache_key, perceptual_components, perceptual_key, PERCEPTUAL_BITS  # noqa: E402
+from main import app  # noqa: E402
+import core.extensions  # noqa: E402
+import core.models  # noqa: E402
+from core.extensions import db  # noqa: E402
+from core.models import BeautyResult  # noqa: E402
+
+
+def make_hash(key, tail="ff_1234"):
+    """Render a 512-bit key in the combined hash layout (phash_whash_...)."""
+    hex_key = f"{key:0128x}"
+    return f"{hex_key[:64]}_{hex_key[64:]}_{tail}"
+
+
+def flip_bits(key, count, rng):
+    for bit in rng.sample(range(PERCEPTUAL_BITS), count):
+        key ^= 1 << bit
+    return key
+
+
+class TestPerceptualKey(unittest.TestCase):
+    def test_parses_phash_and_whash(self):
+        key = random.Random(1).getrandbits(PERCEPTUAL_BITS)
+        self.assertEqual(perceptual_key(make_hash(key)), key)
+
+    def test_rejects_malformed_hashes(self):
+        self.assertIsNone(perceptual_key(None))
+        self.assertIsNone(perceptual_key("abc"))
+        self.assertIsNone(perceptual_key("abc_def_123"))
+        self.assertIsNone(perceptual_key("z" * 64 + "_" + "0" * 64))
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_fixed_width_and_distinct(self):
+        rng = random.Random(2)
+        first = make_hash(rng.getrandbits(PERCEPTUAL_BITS))
+        second = make_hash(rng.getrandbits(PERCEPTUAL_BITS))
+        self.assertEqual(len(cache_key(first)), 32)
+        self.assertEqual(cache_key(first), cache_key(first))
+        self.assertNotEqual(cache_key(first), cache_key(second))
+
+    def test_profiles_do_not_collide(self):
+        full = make_hash(123)
+        fast = full.rsplit("_", 2)[0]
+        self.assertNotEqual(cache_key(full), cache_key(fast))
+
+    def test_perceptual_components(self):
+        image_hash = make_hash(random.Random(3).getrandbits(PERCEPTUAL_BITS))
+        phash, whash = perceptual_components(image_hash)
+        self.assertEqual(f"{phash}_{whash}", image_hash[:129])
+        self.assertEqual(perceptual_components("abc_def"), (None, None))
+
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(42)
+        self.index = NearDuplicateIndex(max_distance=24)
+        self.keys = {i: self.rng.getrandbits(PERCEPTUAL_BITS) for i in range(1, 201)}
+        self.index.load((i, make_hash(k)) for i, k in self.keys.items())
+
+    def test_exact_match(self):
+        self.assertEqual(self.index.find(make_hash(self.keys[7])), (7, 0))
+
+    def test_match_within_distance(self):
+        for distance in (1, 10, 24):
+            query = flip_bits(self.keys[50], distance, self.rng)
+            self.assertEqual(self.index.find(make_hash(query)), (50, distance))
+
+    def test_no_match_beyond_distance(self):
+        query = flip_bits(self.keys[50], 25, self.rng)
+        self.assertIsNone(self.index.find(make_hash(query)))
+        self.assertIsNone(self.index.find(make_hash(self.keys[50]), max_distance=-1))
+
+    def test_tighter_query_radius(self):
+        query = flip_bits(self.keys[3], 12, self.rng)
+        self.assertIsNone(self.index.find(make_hash(query), max_distance=8))
+        self.assertEqual(self.index.find(make_hash(query), max_distance=12), (3, 12))
+
+    def test_remove_and_replace(self):
+        self.index.remove(7)
+        self.assertIsNone(self.index.find(make_hash(self.keys[7])))
+        self.index.add(8, make_hash(self.keys[7]))
+        self.assertEqual(self.index.find(make_hash(self.keys[7])), (8, 0))
+        self.assertIsNone(self.index.find(make_hash(self.keys[8])))
+        self.assertEqual(len(self.index), 199)
+
+    def test_skips_hashes_without_perceptual_part(self):
+        self.assertFalse(self.index.add(500, "not-a-hash"))
+        self.assertEqual(len(self.index), 200)
+
+
+class TestRefresh(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with app.app_context():
+            db.create_all()
+
+    def setUp(self):
+        # The index imports core.models when it reads rows; test_learning_loop replaces it in sys.modules
+        modules = mock.patch.dict(sys.modules, {'core.models': core.models, 'core.extensions': core.extensions})
+        modules.start()
+        self.addCleanup(modules.stop)
+        with app.app_context():
+            BeautyResult.query.delete()
+            db.session.commit()
+        self.rng = random.Random(7)
+
+    def store(self, key):
+        """Store a result as another worker would: in the database, not in this index."""
+        with app.app_context():
+            row = BeautyResult(image_hash=make_hash(key))
+            db.session.add(row)
+            db.session.commit()
+            return row.id
+
+    def test_picks_up_rows_stored_by_other_workers(self):
+        first = self.rng.getrandbits(PERCEPTUAL_BITS)
+        first_id = self.store(first)
+        index = NearDuplicateIndex(max_distance=24, refresh_seconds=0.01)
+        index.load_from_database(app)
+        self.assertEqual(index.find(make_hash(first)), (first_id, 0))
+
+        second = self.rng.getrandbits(PERCEPTUAL_BITS)
+        second_id = self.store(second)
+        self.assertIsNone(index.find(make_hash(second)))
+        time.sleep(0.02)
+        with app.app_context():
+            self.assertEqual(index.refresh(), 1)
+            # Throttled until refresh_seconds have passed
+            self.assertEqual(index.refresh(), 0)
+        self.assertEqual(index.find(make_hash(second)), (second_id, 0))
+
+    def test_disabled_refresh_reads_nothing(self):
+        index = NearDuplicateIndex(max_distance=24, refresh_seconds=0)
+        key = self.rng.getrandbits(PERCEPTUAL_BITS)
+        self.store(key)
+        with app.app_context():
+            self.assertEqual(index.refresh(), 0)
+        self.assertIsNone(index.find(make_hash(key)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import io
+import os
+import signal
+import time
+import unittest
+
+from PIL import Image
+
+from hash_pool import HashPool
+from image_hashing import generate_image_hash
+
+
+class TestHashPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        buffer = io.BytesIO()
+        Image.open('img/camel1.jpg').resize((600, 400)).save(buffer, 'JPEG')
+        cls.image_bytes = buffer.getvalue()
+        cls.expected = generate_image_hash(io.BytesIO(cls.image_bytes))
+
+    def test_pool_matches_in_thread_hash(self):
+        pool = HashPool(workers=1, max_pending=2)
+        pool.start()
+        try:
+            self.assertEqual(pool.hash_image(self.image_bytes), self.expected)
+            self.assertEqual(asyncio.run(pool.hash_image_async(self.image_bytes)), self.expected)
+        finally:
+            pool.shutdown()
+
+    def test_saturated_pool_hashes_in_thread(self):
+        pool = HashPool(workers=1, max_pending=1)
+        pool.start()
+        try:
+            self.assertIsNotNone(pool.submit(self.image_bytes))
+            self.assertIsNone(pool.submit(self.image_bytes))
+            self.assertEqual(pool.hash_image(self.image_bytes), self.expected)
+        finally:
+            pool.shutdown()
+
+    def test_broken_pool_is_replaced_in_the_background(self):
+        pool = HashPool(workers=1, max_pending=2)
+        pool.start()
+        try:
+            for pid in list(pool._executor._processes):
+                os.kill(pid, signal.SIGKILL)
+            # The request is answered in-thread while the new pool starts
+            self.assertEqual(pool.hash_image(self.image_bytes), self.expected)
+            deadline = time.monotonic() + 30
+            while (pool._executor is None or pool._restarting) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertIsNotNone(pool.submit(self.image_bytes))
+            self.assertEqual(pool.hash_image(self.image_bytes), self.expected)
+        finally:
+            pool.shutdown()
+
+    def test_disabled_pool_hashes_in_thread(self):
+        pool = HashPool(workers=0)
+        pool.start()
+        self.assertIsNone(pool.submit(self.image_bytes))
+        self.assertEqual(pool.hash_image(self.image_bytes), self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from core.config import Config
+from hedging import CallDeadlineError, HedgedCalls, parse_deadlines
+
+
+class SlowThenFast:
+    """make_call for HedgedCalls: each attempt takes the next delay, then returns its number."""
+
+    def __init__(self, *delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.started = 0
+        self.cancelled = 0
+
+    def __call__(self):
+        self.started += 1
+        return self.attempt(self.started, self.delays.pop(0))
+
+    async def attempt(self, number, delay):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None and number == 1:
+            raise self.error
+        return number
+
+
+def warm(calls, label='head', seconds=0.05, count=20):
+    """Record count earlier calls of seconds each."""
+    async def run():
+        for _ in range(count):
+            await calls.call(label, SlowThenFast(seconds))
+    asyncio.run(run())
+
+
+class TestHedgedCalls(unittest.TestCase):
+    def test_deadline_cancels_a_stalled_call(self):
+        calls = HedgedCalls(deadline_seconds=0.1)
+        attempts = SlowThenFast(5)
+
+        start = time.monotonic()
+        with self.assertRaises(CallDeadlineError):
+            asyncio.run(calls.call('head', attempts))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(attempts.cancelled, 1)
+        self.assertEqual(calls.stats()['default']['head']['deadline_exceeded'], 1)
+
+    def test_default_deadline_is_bounded_by_the_request_timeout(self):
+        # Two timed-out attempts and every backoff: a stalled completion no longer holds the rating
+        calls = HedgedCalls()
+        calls.init_app(SimpleNamespace(config=vars(Config)))
+        self.assertEqual(calls.deadline('head'), 2 * Config.OPENAI_REQUEST_TIMEOUT
+                         + Config.OPENAI_MAX_RETRIES * Config.OPENAI_RETRY_MAX_SECONDS)
+        self.assertEqual(HedgedCalls().deadline('head'), 0)
+
+    def test_per_label_deadline(self):
+        calls = HedgedCalls(deadline_seconds=0.05, deadlines=parse_deadlines("combined=1, leg=0"))
+        self.assertEqual(asyncio.run(calls.call('combined', SlowThenFast(0.1))), 1)
+        self.assertEqual(asyncio.run(calls.call('leg', SlowThenFast(0.1))), 1)
+        with self.assertRaises(CallDeadlineError):
+            asyncio.run(calls.call('neck', SlowThenFast(0.1)))
+
+    def test_slow_call_is_hedged_after_its_p90(self):
+        calls = HedgedCalls(hedge_enabled=True, hedge_min_delay=0.01, hedge_budget_percent=100)
+        warm(calls)
+        attempts = SlowThenFast(2, 0.05)
+
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(calls.call('head', attempts)), 2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual((attempts.started, attempts.cancelled), (2, 1))
+        stats = calls.stats()['default']['head']
+        self.assertEqual((stats['calls'], stats['hedged'], stats['hedge_wins']), (21, 1, 1))
+        self.assertAlmostEqual(stats['hedge_rate'], 1 / 21, places=3)
+
+    def test_fast_calls_and_cold_labels_are_not_hedged(self):
+        calls = HedgedCalls(hedge_enabled=True, hedge_min_delay=0.01, hedge_budget_percent=100)
+        cold = SlowThenFast(0.1, 0.01)
+        self.assertEqual(asyncio.run(calls.call('neck', cold)), 1)
+        self.assertEqual(cold.started, 1)
+
+        warm(calls)
+        fast = SlowThenFast(0.01, 0.01)
+        self.assertEqual(asyncio.run(calls.call('head', fast)), 1)
+        self.assertEqual(fast.started, 1)
+
+    def test_hedges_are_capped_by_the_budget(self):
+        # 10%: twenty warm-up calls earn two hedges
+        calls = HedgedCalls(hedge_enabled=True, hedge_min_delay=0.01, hedge_budget_percent=10)
+        warm(calls, seconds=0.02)
+
+        async def slow_burst():
+            return [await calls.call('head', SlowThenFast(0.15, 0.01)) for _ in range(4)]
+
+        self.assertEqual(asyncio.run(slow_burst()), [2, 2, 1, 1])
+        stats = calls.stats()['default']['head']
+        self.assertEqual((stats['hedged'], stats['hedges_denied']), (2, 2))
+
+    def test_failed_attempt_waits_for_the_hedge(self):
+        calls = HedgedCalls(hedge_enabled=True, hedge_min_delay=0.01, hedge_budget_percent=100)
+        warm(calls)
+        attempts = SlowThenFast(0.2, 0.2, error=RuntimeError('bad gateway'))
+        self.assertEqual(asyncio.run(calls.call('head', attempts)), 2)
+
+        # With no other attempt running, the error is raised
+        with self.assertRaises(RuntimeError):
+            asyncio.run(calls.call('neck', SlowThenFast(0.01, error=RuntimeError('bad gateway'))))
+        self.assertEqual(calls.stats()['default']['neck']['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
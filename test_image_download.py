@@ -0,0 +1,205 @@
+import asyncio
+import io
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+from http_client import PooledHttpClient
+from image_download import (download_image, download_image_async, download_metrics, sniff_image_type,
+                            DownloadError, DownloadTooLargeError, UnsupportedContentError)
+
+
+def jpeg_bytes(size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 150, 100)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+JPEG = jpeg_bytes()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse can be observed
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/image.jpg':
+            self._send(JPEG)
+        elif self.path.startswith('/redirect?to='):
+            self.send_response(302)
+            self.send_header('Location', self.path.partition('=')[2])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/page.html':
+            self._send(b'<!doctype html><html><body>Not found</body></html>', 'text/html')
+        elif self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/large-declared':
+            self.send_response(200)
+            self.send_header('Content-Length', str(10 * 1024 * 1024))
+            self.end_headers()
+            self.wfile.write(JPEG)
+            self.close_connection = True
+        elif self.path == '/large-chunked':
+            # No Content-Length: only the streamed byte count can catch it
+            self.send_response(200)
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(JPEG)
+            for _ in range(64):
+                self.wfile.write(b'\0' * 64 * 1024)
+        elif self.path == '/slow':
+            self.send_response(200)
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(JPEG[:16])
+            self.wfile.flush()
+            for _ in range(20):
+                time.sleep(0.1)
+                self.wfile.write(b'\0')
+                self.wfile.flush()
+
+    def _send(self, body, content_type='image/jpeg'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestImageDownload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        # The same server under another host name, for cross-host redirects
+        cls.other_base = f"http://localhost:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        download_metrics.reset()
+        self.client = PooledHttpClient(max_per_host=2)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_downloads_image(self):
+        result = download_image(f"{self.base}/image.jpg", self.client)
+        self.assertEqual(result.content, JPEG)
+        self.assertEqual(result.image_type, 'jpeg')
+        snapshot = download_metrics.snapshot()
+        self.assertEqual(snapshot['downloads'], 1)
+        self.assertEqual(snapshot['total_bytes'], len(JPEG))
+        self.assertEqual(snapshot['failures'], {})
+
+    def test_rejects_non_images(self):
+        with self.assertRaises(UnsupportedContentError):
+            download_image(f"{self.base}/page.html", self.client)
+        self.assertEqual(download_metrics.snapshot()['failures'], {'UnsupportedContentError': 1})
+
+    def test_rejects_declared_size_over_budget(self):
+        with self.assertRaises(DownloadTooLargeError):
+            download_image(f"{self.base}/large-declared", self.client, max_bytes=1024 * 1024)
+
+    def test_rejects_streamed_size_over_budget(self):
+        with self.assertRaises(DownloadTooLargeError):
+            download_image(f"{self.base}/large-chunked", self.client, max_bytes=1024 * 1024)
+
+    def test_total_deadline_bounds_slow_servers(self):
+        start = time.perf_counter()
+        with self.assertRaises(DownloadError):
+            download_image(f"{self.base}/slow", self.client, read_timeout=1.0, total_timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 1.5)
+
+    def test_http_errors_and_bad_urls(self):
+        with self.assertRaises(DownloadError):
+            download_image(f"{self.base}/missing", self.client)
+        with self.assertRaises(DownloadError):
+            download_image("file:///etc/passwd", self.client)
+        with self.assertRaises(DownloadError):
+            download_image("http://127.0.0.1:1/image.jpg", self.client, connect_timeout=0.5)
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            download_image(f"{self.base}/image.jpg", self.client)
+        stats = self.client.stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 2)
+
+    def test_redirect_hops_take_a_slot_of_their_host(self):
+        target = f"{self.other_base}/image.jpg"
+        self.assertEqual(download_image(f"{self.base}/redirect?to={target}", self.client).content, JPEG)
+
+        held = self.client._slots_for(target)
+        for _ in range(2):
+            self.assertTrue(held.acquire(1))
+        try:
+            with self.assertRaisesRegex(DownloadError, "No free connection slot for localhost"):
+                download_image(f"{self.base}/redirect?to={target}", self.client, connect_timeout=0.2)
+        finally:
+            held.release()
+            held.release()
+
+    def test_host_slots_are_shared_by_threads_and_event_loops(self):
+        url = f"{self.base}/image.jpg"
+        slots = self.client._slots_for(url)
+        for _ in range(2):
+            self.assertTrue(slots.acquire(1))
+
+        async def fetch(connect_timeout):
+            try:
+                return await download_image_async(url, self.client, connect_timeout=connect_timeout)
+            finally:
+                await self.client.aclose()
+
+        with self.assertRaisesRegex(DownloadError, "No free connection slot"):
+            asyncio.run(fetch(0.2))
+        # A slot released by this thread is handed to the coroutine waiting on another loop
+        threading.Timer(0.1, slots.release).start()
+        self.assertEqual(asyncio.run(fetch(2)).content, JPEG)
+        slots.release()
+        self.assertEqual(slots.in_use, 0)
+
+    def test_async_download(self):
+        async def fetch_twice():
+            try:
+                first = await download_image_async(f"{self.base}/image.jpg", self.client)
+                with self.assertRaises(UnsupportedContentError):
+                    await download_image_async(f"{self.base}/page.html", self.client)
+                return first
+            finally:
+                await self.client.aclose()
+
+        self.assertEqual(asyncio.run(fetch_twice()).content, JPEG)
+        self.assertEqual(self.client.stats()['connections_opened'], 1)
+
+
+class TestSniffImageType(unittest.TestCase):
+    def test_signatures(self):
+        for fmt, expected in (('JPEG', 'jpeg'), ('PNG', 'png'), ('GIF', 'gif'), ('WEBP', 'webp'),
+                              ('BMP', 'bmp'), ('TIFF', 'tiff')):
+            buffer = io.BytesIO()
+            Image.new('RGB', (8, 8)).save(buffer, fmt)
+            self.assertEqual(sniff_image_type(buffer.getvalue()[:12]), expected)
+        self.assertIsNone(sniff_image_type(b'<html><body>'))
+        self.assertIsNone(sniff_image_type(b''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import io
+import unittest
+
+import imagehash
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from image_hashing import generate_image_hash, reference_image_hash, _find_segment_boxes
+
+
+def encode(image, fmt='JPEG'):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    buffer.seek(0)
+    return buffer
+
+
+class TestHashEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.camel = Image.open('img/camel1.jpg').convert('RGB')
+        cls.camel.thumbnail((800, 800))
+
+    def assertMatchesReference(self, image_file):
+        self.assertEqual(generate_image_hash(image_file), reference_image_hash(image_file))
+
+    def test_bit_identical_to_reference(self):
+        variants = [
+            self.camel,
+            self.camel.resize((333, 517)),
+            self.camel.rotate(7),
+            self.camel.crop((40, 30, 700, 480)),
+            ImageEnhance.Brightness(self.camel).enhance(1.6),
+            self.camel.convert('L'),
+        ]
+        for image in variants:
+            with self.subTest(size=image.size, mode=image.mode):
+                self.assertMatchesReference(encode(image))
+
+    def test_uniform_image_uses_full_frame_segment(self):
+        self.assertMatchesReference(encode(Image.new('RGB', (640, 480), (200, 180, 150)), 'PNG'))
+
+    def test_file_pointer_is_reset(self):
+        image_file = encode(self.camel)
+        generate_image_hash(image_file)
+        self.assertEqual(image_file.tell(), 0)
+
+    def test_undecodable_input_returns_none(self):
+        self.assertIsNone(generate_image_hash(io.BytesIO(b'not an image')))
+
+    def test_fast_profile_is_prefix_of_full(self):
+        image_file = encode(self.camel)
+        fast = generate_image_hash(image_file, profile='fast')
+        full = generate_image_hash(image_file, profile='full')
+        self.assertEqual(fast.count('_'), 1)
+        self.assertTrue(full.startswith(fast + '_'))
+
+    def test_unknown_profile_rejected(self):
+        with self.assertRaises(ValueError):
+            generate_image_hash(encode(self.camel), profile='turbo')
+
+
+class TestSegmentation(unittest.TestCase):
+    def test_matches_imagehash_flood_fill(self):
+        rng = np.random.default_rng(0)
+        for trial in range(20):
+            # Smooth random field so both hills and valleys form sizeable regions
+            noise = rng.random((12, 12)) * 255
+            small = Image.fromarray(noise.astype(np.uint8)).resize((120, 120), Image.Resampling.BICUBIC)
+            pixels = np.asarray(small).astype(np.float32)
+
+            expected = [
+                (min(r for r, _ in s), min(c for _, c in s), max(r for r, _ in s), max(c for _, c in s))
+                for s in imagehash._find_all_segments(pixels, 128, 50)
+            ]
+            with self.subTest(trial=trial):
+                self.assertEqual(_find_segment_boxes(pixels, 128, 50), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import io
+import unittest
+
+from PIL import Image
+
+from image_ingest import check_image_size, open_image, ImageTooLargeError
+
+
+def encode(image, fmt='JPEG'):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    buffer.seek(0)
+    return buffer
+
+
+class TestImageIngest(unittest.TestCase):
+    def test_rejects_images_over_pixel_budget(self):
+        image_file = encode(Image.new('RGB', (2000, 1500)))
+        with self.assertRaises(ImageTooLargeError):
+            check_image_size(image_file, max_pixels=1_000_000)
+        with self.assertRaises(ImageTooLargeError):
+            open_image(image_file, max_pixels=1_000_000)
+        self.assertEqual(check_image_size(image_file, max_pixels=3_000_000).size, (2000, 1500))
+
+    def test_jpeg_decoded_at_reduced_scale(self):
+        image_file = encode(Image.new('RGB', (4000, 3000), (120, 90, 60)))
+        image = open_image(image_file, decode_size=1024)
+        self.assertEqual(image.mode, 'RGB')
+        # 1/2 scale would still cover 1024, 1/4 would not
+        self.assertEqual(image.size, (2000, 1500))
+
+    def test_small_or_non_jpeg_images_decoded_in_full(self):
+        self.assertEqual(open_image(encode(Image.new('RGB', (800, 600))), decode_size=1024).size, (800, 600))
+        self.assertEqual(open_image(encode(Image.new('L', (4000, 3000)), 'PNG'), decode_size=1024).size, (4000, 3000))
+        self.assertEqual(open_image(encode(Image.new('RGB', (4000, 3000)))).size, (4000, 3000))
+
+    def test_converts_to_rgb(self):
+        self.assertEqual(open_image(encode(Image.new('RGBA', (64, 64)), 'PNG')).mode, 'RGB')
+
+
+if __name__ == '__main__':
+    unittest.main()
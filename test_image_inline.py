@@ -0,0 +1,73 @@
+import base64
+import io
+import unittest
+
+from PIL import Image
+
+from image_inline import model_image_url, to_data_url, image_content, estimate_image_tokens
+
+URL = "https://example.com/camel.jpg"
+
+
+def encode(image, fmt='JPEG'):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def decode_data_url(data_url):
+    header, payload = data_url.split(',', 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(payload)))
+
+
+class TestImageInline(unittest.TestCase):
+    def test_large_photo_is_capped_jpeg(self):
+        header, image = decode_data_url(to_data_url(encode(Image.new('RGB', (6000, 4000), (180, 140, 90)))))
+        self.assertEqual(header, 'data:image/jpeg;base64')
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (1152, 768))
+
+    def test_non_jpeg_input_is_converted(self):
+        _, image = decode_data_url(to_data_url(encode(Image.new('RGBA', (3000, 1000)), 'PNG')))
+        self.assertEqual(image.mode, 'RGB')
+        self.assertEqual(image.size, (2048, 683))
+
+    def test_small_images_keep_their_size(self):
+        _, image = decode_data_url(to_data_url(encode(Image.new('RGB', (800, 600)))))
+        self.assertEqual(image.size, (800, 600))
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored landscape, displayed rotated 90 degrees clockwise
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200)).save(buffer, 'JPEG', exif=exif)
+        _, image = decode_data_url(to_data_url(buffer.getvalue()))
+        self.assertEqual(image.size, (768, 1024))
+
+    def test_derivative_options(self):
+        image_bytes = encode(Image.new('RGB', (4000, 3000), (180, 140, 90)))
+        _, image = decode_data_url(to_data_url(image_bytes, long_edge=512, short_edge=512))
+        self.assertEqual(image.size, (512, 384))
+
+    def test_image_content_detail(self):
+        self.assertEqual(image_content(URL), {"type": "image_url", "image_url": {"url": URL}})
+        self.assertEqual(image_content(URL, 'low')['image_url'], {"url": URL, "detail": 'low'})
+
+    def test_estimate_image_tokens(self):
+        self.assertEqual(estimate_image_tokens(4032, 3024, 'low'), 85)
+        # 4032x3024 is worked on at 1024x768: 2x2 tiles
+        self.assertEqual(estimate_image_tokens(4032, 3024, 'high'), 85 + 170 * 4)
+        self.assertEqual(estimate_image_tokens(1024, 768, 'high'), 85 + 170 * 4)
+        # 3000x1000 fits 2048x683 (short side already under 768): 4x2 tiles
+        self.assertEqual(estimate_image_tokens(3000, 1000, 'auto'), 85 + 170 * 8)
+
+    def test_model_image_url_falls_back_to_url(self):
+        image_bytes = encode(Image.new('RGB', (64, 64)))
+        self.assertEqual(model_image_url(URL, image_bytes, 'url'), URL)
+        self.assertEqual(model_image_url(URL, None, 'inline'), URL)
+        self.assertEqual(model_image_url(URL, b'not an image', 'inline'), URL)
+        self.assertTrue(model_image_url(URL, image_bytes, 'inline').startswith('data:image/jpeg;base64,'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import openai
+
+from llm_telemetry import Histogram, LLMTelemetry, parse_prices
+from openai_scheduler import OpenAIScheduler, OpenAIUnavailableError
+
+
+def usage(prompt=2000, cached=1024, completion=300, reasoning=100):
+    return SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion, total_tokens=prompt + completion,
+                           prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+                           completion_tokens_details=SimpleNamespace(reasoning_tokens=reasoning))
+
+
+def rate_limited():
+    response = MagicMock(status_code=429, headers={'retry-after-ms': '10'})
+    return openai.RateLimitError("error", response=response, body=None)
+
+
+class FakeClient:
+    """AsyncOpenAI stand-in: raises the queued errors in turn, then answers after delay."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.delay = delay
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **params):
+        await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(usage=usage())
+
+
+class TestLLMTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.telemetry = LLMTelemetry(log=False)
+        self.scheduler = OpenAIScheduler(backoff_base=0.01, max_retries=1, telemetry=self.telemetry)
+
+    def call(self, client, label, model="gpt-5.1"):
+        return self.scheduler.create(client, label=label, model=model, messages=[{"role": "user", "content": "hi"}])
+
+    def test_call_event_has_latency_tokens_retries_and_cost(self):
+        client = FakeClient(errors=[rate_limited()], delay=0.05)
+        asyncio.run(self.call(client, 'head'))
+
+        [event] = self.telemetry.recent()
+        self.assertEqual((event['model'], event['label'], event['outcome'], event['retries']), ('gpt-5.1', 'head', 'ok', 1))
+        self.assertEqual((event['prompt_tokens'], event['cached_tokens'], event['completion_tokens'],
+                          event['reasoning_tokens']), (2000, 1024, 300, 100))
+        self.assertGreaterEqual(event['response_ms'], 45)
+        self.assertGreater(event['total_ms'], event['response_ms'])
+        # 976 input at $1.25, 1024 cached at $0.125 and 300 output at $10 per million
+        self.assertAlmostEqual(event['cost_usd'], (976 * 1.25 + 1024 * 0.125 + 300 * 10) / 1e6, places=6)
+
+    def test_failed_and_cancelled_calls_are_recorded(self):
+        async def scenario():
+            with self.assertRaises(OpenAIUnavailableError):
+                await self.call(FakeClient(errors=[rate_limited(), rate_limited()]), 'validation', model='gpt-4o')
+            task = asyncio.create_task(self.call(FakeClient(delay=1), 'neck'))
+            await asyncio.sleep(0.02)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(scenario())
+        unavailable, cancelled = self.telemetry.recent()
+        self.assertEqual((unavailable['outcome'], unavailable['retries'], unavailable['prompt_tokens']),
+                         ('unavailable', 1, None))
+        self.assertEqual((cancelled['outcome'], cancelled['response_ms']), ('cancelled', None))
+        snapshot = self.telemetry.snapshot()
+        self.assertEqual(snapshot['gpt-4o']['validation']['outcomes'], {'unavailable': 1})
+        self.assertEqual(snapshot['gpt-5.1']['neck']['outcomes'], {'cancelled': 1})
+
+    def test_request_collects_its_own_calls(self):
+        async def request(categories):
+            calls = self.telemetry.collect()
+            # Tasks started by the request report to it too
+            await asyncio.gather(*(asyncio.create_task(self.call(FakeClient(), category)) for category in categories))
+            return self.telemetry.summary(calls)
+
+        async def two_requests():
+            return await asyncio.gather(request(['head', 'neck']), request(['body']))
+
+        first, second = asyncio.run(two_requests())
+        self.assertEqual(sorted(call['label'] for call in first['llm_calls']), ['head', 'neck'])
+        self.assertEqual([call['label'] for call in second['llm_calls']], ['body'])
+        self.assertEqual((first['totals']['calls'], first['totals']['prompt_tokens']), (2, 4000))
+
+    def test_histograms_and_prices(self):
+        histogram = Histogram((100, 250, 500))
+        for value in (50, 120, 130, 400, 900):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['buckets'], {'100': 1, '250': 3, '500': 4, '+Inf': 5})
+        self.assertEqual((snapshot['p50'], snapshot['p95']), (250, 900))
+
+        telemetry = LLMTelemetry(prices=parse_prices("gpt-4o=5/2.5/20, my-model=1/1/1"))
+        self.assertEqual(telemetry.cost('gpt-4o-2024-08-06', 1000, 0, 0), 0.005)
+        self.assertEqual(telemetry.cost('my-model', 500, 250, 500), 0.001)
+        self.assertIsNone(telemetry.cost('unpriced', 1000, 0, 1000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import openai
+
+from openai_scheduler import OpenAIScheduler, OpenAIUnavailableError, estimate_tokens, parse_model_limits
+
+
+def api_error(cls, status, headers=None):
+    response = MagicMock(status_code=status, headers=headers or {})
+    return cls("error", response=response, body=None)
+
+
+class FakeClient:
+    """Stands in for AsyncOpenAI: raises the queued errors in turn, then answers after delay."""
+
+    def __init__(self, errors=(), delay=0.0, total_tokens=100):
+        self.errors = list(errors)
+        self.delay = delay
+        self.total_tokens = total_tokens
+        self.calls = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **params):
+        self.calls.append(time.monotonic())
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return SimpleNamespace(usage=SimpleNamespace(total_tokens=self.total_tokens))
+        finally:
+            self.in_flight -= 1
+
+
+def call(scheduler, client, model="gpt-5.1"):
+    return scheduler.create(client, model=model, messages=[{"role": "user", "content": "hi"}])
+
+
+class TestOpenAIScheduler(unittest.TestCase):
+    def test_concurrency_is_capped_per_model(self):
+        scheduler = OpenAIScheduler(max_concurrency=3)
+        client = FakeClient(delay=0.05)
+
+        async def burst():
+            await asyncio.gather(*(call(scheduler, client) for _ in range(10)))
+
+        asyncio.run(burst())
+        self.assertEqual(client.peak_in_flight, 3)
+        stats = scheduler.stats()['gpt-5.1']
+        self.assertEqual((stats['calls'], stats['in_flight'], stats['queued']), (10, 0, 0))
+        self.assertGreater(stats['queue_wait_ms']['max'], 100)
+
+    def test_requests_are_paced(self):
+        # 1200 rpm: a burst of 20, then one every 50 ms
+        scheduler = OpenAIScheduler(rpm=1200)
+        client = FakeClient()
+
+        async def burst():
+            await asyncio.gather(*(call(scheduler, client) for _ in range(30)))
+
+        start = time.monotonic()
+        asyncio.run(burst())
+        self.assertGreater(client.calls[-1] - start, 0.4)
+        self.assertLess(client.calls[19] - start, 0.1)
+
+    def test_rate_limit_retries_after_the_requested_wait(self):
+        scheduler = OpenAIScheduler(backoff_base=0.01)
+        client = FakeClient(errors=[api_error(openai.RateLimitError, 429, {'retry-after-ms': '200'})])
+
+        start = time.monotonic()
+        asyncio.run(call(scheduler, client))
+        self.assertEqual(len(client.calls), 2)
+        self.assertGreaterEqual(client.calls[1] - start, 0.2)
+        stats = scheduler.stats()['gpt-5.1']
+        self.assertEqual((stats['retries'], stats['rate_limited']), (1, 1))
+
+    def test_exhausted_retries_raise(self):
+        scheduler = OpenAIScheduler(max_retries=2, backoff_base=0.01)
+        client = FakeClient(errors=[api_error(openai.InternalServerError, 500) for _ in range(3)])
+
+        with self.assertRaises(OpenAIUnavailableError) as raised:
+            asyncio.run(call(scheduler, client))
+        self.assertEqual(raised.exception.attempts, 3)
+        self.assertEqual(scheduler.stats()['gpt-5.1']['unavailable'], 1)
+
+    def test_long_retry_after_gives_up_at_once(self):
+        scheduler = OpenAIScheduler(backoff_max=5)
+        client = FakeClient(errors=[api_error(openai.RateLimitError, 429, {'retry-after': '60'})])
+
+        with self.assertRaises(OpenAIUnavailableError) as raised:
+            asyncio.run(call(scheduler, client))
+        self.assertEqual((raised.exception.retry_after, len(client.calls)), (60, 1))
+
+    def test_client_errors_are_not_retried(self):
+        scheduler = OpenAIScheduler(backoff_base=0.01)
+        client = FakeClient(errors=[api_error(openai.BadRequestError, 400)])
+
+        with self.assertRaises(openai.BadRequestError):
+            asyncio.run(call(scheduler, client))
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(scheduler.stats()['gpt-5.1']['in_flight'], 0)
+
+    def test_cancelled_waiter_passes_its_slot_on(self):
+        scheduler = OpenAIScheduler(max_concurrency=1)
+        client = FakeClient(delay=0.05)
+
+        async def scenario():
+            first = asyncio.create_task(call(scheduler, client))
+            second = asyncio.create_task(call(scheduler, client))
+            await asyncio.sleep(0.01)
+            second.cancel()
+            await first
+            await call(scheduler, client)
+
+        asyncio.run(scenario())
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(scheduler.stats()['gpt-5.1']['in_flight'], 0)
+
+    def test_limits_hold_across_event_loops(self):
+        scheduler = OpenAIScheduler(max_concurrency=2)
+        client = FakeClient(delay=0.05)
+
+        async def one_loop():
+            await asyncio.gather(*(call(scheduler, client) for _ in range(3)))
+
+        threads = [threading.Thread(target=asyncio.run, args=(one_loop(),)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(client.peak_in_flight, 2)
+        self.assertEqual(len(client.calls), 9)
+
+    def test_prompt_cache_use_is_recorded_per_label(self):
+        scheduler = OpenAIScheduler()
+        client = FakeClient()
+        cached = iter([0, 1024, 1536, 2048])
+
+        async def create(**params):
+            details = SimpleNamespace(cached_tokens=next(cached))
+            return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=2048, total_tokens=2148,
+                                                         prompt_tokens_details=details))
+
+        client.chat.completions.create = create
+
+        async def calls():
+            for _ in range(3):
+                await scheduler.create(client, label="head", model="gpt-5.1", messages=[])
+            await scheduler.create(client, model="gpt-5.1", messages=[])
+
+        asyncio.run(calls())
+        stats = scheduler.prompt_cache_stats()
+        self.assertEqual(list(stats), ['head'])
+        self.assertEqual((stats['head']['calls'], stats['head']['hit_rate']), (3, 0.667))
+        self.assertEqual((stats['head']['cached_tokens'], stats['head']['cached_share']), (2560, 0.417))
+        self.assertIsNotNone(stats['head']['latency_saving_ms'])
+
+    def test_token_estimate_and_model_limits(self):
+        image = {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 100000, "detail": "low"}}
+        params = {"messages": [{"role": "user", "content": [{"type": "text", "text": "x" * 400}, image]}],
+                  "max_completion_tokens": 50}
+        self.assertEqual(estimate_tokens(params), 4 + 100 + 85 + 50)
+        self.assertEqual(parse_model_limits("gpt-4o=64/5000/800000, gpt-5.1=8"),
+                         {'gpt-4o': {'max_concurrency': 64, 'rpm': 5000, 'tpm': 800000},
+                          'gpt-5.1': {'max_concurrency': 8}})
+
+
+if __name__ == '__main__':
+    unittest.main()
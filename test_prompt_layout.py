@@ -0,0 +1,74 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+
+from prompt_loader import PromptLoader
+
+CATEGORIES = ['head', 'neck', 'body', 'leg']
+TARGET = "http://example.com/target.jpg"
+GOLDEN = [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": "http://example.com/golden.jpg"}}]},
+          {"role": "assistant", "content": "Based on expert feedback, here is the correct rating: {}"}]
+
+
+def shared_prefix(a, b):
+    """Number of leading messages two requests have byte-identical."""
+    count = 0
+    for first, second in zip(a, b):
+        if json.dumps(first, sort_keys=True) != json.dumps(second, sort_keys=True):
+            break
+        count += 1
+    return count
+
+
+class TestPrefixLayout(unittest.TestCase):
+    def setUp(self):
+        self.loader = PromptLoader()
+        # No database here: golden examples are given per test
+        self.loader.golden_example_messages = MagicMock(return_value=[])
+
+    def test_inline_layout_is_unchanged(self):
+        messages = self.loader.build_category_messages('head', TARGET, gender='male', detail='high')
+        self.assertEqual(messages[0], {"role": "system", "content": self.loader.get_system_prompt('head', gender='male')})
+        self.assertEqual(messages[1:], self.loader.build_messages('head', TARGET, detail='high'))
+
+    def test_static_content_comes_first(self):
+        self.loader.golden_example_messages.return_value = GOLDEN
+        messages = self.loader.build_category_messages('head', TARGET, gender='female', detail='high', layout='prefix')
+        static = self.loader.load_prompt('head')['predefined_messages']
+
+        self.assertEqual(messages[0], {"role": "system", "content": self.loader.get_system_prompt('head')})
+        self.assertEqual(messages[1:1 + len(static)], static)
+        gender = messages[1 + len(static)]
+        self.assertEqual(gender['role'], 'system')
+        self.assertIn('**FEMALE**', gender['content'])
+        self.assertEqual(messages[2 + len(static):-1], GOLDEN)
+        self.assertEqual(messages[-1]['content'][-1]['image_url']['url'], TARGET)
+
+    def test_genders_and_golden_examples_share_the_static_prefix(self):
+        static = len(self.loader.load_prompt('neck')['predefined_messages'])
+        unknown = self.loader.build_category_messages('neck', TARGET, layout='prefix')
+        male = self.loader.build_category_messages('neck', TARGET, gender='male', layout='prefix')
+        self.loader.golden_example_messages.return_value = GOLDEN
+        female = self.loader.build_category_messages('neck', TARGET, gender='female', layout='prefix')
+
+        for a, b in ((unknown, male), (male, female), (unknown, female)):
+            self.assertEqual(shared_prefix(a, b), 1 + static)
+        # The inline layout differs from the first message on
+        self.assertEqual(shared_prefix(self.loader.build_category_messages('neck', TARGET, gender='male'),
+                                       self.loader.build_category_messages('neck', TARGET, gender='female')), 0)
+
+    def test_combined_prefix_layout(self):
+        self.loader.golden_example_messages.side_effect = lambda category: GOLDEN if category == 'body' else []
+        male = self.loader.build_combined_request_messages(CATEGORIES, TARGET, gender='male', layout='prefix')
+        unknown = self.loader.build_combined_request_messages(CATEGORIES, TARGET, layout='prefix')
+
+        static = sum(1 + len(self.loader.load_prompt(category)['predefined_messages']) for category in CATEGORIES)
+        self.assertEqual(shared_prefix(male, unknown), 1 + static)
+        self.assertEqual(male[0]['content'], self.loader.get_combined_system_prompt(CATEGORIES))
+        self.assertIn('**MALE**', male[1 + static]['content'])
+        self.assertEqual(male[2 + static]['content'][0]['text'], "The following corrections are for the body region only.")
+        self.assertEqual(male[3 + static:-1], GOLDEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import io
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from quality_gate import (check_image_quality, rejection_payload, QualityThresholds, QualityGateMetrics)
+
+PHOTO = Image.open('img/camel1.jpg').convert('RGB')
+
+
+def encode(image, fmt='JPEG'):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=90) if fmt == 'JPEG' else image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def failed_checks(image, **thresholds):
+    return [check for check, _ in check_image_quality(encode(image), QualityThresholds(**thresholds)).issues]
+
+
+class TestQualityGate(unittest.TestCase):
+    def test_photo_passes(self):
+        report = check_image_quality(encode(PHOTO.resize((1500, 1000))))
+        self.assertTrue(report.passed, report.issues)
+        self.assertEqual((report.metrics['width'], report.metrics['height']), (1500, 1000))
+
+    def test_low_resolution(self):
+        self.assertIn('resolution', failed_checks(PHOTO.resize((150, 100))))
+
+    def test_extreme_aspect_ratio(self):
+        self.assertIn('aspect', failed_checks(PHOTO.resize((3000, 500))))
+
+    def test_uniform_image(self):
+        self.assertEqual(failed_checks(Image.new('RGB', (800, 600), (128, 120, 110))), ['uniform'])
+
+    def test_exposure(self):
+        dark = Image.fromarray((np.asarray(PHOTO.resize((900, 600))) * 0.03).astype(np.uint8))
+        self.assertIn('exposure', failed_checks(dark, min_contrast=0))
+        bright = Image.new('RGB', (900, 600), 'white')
+        ImageDraw.Draw(bright).rectangle([100, 100, 250, 200], fill='black')
+        self.assertIn('exposure', failed_checks(bright))
+
+    def test_blur(self):
+        self.assertIn('blur', failed_checks(PHOTO.resize((1500, 1000)).filter(ImageFilter.GaussianBlur(12))))
+
+    def test_screenshot(self):
+        screenshot = Image.new('RGB', (1170, 2532), (30, 30, 36))
+        draw = ImageDraw.Draw(screenshot)
+        for y in range(100, 2400, 120):
+            draw.rectangle([40, y, 1130, y + 90], fill=(60, 60, 70))
+            draw.text((60, y + 30), "Settings item", fill='white')
+        self.assertIn('screenshot', failed_checks(screenshot))
+
+    def test_thresholds_are_configurable(self):
+        self.assertEqual(failed_checks(PHOTO.resize((300, 200)), min_short_edge=300), ['resolution'])
+
+    def test_png_input(self):
+        self.assertTrue(check_image_quality(encode(PHOTO.resize((900, 600)), 'PNG')).passed)
+
+    def test_rejection_payload_matches_validation_failure(self):
+        report = check_image_quality(encode(Image.new('RGB', (800, 600))))
+        payload = rejection_payload(report)
+        self.assertEqual(payload['error'], "Image not suitable for comprehensive beauty analysis")
+        self.assertEqual(set(payload), {'error', 'validation', 'feedback', 'missing_parts', 'quality_issues',
+                                        'suggestions'})
+        self.assertFalse(payload['validation']['overall_suitability'])
+        self.assertIsNone(payload['validation']['contains_camel'])
+        self.assertEqual(payload['validation']['rejected_by'], 'quality_gate')
+        self.assertEqual(payload['quality_issues'], ["Image is blank or almost a single colour"])
+
+    def test_metrics(self):
+        metrics = QualityGateMetrics()
+        metrics.record(check_image_quality(encode(PHOTO.resize((900, 600)))))
+        metrics.record(check_image_quality(encode(Image.new('RGB', (800, 600)))))
+        self.assertEqual(metrics.snapshot(), {'checked': 2, 'rejected': 1, 'reject_rate': 0.5,
+                                              'by_check': {'uniform': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
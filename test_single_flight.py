@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+from single_flight import SingleFlight
+
+KEY = b'k' * 32
+
+
+def lease_table():
+    """An in-memory analysis_leases, shared by the workers of a test."""
+    engine = sa.create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+    table = sa.Table('analysis_leases', sa.MetaData(),
+                     sa.Column('hash_key', sa.LargeBinary(32), primary_key=True),
+                     sa.Column('owner', sa.String(100), nullable=False),
+                     sa.Column('expires_at', sa.DateTime, nullable=False))
+    table.metadata.create_all(engine)
+    return engine, table
+
+
+class Worker(SingleFlight):
+    """A worker process, with its own claims table, sharing the test's lease table."""
+
+    def __init__(self, owner_id, leases, **kwargs):
+        super().__init__(poll_seconds=0.02, **kwargs)
+        self._owner_id = owner_id
+        self._lease_table = leases
+
+    @property
+    def owner_id(self):
+        return self._owner_id
+
+    def _leases(self):
+        return self._lease_table
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_followers_wait_for_the_leader(self):
+        flights = SingleFlight(cross_process=False)
+
+        async def request(name, log):
+            claim = await flights.claim(KEY)
+            if claim.leading:
+                await asyncio.sleep(0.1)
+                log.append(f'{name} stored')
+                await claim.release()
+                return 'led'
+            finished = await claim.wait(1)
+            log.append(f'{name} looked')
+            return 'followed' if finished else 'timed out'
+
+        async def burst():
+            log = []
+            results = await asyncio.gather(*(request(i, log) for i in range(5)))
+            return results, log
+
+        results, log = asyncio.run(burst())
+        self.assertEqual(sorted(results), ['followed'] * 4 + ['led'])
+        self.assertEqual(log[0], '0 stored')
+        stats = flights.stats()
+        self.assertEqual((stats['leaders'], stats['followers'], stats['in_flight']), (1, 4, 0))
+
+    def test_followers_on_other_event_loops(self):
+        flights = SingleFlight(cross_process=False)
+        leader = asyncio.run(flights.claim(KEY))
+        results = []
+
+        def follow():
+            async def wait():
+                claim = await flights.claim(KEY)
+                return claim.leading, await claim.wait(2)
+            results.append(asyncio.run(wait()))
+
+        threads = [threading.Thread(target=follow) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        asyncio.run(leader.release())
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(False, True)] * 3)
+
+    def test_wait_times_out(self):
+        flights = SingleFlight(cross_process=False)
+
+        async def scenario():
+            leader = await flights.claim(KEY)
+            follower = await flights.claim(KEY)
+            finished = await follower.wait(0.05)
+            await leader.release()
+            return finished, (await flights.claim(KEY)).leading
+
+        self.assertEqual(asyncio.run(scenario()), (False, True))
+
+    def test_disabled_always_leads(self):
+        flights = SingleFlight(enabled=False)
+
+        async def scenario():
+            return [(await flights.claim(KEY)).leading for _ in range(3)]
+
+        self.assertEqual(asyncio.run(scenario()), [True] * 3)
+
+    def test_lease_coalesces_across_workers(self):
+        leases = lease_table()
+        worker_a, worker_b = Worker('a', leases), Worker('b', leases)
+
+        async def scenario():
+            leader = await worker_a.claim(KEY)
+            remote = await worker_b.claim(KEY)
+            local = await worker_b.claim(KEY)
+
+            async def remote_request():
+                # Worker b's first request polls the lease, then lets b's other requests look
+                finished = await remote.wait(2)
+                await remote.release()
+                return finished
+
+            waits = asyncio.gather(remote_request(), local.wait(2))
+            await asyncio.sleep(0.1)
+            await leader.release()
+            return [claim.leading for claim in (leader, remote, local)], await waits
+
+        leading, waits = asyncio.run(scenario())
+        self.assertEqual(leading, [True, False, False])
+        self.assertEqual(waits, [True, True])
+        self.assertEqual(worker_b.stats()['remote_followers'], 1)
+        engine, table = leases
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(sa.select(sa.func.count()).select_from(table)).scalar(), 0)
+
+    def test_expired_lease_is_taken_over(self):
+        engine, table = leases = lease_table()
+        with engine.begin() as connection:
+            connection.execute(table.insert().values(hash_key=KEY, owner='dead',
+                                                     expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        worker = Worker('a', leases)
+        claim = asyncio.run(worker.claim(KEY))
+        self.assertTrue(claim.leading and claim.leased)
+        self.assertEqual(worker.stats()['leases_expired'], 1)
+
+    def test_lease_is_renewed_while_the_leader_runs(self):
+        leases = lease_table()
+        worker_a = Worker('a', leases, lease_seconds=0.15)
+        worker_b = Worker('b', leases, lease_seconds=0.15)
+
+        async def scenario():
+            leader = await worker_a.claim(KEY)
+            # Twice the lease: without renewal worker b would take it over
+            await asyncio.sleep(0.3)
+            remote = await worker_b.claim(KEY)
+            await leader.release()
+            await remote.release()
+            return leader.leading, remote.leading
+
+        self.assertEqual(asyncio.run(scenario()), (True, False))
+        self.assertEqual(worker_b.stats()['leases_expired'], 0)
+        engine, table = leases
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(sa.select(sa.func.count()).select_from(table)).scalar(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
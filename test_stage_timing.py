@@ -0,0 +1,65 @@
+import asyncio
+import time
+import unittest
+
+from stage_timing import StageTimer, PipelineMetrics
+
+
+class TestStageTimer(unittest.TestCase):
+    def test_overlapping_stages_report_overlap(self):
+        timer = StageTimer()
+
+        async def pipeline():
+            background = asyncio.create_task(timer.timed('validation', asyncio.sleep(0.1)))
+            with timer.stage('download'):
+                await asyncio.sleep(0.1)
+            await background
+
+        asyncio.run(pipeline())
+        summary = timer.summary()
+        self.assertEqual(set(summary['stages']), {'download', 'validation'})
+        self.assertGreater(summary['overlap_ms'], 50)
+        self.assertLess(summary['wall_ms'], 190)
+
+    def test_repeated_stage_accumulates(self):
+        timer = StageTimer()
+        for _ in range(2):
+            with timer.stage('lookup'):
+                time.sleep(0.02)
+        self.assertGreaterEqual(timer.summary()['stages']['lookup'], 40)
+
+    def test_cancelled_stage_is_not_overlap(self):
+        timer = StageTimer()
+
+        async def pipeline():
+            background = asyncio.create_task(timer.timed('validation', asyncio.sleep(10)))
+            with timer.stage('download'):
+                await asyncio.sleep(0.05)
+            background.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await background
+
+        asyncio.run(pipeline())
+        summary = timer.summary()
+        self.assertIn('validation_cancelled', summary['stages'])
+        self.assertEqual(summary['overlap_ms'], 0)
+
+
+class TestPipelineMetrics(unittest.TestCase):
+    def test_snapshot(self):
+        metrics = PipelineMetrics()
+        for _ in range(3):
+            timer = StageTimer()
+            with timer.stage('download'):
+                pass
+            metrics.record(timer, 'rated')
+        metrics.count('validation_cancelled')
+        metrics.count('category_calls_wasted', 3)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['outcomes'], {'rated': 3, 'validation_cancelled': 1, 'category_calls_wasted': 3})
+        self.assertEqual(snapshot['stages']['download']['count'], 3)
+        self.assertIn('wall', snapshot['stages'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,7 @@ async def test_validation():
     """Test the validation function directly"""
     
     # Initialize async OpenAI client
-    async_client = AsyncOpenAI(api_key=Config.client.api_key)
+    async_client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
     
     # Cat image URL from the test
     image_url = 'https://images.unsplash.com/photo-1514888286974-6c03e2ca1dba'